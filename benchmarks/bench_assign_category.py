@@ -0,0 +1,62 @@
+"""
+Benchmark of the recipe category assignment: row-wise `assign_category` applied with
+`DataFrame.apply` against the columnar `assign_categories`.
+
+Usage:
+    python -m benchmarks.bench_assign_category [number of rows]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.preprocessing.filter import assign_category, assign_categories
+
+CATEGORIES = ['Dessert', 'Chicken', 'Beverages', 'Breakfast', 'Lunch/Snacks', 'Vegetable', 'Bread',
+              'Pie', 'Sauces', 'Tarts', 'Candy', 'Grains']
+KEYWORDS = ['#Easy', '#Oven', '#< 30 Mins', '#< 4 Hours', '#Mexican', '#Asian', '#Meat', '#Sweet',
+            '#Healthy', '#Kid Friendly', '#Inexpensive', '#Beginner Cook', '#Cocktail']
+TITLE_WORDS = ['lemon', 'tart', 'bread', 'chicken', 'apple', 'pie', 'smoothie', 'salad', 'coffee',
+               'grilled', 'cheese', 'easy', 'mom\'s', 'best', 'banana', 'dip']
+
+
+def make_recipes(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a DataFrame of `n_rows` fake recipes with the columns used to assign categories.
+
+    Args:
+        n_rows (int): number of recipes
+        seed (int): seed of the random generator
+
+    Returns:
+        pd.DataFrame: the RecipeCategory, Keywords and title columns
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'RecipeCategory': rng.choice(CATEGORIES, n_rows),
+        'Keywords': [list(rng.choice(KEYWORDS, rng.integers(1, 6))) for _ in range(n_rows)],
+        'title': [' '.join(rng.choice(TITLE_WORDS, 3)) for _ in range(n_rows)],
+    })
+
+
+def main(n_rows: int = 100_000) -> None:
+    df = make_recipes(n_rows)
+
+    start_time = time.perf_counter()
+    row_wise = df.apply(assign_category, axis=1)
+    row_wise_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    columnar = assign_categories(df)
+    columnar_time = time.perf_counter() - start_time
+
+    assert row_wise.equals(columnar), "assign_categories labels differ from assign_category"
+    print(f"{n_rows} recipes")
+    print(f"assign_category (apply) : {row_wise_time:.3f} s")
+    print(f"assign_categories       : {columnar_time:.3f} s ({row_wise_time / columnar_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,138 @@
+"""
+Benchmark of the cold start of the streamlit app: the time `app.py` and each page spend importing
+their modules, measured with `python -X importtime` in a new interpreter per run. Only the
+module-level imports of each script are run, not the script itself, so nothing is drawn or
+downloaded. The import times are compared with a baseline saved by a previous run.
+
+Usage:
+    python -m benchmarks.bench_imports [--runs 5] [--top 5] [--save-baseline]
+"""
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / 'imports_baseline.json'
+SCRIPTS = ['app.py', 'pages/recipe_finder_page.py', 'pages/recipe_page.py', 'pages/likes.py']
+# A script whose imports are slower than their baseline by more than this ratio is a regression
+TOLERANCE = 1.2
+
+
+def script_imports(path: Path) -> str:
+    """
+    Returns:
+        str: the import statements at the top level of the script, as python code
+    """
+    tree = ast.parse(path.read_text(encoding='utf-8'))
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return '\n'.join(ast.unparse(node) for node in imports)
+
+
+def import_times(code: str) -> Dict[str, float]:
+    """
+    Run `code` in a new interpreter with `-X importtime`.
+
+    Returns:
+        Dict[str, float]: the cumulative import time of each module imported directly by `code`
+            (not by another module), in milliseconds
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=PROJECT_ROOT,
+        env={**os.environ, 'PYTHONPATH': str(PROJECT_ROOT)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, nested imports are indented
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def measure(script: str, runs: int) -> Tuple[float, Dict[str, float]]:
+    """
+    Returns:
+        float: the median over `runs` runs of the total import time of the script, in milliseconds
+        Dict[str, float]: the median import time of each module imported by the script
+    """
+    code = script_imports(PROJECT_ROOT / script)
+    samples = [import_times(code) for _ in range(runs)]
+    modules = {name: statistics.median(sample.get(name, 0) for sample in samples)
+               for name in samples[0]}
+    return statistics.median(sum(sample.values()) for sample in samples), modules
+
+
+def run(runs: int, top: int) -> dict:
+    """
+    Returns:
+        dict: for each script, its total import time and the time of its slowest imports
+    """
+    results = {}
+    for script in SCRIPTS:
+        total, modules = measure(script, runs)
+        slowest = dict(sorted(modules.items(), key=lambda item: -item[1])[:top])
+        results[script] = {'total_ms': round(total, 1),
+                           'slowest_ms': {name: round(ms, 1) for name, ms in slowest.items()}}
+        print(f"{script:<30} {total:9.1f} ms  " + ", ".join(
+            f"{name} {ms:.0f}" for name, ms in slowest.items()))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> List[tuple]:
+    """
+    Returns:
+        List[tuple]: the (script, ratio) of the scripts slower to import than their baseline by
+            more than `tolerance`
+    """
+    regressions = []
+    for script, result in results.items():
+        reference = baseline.get(script)
+        if reference is None:
+            continue
+        ratio = result['total_ms'] / reference['total_ms']
+        print(f"{script:<30} x{ratio:.2f} ({reference['total_ms']:.1f} ms before)")
+        if ratio > tolerance:
+            regressions.append((script, ratio))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help="interpreters started per script")
+    parser.add_argument('--top', type=int, default=5, help="number of slowest imports shown")
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH, help="baseline file")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="save the results as the new baseline")
+    args = parser.parse_args()
+
+    results = run(args.runs, args.top)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.is_file():
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create it")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as file:
+        regressions = compare(results, json.load(file))
+    for script, ratio in regressions:
+        print(f"Regression: {script} imports {ratio:.2f} times slower")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+Benchmark of the data processing pipeline (`merge`, `data_preprocessing` and `data_filter`) on
+synthetic raw data sets of 10k, 100k and 1M recipes, generated from a seed so that every run
+processes the same data. Each function is run in a fresh child process, whose peak resident memory
+includes the Arrow buffers that `tracemalloc` does not see. The throughput and peak memory of each
+function are compared with a baseline saved by a previous run. Runs offline: nothing is downloaded.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--rows 10000 100000] [--save-baseline]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from src.preprocessing.filter import data_filter
+from src.preprocessing.format import data_preprocessing
+from src.preprocessing.load import merge
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+# Generated data sets, kept to avoid generating the 1M rows again
+DATA_DIR = PROJECT_ROOT / 'data' / 'benchmark'
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+SIZES = [10_000, 100_000, 1_000_000]
+# A function slower than its baseline by more than this ratio is reported as a regression
+TOLERANCE = 1.2
+
+WORDS = ['chicken', 'beef', 'apple', 'banana', 'cake', 'cookie', 'salad', 'soup', 'coffee',
+         'smoothie', 'breakfast', 'tofu', 'rice', 'lemon', 'tart', 'bread', 'pie', 'sauce', 'dip',
+         'green bean', 'pasta', 'stew', 'lobster', 'oats', 'jam', 'grilled', 'easy', 'best']
+INGREDIENTS = ['onions', 'tomatoes', 'salt', 'pepper', 'eggs', 'butter', 'flour', 'sugar',
+               'chicken breasts', 'ground beef', 'carrots', 'potatoes', 'garlic cloves', 'olive oil',
+               'milk', 'bananas', 'berries', 'hamburger buns', 'cheese', 'apples', 'shrimp',
+               'cod fillets', 'rice', 'bacon', 'lettuce', 'lemons', 'cream', 'honey']
+CATEGORIES = ['Dessert', 'Chicken', 'Beverages', 'Breakfast', 'Lunch/Snacks', 'Vegetable', 'Bread',
+              'Pie', 'Sauces', 'Tarts', 'Candy', 'One Dish Meal', 'Stew', None]
+KEYWORDS = ['Easy', 'Oven', '< 30 Mins', '< 4 Hours', 'Mexican', 'Asian', 'Indian', 'French',
+            'Greek', 'Meat', 'Sweet', 'Healthy', 'Kid Friendly', 'Inexpensive', 'Cuban', 'nan',
+            'Breakfast', 'Cocktail', 'Dessert', 'Vegetable']
+DURATIONS = ['PT10M', 'PT1H30M', 'PT45M', 'PT2H', 'PT0M', 'PT24H', 'PT5M', 'PT1H', 'PT0S',
+             'PT3H15M', 'PT20M']
+
+
+def sample_lists(rng: np.random.Generator, values: list, n_rows: int, max_len: int) -> list:
+    """
+    Returns:
+        list: `n_rows` lists of 1 to `max_len` distinct values
+    """
+    order = np.argsort(rng.random((n_rows, len(values))), axis=1)[:, :max_len]
+    lengths = rng.integers(1, max_len + 1, n_rows)
+    return [[values[i] for i in row[:length]] for row, length in zip(order.tolist(), lengths)]
+
+
+def make_raw_data(n_rows: int, folder: Path, seed: int = 0) -> Tuple[str, str]:
+    """
+    Generate raw nutrition and measurements data sets shaped like the kaggle ones: list columns
+    stored as arrays in the nutrition data set and as JSON (and sometimes Python) strings in the
+    measurements one, duplicates, outliers, missing values and measurements without a nutrition
+    recipe. The files are only generated once per size and seed.
+
+    Args:
+        n_rows (int): number of nutrition recipes. The measurements data set has 1.5 times more rows.
+        folder (Path): folder of the generated files
+        seed (int): seed of the random generator
+
+    Returns:
+        Tuple[str, str]: the paths of the nutrition and measurements data sets
+    """
+    nutrition_path = folder / 'recipes.parquet'
+    measurements_path = folder / 'recipes_data.parquet'
+    if nutrition_path.is_file() and measurements_path.is_file():
+        return str(nutrition_path), str(measurements_path)
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    words = rng.choice(WORDS, (n_rows, 2))
+    names = [f'{first} {second} {i % (n_rows // 3 + 1)}' for i, (first, second) in
+             enumerate(words.tolist())]
+    instructions = [[f'Mix the {name}. Cook it.', 'Serve.'] for name in names]
+
+    def durations() -> np.ndarray:
+        return rng.choice(DURATIONS, n_rows).astype(object)
+
+    cook_time = durations()
+    cook_time[rng.random(n_rows) < 0.1] = None
+    nutrition = pd.DataFrame({
+        'RecipeId': np.arange(n_rows),
+        'Name': names,
+        'AuthorName': [f'author{i}' for i in rng.integers(0, n_rows // 2 + 1, n_rows)],
+        'CookTime': cook_time,
+        'PrepTime': durations(),
+        'TotalTime': durations(),
+        'Description': 'A recipe.',
+        'Images': [np.array([f'https://img/{i}.jpg']) for i in range(n_rows)],
+        'RecipeCategory': rng.choice(np.array(CATEGORIES, dtype=object), n_rows),
+        'Keywords': [np.array(keywords, dtype=object)
+                     for keywords in sample_lists(rng, KEYWORDS, n_rows, 4)],
+        'AggregatedRating': rng.integers(1, 6, n_rows).astype(float),
+        'ReviewCount': rng.integers(1, 100, n_rows).astype(float),
+        'Calories': rng.uniform(0, 2000, n_rows),
+        **{col: rng.uniform(0, 100, n_rows) for col in [
+            'FatContent', 'SaturatedFatContent', 'CholesterolContent', 'SodiumContent',
+            'CarbohydrateContent', 'FiberContent', 'SugarContent', 'ProteinContent']},
+        'RecipeServings': rng.integers(1, 100, n_rows).astype(float),
+        'RecipeInstructions': [np.array(steps, dtype=object) for steps in instructions],
+    })
+    nutrition.to_parquet(nutrition_path, row_group_size=50_000)
+
+    # most nutrition recipes have a measurements row, plus unrelated recipes
+    n_extra = n_rows // 2
+    matched = rng.random(n_rows) < 0.8
+    ingredients = sample_lists(rng, INGREDIENTS, n_rows + n_extra, 6)
+    python_style = rng.random(n_rows + n_extra) < 0.05
+    measurements = pd.DataFrame({
+        'title': [name if keep else f'other {i}' for i, (name, keep) in
+                  enumerate(zip(names, matched))] + [f'other recipe {i}' for i in range(n_extra)],
+        'ingredients': [str(items) if python else json.dumps(items)
+                        for items, python in zip(ingredients, python_style)],
+        'directions': [json.dumps(steps) for steps in instructions]
+                      + [json.dumps(['Mix.', 'Serve.'])] * n_extra,
+        'link': [f'www.recipes.com/{i}' for i in range(n_rows + n_extra)],
+        'source': 'Gathered',
+        'NER': [json.dumps(items) for items in ingredients],
+    })
+    measurements.to_parquet(measurements_path, row_group_size=50_000)
+    return str(nutrition_path), str(measurements_path)
+
+
+def run_child(func: Callable, *args) -> Tuple[object, float, float]:
+    """
+    Run `func` in the current process, meant to be a fresh child process.
+
+    Returns:
+        object: the output of `func`
+        float: the duration of the run, in seconds
+        float: the peak resident memory of the process, in MB, None where it is not available
+    """
+    start_time = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start_time
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        peak /= 2**20 if sys.platform == 'darwin' else 2**10
+    return result, seconds, peak
+
+
+def measure(func: Callable, *args) -> Tuple[object, float, float]:
+    """
+    Run `func` once in a new child process, so that its peak resident memory is the one of the
+    function (plus the interpreter and its input), not of the benchmark so far.
+
+    Returns:
+        object: the output of `func`
+        float: the duration of the run, in seconds
+        float: the peak resident memory of the child process, in MB, None where it is not available
+    """
+    with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(run_child, func, *args).result()
+
+
+def run(n_rows: int, seed: int = 0) -> dict:
+    """
+    Returns:
+        dict: for each function of the pipeline, its duration, throughput and peak memory on the
+            synthetic data set of `n_rows` recipes
+    """
+    paths = make_raw_data(n_rows, DATA_DIR / f'{n_rows}-{seed}', seed)
+    results = {}
+
+    def record(name: str, rows_in: int, output: pd.DataFrame, seconds: float, peak_mb: float):
+        results[name] = {
+            'rows_in': rows_in,
+            'rows_out': len(output),
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(rows_in / seconds),
+            'peak_mb': round(peak_mb, 1) if peak_mb is not None else None,
+        }
+        memory = f"{peak_mb:9.1f} MB" if peak_mb is not None else ''
+        print(f"{n_rows:>9} {name:<20} {seconds:8.3f} s {rows_in / seconds:12,.0f} rows/s {memory}")
+
+    merged, *measures = measure(merge, *paths)
+    record('merge', n_rows, merged, *measures)
+    preprocessed, *measures = measure(data_preprocessing, merged)
+    record('data_preprocessing', len(merged), preprocessed, *measures)
+    filtered, *measures = measure(data_filter, preprocessed)
+    record('data_filter', len(preprocessed), filtered, *measures)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    """
+    Returns:
+        list: the (size, function, ratio) of the functions slower than their baseline by more than
+            `tolerance`, the ratio being the baseline throughput over the current one
+    """
+    regressions = []
+    for size, functions in results.items():
+        for name, result in functions.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference is None:
+                continue
+            ratio = reference['rows_per_second'] / result['rows_per_second']
+            memory = (result['peak_mb'] / reference['peak_mb']
+                      if result['peak_mb'] and reference['peak_mb'] else 1)
+            print(f"{size:>9} {name:<20} time x{ratio:.2f}  memory x{memory:.2f}")
+            if ratio > tolerance:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=SIZES, help="data set sizes")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the data generator")
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH, help="baseline file")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="save the results as the new baseline")
+    args = parser.parse_args()
+
+    results = {str(n_rows): run(n_rows, args.seed) for n_rows in args.rows}
+    if args.save_baseline:
+        baseline = {}
+        if args.baseline.is_file():
+            with open(args.baseline, 'r', encoding='utf-8') as file:
+                baseline = json.load(file)
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({**baseline, **results}, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.is_file():
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create it")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as file:
+        regressions = compare(results, json.load(file))
+    for size, name, ratio in regressions:
+        print(f"Regression: {name} is {ratio:.2f} times slower on {size} rows")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,13 @@
-import os
-from pathlib import Path
 
-import pandas as pd
+import numpy as np
 import streamlit as st
-import yaml
-from loguru import logger
 from streamlit_extras.add_vertical_space import add_vertical_space
 
-from src.application.recipe_finder_functions import split_frame
-from src.application.st_session_functions import handle_recipe_click
-from src.preprocessing.filter import data_filter
-from src.preprocessing.format import data_preprocessing
-from src.preprocessing.load import merge
+from src.application.pagination import Paginator
+from src.application.recipe_finder_functions import load_recipes
+from src.application.st_session_functions import handle_recipe_click, page_input
+from src.preprocessing.dataset_creation import DEFAULT_OUTPUT, build_dataset
+from src.preprocessing.schema import output_exists
 from src.user_functionalities.auth_ui import show_user_panel
 
 URI = 'http://127.0.0.1:5000'
@@ -69,41 +65,15 @@ if col2.button("🏠 Home Page"):
 ####################################### IMPORT DATASET #####################################
 
 # import of the cleaned and formatted dataset of 10k recipes :
-PROJECT_ROOT = Path(__file__).resolve().parent.parent # absolute path to the project root
-config_path = PROJECT_ROOT / "utils" / "config.yaml"
-with open(config_path, "r") as file:
-    config = yaml.safe_load(file)
-DATA_DIR = config['DATA_DIR']
-NUTRITION_FILE_NAME = config['s3']['nutrition_file_name']
-MEASUREMENTS_FILE_NAME = config['s3']['measurements_file_name']
-
-data_folder = os.path.join(PROJECT_ROOT, "data/recipe")
-
-# if no data folder or if it's empty : create the dataset and save it in data folder
-if not os.path.isfile(os.path.join(data_folder, 'final_df.parquet')):
+# create the dataset and save it in the data folder if it is missing
+DATASET_PATH = DEFAULT_OUTPUT
+if not output_exists(DATASET_PATH):
     with st.spinner("⏳ Initializing the dataset... This may take a few minutes."):
-        os.makedirs(data_folder, exist_ok=True)
-        data_folder = Path(data_folder)
-        recipe_nutrition_path = os.path.join(DATA_DIR, NUTRITION_FILE_NAME).replace("\\", "/")
-        recipe_measurements_path = os.path.join(DATA_DIR, MEASUREMENTS_FILE_NAME).replace("\\", "/")
-
-        logger.info("Starting data processing pipeline...")
-
-        merged = merge(recipe_nutrition_path, recipe_measurements_path)
-        df_prepro = data_preprocessing(merged)
-        df_filtered = data_filter(df_prepro)
-        output_path = data_folder / 'final_df.parquet'
-        if not os.path.exists(output_path):
-            df_filtered.to_parquet(output_path, index=False)
-
-        logger.success(f"Processed dataset saved to {output_path}")
-        logger.success("Pipeline execution completed successfully.")
-        logger.add("data_cleaning.log", rotation="10 MB", level="INFO", format="{time} - {level} - {message}")
+        build_dataset(DATASET_PATH)
     st.success("✅ Dataset loaded and ready to go!")
 
-# load the dataset
-DATASET_PATH = os.path.join(data_folder, 'final_df.parquet')
-df: pd.DataFrame = pd.read_parquet(DATASET_PATH)
+# load the dataset, shared with the recipe finder
+df, _ = load_recipes(DATASET_PATH)
 
 ####################################### DISPLAY LIKED RCIPES #####################################
 
@@ -113,8 +83,9 @@ liked_recipes = st.session_state.get("liked_recipes", [])
 if not liked_recipes:
     st.info("You have no liked recipes or data was not loaded.")
 else:
-    df = df[df['recipe_id'].isin(liked_recipes)]
-    st.session_state.total_recipes = len(df)
+    # only the positions of the liked recipes are kept, their rows are read one page at a time
+    paginator = Paginator(df, np.flatnonzero(df['recipe_id'].isin(liked_recipes)))
+    st.session_state.total_recipes = len(paginator)
 
     # Display the results
     if st.session_state.total_recipes == 1:
@@ -129,16 +100,14 @@ else:
     recipe_placeholder = st.container()
     bottom_menu = st.columns((4, 1, 1))
     with bottom_menu[2]:
-        batch_size = st.selectbox('Recipes per page', options=[2,5,10])
-        total_pages = int(len(df)/batch_size) if len(df) > batch_size else 1
+        paginator.page_size = st.selectbox('Recipes per page', options=[2,5,10])
     with bottom_menu[1]:
-        current_page = st.number_input('Page', min_value=1, max_value=total_pages, step=1, key='page_input')
+        current_page = page_input(paginator, ('likes', tuple(liked_recipes), paginator.page_size))
     with bottom_menu[0]:
-        st.markdown(f"Page **{current_page}** of **{total_pages}**")
+        st.markdown(f"Page **{current_page}** of **{paginator.n_pages}**")
 
-    # Paginate the filtered DataFrame
-    pages = split_frame(df, batch_size)
-    page = pages[current_page - 1] if len(pages) > 0 else pd.DataFrame()
+    # Paginate the liked recipes
+    page = paginator.page(current_page)
 
 
     # Display filtered recipes with pagination + html formatting
@@ -3,24 +3,21 @@ Contains the streamlit code to display the search engine and criterias,
 as well as the search results.
 """
 
-import os
-from collections import Counter
-from pathlib import Path
 from typing import Any, List
 
-import pandas as pd
 import streamlit as st
-import yaml
-from loguru import logger
 from streamlit_extras.add_vertical_space import add_vertical_space
 
 from src.application.query_helpers import clean_query, query_error
-from src.application.recipe_finder_functions import search_recipes, split_frame
+from src.application.recipe_finder_functions import (FILTER_COLUMNS,
+                                                     load_recipes,
+                                                     result_pages,
+                                                     title_rows)
 from src.application.st_session_functions import (handle_recipe_click,
-                                                  initialize_session_state)
-from src.preprocessing.filter import data_filter
-from src.preprocessing.format import data_preprocessing
-from src.preprocessing.load import merge
+                                                  initialize_session_state,
+                                                  page_input)
+from src.preprocessing.dataset_creation import DEFAULT_OUTPUT, build_dataset
+from src.preprocessing.schema import output_exists
 from src.user_functionalities.auth_ui import show_user_panel
 
 # configuration parameters
@@ -35,61 +32,25 @@ st.set_page_config(
 show_user_panel()  # always display login info in sidebar
 
 # import of the cleaned and formated dataset of 10k recipes :
-PROJECT_ROOT = Path(__file__).resolve().parent.parent # absolute path to the project root
-config_path = PROJECT_ROOT / "utils" / "config.yaml"
-
-with open(config_path, "r") as file:
-    config = yaml.safe_load(file)
-DATA_DIR = config['DATA_DIR']
-NUTRITION_FILE_NAME = config['s3']['nutrition_file_name']
-MEASUREMENTS_FILE_NAME = config['s3']['measurements_file_name']
-
-data_folder = os.path.join(PROJECT_ROOT, "data/recipe")
-
-# if no data folder or if it is empty : create the dataset and save it in data folder
-if not os.path.isfile(os.path.join(data_folder, 'final_df.parquet')):
+# create the dataset and save it in the data folder if it is missing
+DATASET_PATH = DEFAULT_OUTPUT
+if not output_exists(DATASET_PATH):
     with st.spinner("⏳ Initializing the dataset... This may take a few minutes."):
-        os.makedirs(data_folder, exist_ok=True)
-        data_folder = Path(data_folder)
-        recipe_nutrition_path = os.path.join(DATA_DIR, NUTRITION_FILE_NAME).replace("\\", "/")
-        recipe_measurements_path = os.path.join(DATA_DIR, MEASUREMENTS_FILE_NAME).replace("\\", "/")
-
-        logger.info("Starting data processing pipeline...")
-
-        merged = merge(recipe_nutrition_path, recipe_measurements_path)
-        df_prepro = data_preprocessing(merged)
-        df_filtered = data_filter(df_prepro)
-        output_path = data_folder / 'final_df.parquet'
-        if not os.path.exists(output_path):
-            df_filtered.to_parquet(output_path, index=False)
-
-        logger.success(f"Processed dataset saved to {output_path}")
-        logger.success("Pipeline execution completed successfully.")
-        logger.add("data_cleaning.log", rotation="10 MB", level="INFO", format="{time} - {level} - {message}")
+        build_dataset(DATASET_PATH)
     st.success("✅ Dataset loaded and ready to go!")
 
-# load the dataset
-DATASET_PATH = os.path.join(data_folder, 'final_df.parquet')
-df: pd.DataFrame = pd.read_parquet(DATASET_PATH)
+# load the dataset and its search index, shared by all the sessions
+df, search_index = load_recipes(DATASET_PATH)
 
 
 ####################################### FILTERS INITIALIZATION #####################################
 
-counter_ingredients: Counter[str] = Counter(x for row in df['NER'] for x in row)
-ingredient_list: set[str] = {item[0] for item in counter_ingredients.most_common()}  # ingredients sorted by frequency
+ingredient_options: List[str] = search_index.ingredients.most_common()
 recipe_durations_cat: List[str] = ['< 30min', '< 1h', '> 1h']
-recipe_durations_min: set[float] = {x for x in sorted(set(df['TotalTime_minutes'])) if pd.notna(x)}
-recipe_types: set[str] = {x for x in sorted(set(df['RecipeType'])) if pd.notna(x)}
-provenance: set[str] = {x for x in sorted(set(df['World_Cuisine'])) if pd.notna(x)}
-
-filter_columns: dict[str, str] = {
-    'ingredients': 'NER',
-    'recipe_durations_min': 'TotalTime_minutes',
-    'recipe_types': 'RecipeType',
-    'vegetarian': 'Vegetarian_Friendly',
-    'beginner': 'Beginner_Friendly',
-    'provenance': 'World_Cuisine'
-}
+recipe_types: List[str] = search_index.values('recipe_types')
+provenance: List[str] = search_index.values('provenance')
+
+filter_columns: dict[str, str] = FILTER_COLUMNS
 filters: dict[str, Any] = {}
 research_summary: str = ''
 
@@ -125,11 +86,19 @@ title_search_query: str = st.text_input(
 cleaned_query: str = clean_query(title_search_query)
 
 # error handling
-rec: list = list(df['title'].apply(lambda x: x.lower()).values)
-query_error(cleaned_query.split(), ingredient_list, rec)
+query_error(cleaned_query.split(), search_index)
 
 with st.form("filter_form", clear_on_submit=False):
     st.write("Filters")
+
+    # Ingredients of the fridge, the results are then ranked by how well they match them
+    fridge = st.multiselect(
+        "What's in your fridge? Recipes will be ranked by how well they match it",
+        ingredient_options, default=None, key='fridge_widget'
+        )
+    if fridge:
+        research_summary += f' - fridge : *{", ".join(fridge)}*'
+
     col2, col3, col4, col5 = st.columns(4)
 
     # Recipe duration filter continuous in hours
@@ -175,43 +144,33 @@ with st.form("filter_form", clear_on_submit=False):
 
     st.session_state.research_summary = research_summary
     st.session_state.filters = filters
+    st.session_state.fridge = fridge
     submitted = st.form_submit_button("Find a recipe")
 
-# Research recipes in the original dataframe according to the filters
+# Research recipes in the original dataframe according to the filters, only the positions of the
+# results are kept, ranked by fridge match if a fridge is given, else by rating
 if submitted:
-    df_search, total_nr_recipes = search_recipes(df, st.session_state.filters, filter_columns)
-    df_search = df_search.sort_values(by=['AggregatedRating'], ascending=False)  # sorted by higher rated
-    st.session_state.search_df, st.session_state.total_recipes = df_search, total_nr_recipes
-    if len(df_search) == 0:
+    search_result = result_pages(
+        df, st.session_state.filters, st.session_state.fridge, filter_columns, search_index
+        )
+    st.session_state.search_result, st.session_state.total_recipes = search_result, len(search_result)
+    st.session_state.search_version += 1
+    if len(search_result) == 0:
         st.write("No recipes found. Try adjusting your filters or your research.")
 
 # If no recipes found
-if (
-    st.session_state.search_df is None
-    or st.session_state.search_df.empty
-    or len(st.session_state.search_df) == 0
-):
+if st.session_state.search_result is None or len(st.session_state.search_result) == 0:
     st.write("No recipes found. Try adjusting your filters or your research.")
-# Filter the search_df (= the filtered df) by title search query if a query is entered
-if st.session_state.search_df is not None:
+# Restrict the search result (= the filtered recipes) to the title search query if one is entered
+if st.session_state.search_result is not None:
     research_summary = f"**Research summary :** {st.session_state.research_summary} \n"
     NUMBER_RECIPES = f"There are **{st.session_state.total_recipes}** recipes corresponding :\n"
+    paginator = st.session_state.search_result
     if title_search_query:
         research_summary += f', Title search : **{title_search_query}**'
-        st.session_state.search_df = st.session_state.search_df[
-            st.session_state.search_df['title'].str.contains(
-                cleaned_query, case=False, na=False
-                )
-            | st.session_state.search_df['NER'].apply(
-                    lambda x: all(
-                        word.lower() in [str(item).lower() for item in x]
-                        for word in cleaned_query.split()
-                        )
-                    )
-            ]
+        paginator = paginator.restrict(title_rows(cleaned_query, search_index))
 
-    df_search = st.session_state.search_df
-    st.session_state.total_recipes = len(df_search)
+    st.session_state.total_recipes = len(paginator)
 
     # Display the results
     if st.session_state.total_recipes != 0:
@@ -223,20 +182,21 @@ if st.session_state.search_df is not None:
     recipe_placeholder = st.container()
     bottom_menu = st.columns((4, 1, 1))
     with bottom_menu[2]:
-        batch_size = st.selectbox('Recipes per page', options=[10, 25, 50, 100])
-        total_pages = int(len(df_search)/batch_size) if len(df_search) > batch_size else 1
+        paginator.page_size = st.selectbox('Recipes per page', options=[10, 25, 50, 100])
     with bottom_menu[1]:
-        current_page = st.number_input('Page', min_value=1, max_value=total_pages, step=1, key='page_input')
+        current_page = page_input(
+            paginator, (st.session_state.search_version, cleaned_query, paginator.page_size)
+            )
     with bottom_menu[0]:
-        st.markdown(f"Page **{current_page}** of **{total_pages}**")
+        st.markdown(f"Page **{current_page}** of **{paginator.n_pages}**")
 
-    # Paginate the filtered DataFrame
-    pages = split_frame(df_search, batch_size)
-    page = pages[current_page - 1] if len(pages) > 0 else pd.DataFrame()
+    # Only the recipes of the page are read from the dataset (and ranked)
+    page = paginator.page(current_page)
 
     # Display filtered recipes with pagination + html formatting
     for i in range(len(page)):
         recipe = page.iloc[i]
+        match = f" | <b>Fridge match:</b> {recipe['%']}%" if '%' in page.columns else ''
         recipe_placeholder.markdown(
             f"""
         <div style="
@@ -249,7 +209,7 @@ if st.session_state.search_df is not None:
             <h3 style="margin: 0; color: #333;">{recipe['title']}</h3>
             <p style="margin: 5px 0; color: #777;">
                 <b>Total Time:</b> {recipe['TotalTime']} |
-                <b>Rating:</b> {recipe['AggregatedRating']}
+                <b>Rating:</b> {recipe['AggregatedRating']}{match}
             </p>
             <p style="margin: 5px 0; color: #555;">
                 {', '.join(str(x) for x in recipe['ingredients'][:10])}...
@@ -0,0 +1,139 @@
+"""
+Module that holds the pagination of the search results, which are kept as row positions in the
+dataset and only read from it one page at a time
+includes :
+    - Paginator
+"""
+
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.application.ranking import top_k
+
+# Number of rows per page, until the page selector sets it
+PAGE_SIZE = 10
+
+
+class Paginator:
+    """
+    Pages of a search result, held as the positions of its rows in the dataset. Only the rows of
+    the requested page are read from the dataset. The rows are shown best first when they have a
+    score, else in the order of `rows`; in both cases the order only depends on the result, so a
+    row keeps its place from one rerun to the next.
+
+    The number of rows per page is the `page_size` attribute, set from the page selector on each
+    rerun. A cursor is the position in the dataset of the first row of a page. It identifies the
+    page that was shown even after the result or the page size changed (see `page_of`).
+
+    Args:
+        df (pd.DataFrame): the dataset, not copied
+        rows (np.ndarray): the positions of the rows of the result in the dataset
+        scores (Optional[np.ndarray]): the score of each row, the missing scores are last.
+            Defaults to None, the rows are not ranked.
+        columns (Optional[Dict[str, np.ndarray]]): extra columns of the result, with a value per
+            row, added to the pages (e.g. a match percentage). Defaults to None.
+    """
+
+    def __init__(
+            self,
+            df: pd.DataFrame,
+            rows: np.ndarray,
+            scores: Optional[np.ndarray] = None,
+            columns: Optional[Dict[str, np.ndarray]] = None
+            ):
+        self.df = df
+        self.rows = np.asarray(rows)
+        self.page_size = PAGE_SIZE
+        self.scores = None
+        if scores is not None:
+            scores = np.asarray(scores, dtype=np.float64)
+            self.scores = np.where(np.isnan(scores), -np.inf, scores)
+        self.columns = columns or {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def n_pages(self) -> int:
+        """The number of pages, the last one may be partial. An empty result has one empty page."""
+        return max(1, math.ceil(len(self.rows) / self.page_size))
+
+    def _order(self, number: int) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the indices in `rows` of the rows of page `number`, from 1
+        """
+        start = (number - 1) * self.page_size
+        end = min(start + self.page_size, len(self.rows))
+        if start >= end:
+            return np.empty(0, dtype=np.int64)
+        if self.scores is None:
+            return np.arange(start, end)
+        return top_k(self.scores, end)[start:]
+
+    def page(self, number: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Args:
+            number (int): the number of the page, from 1
+            columns (Optional[List[str]]): the columns of the dataset to read. Defaults to None,
+                all of them.
+
+        Returns:
+            pd.DataFrame: the rows of the page, with the extra columns of the result
+        """
+        order = self._order(number)
+        page = self.df.take(self.rows[order])
+        if columns is not None:
+            page = page.take(self.df.columns.get_indexer(columns), axis=1)
+        for name, values in self.columns.items():
+            page[name] = np.asarray(values)[order]
+        return page
+
+    def cursor(self, number: int) -> Optional[int]:
+        """
+        Returns:
+            Optional[int]: the position in the dataset of the first row of page `number`, None if
+                the page is empty
+        """
+        order = self._order(number)
+        return int(self.rows[order[0]]) if len(order) else None
+
+    def page_of(self, cursor: Optional[int]) -> int:
+        """
+        Args:
+            cursor (Optional[int]): a position in the dataset, from `cursor`
+
+        Returns:
+            int: the number of the page holding the row at `cursor`, 1 if it is not in the result
+        """
+        found = np.flatnonzero(self.rows == cursor) if cursor is not None else []
+        if len(found) == 0:
+            return 1
+        index = found[0]
+        rank = index
+        if self.scores is not None:  # rows ranked before it, without sorting the result
+            score = self.scores[index]
+            rank = (np.count_nonzero(self.scores > score)
+                    + np.count_nonzero(self.scores[:index] == score))
+        return int(rank) // self.page_size + 1
+
+    def restrict(self, rows: np.ndarray) -> 'Paginator':
+        """
+        Args:
+            rows (np.ndarray): positions of rows of the dataset
+
+        Returns:
+            Paginator: the pages of the rows of the result that are in `rows`, in the same order
+        """
+        keep = np.isin(self.rows, rows)
+        restricted = Paginator(
+            self.df,
+            self.rows[keep],
+            self.scores[keep] if self.scores is not None else None,
+            {name: np.asarray(values)[keep] for name, values in self.columns.items()}
+            )
+        restricted.page_size = self.page_size
+        return restricted
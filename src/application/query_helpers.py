@@ -2,14 +2,18 @@
 Module that holds streamlit helper functions for query manipulation in the recipe finder
 includes :
     - query cleaning
-    - query correction suggestion
+    - query correction suggestion, from the words of the recipes
 """
 
 import string
+from typing import TYPE_CHECKING
 
-import inflect
 import streamlit as st
-from spellchecker import SpellChecker
+
+from src.preprocessing.singularizer import get_singularizer
+
+if TYPE_CHECKING:
+    from src.application.search_index import RecipeIndex
 
 
 def clean_query(query: str) -> str:
@@ -21,37 +25,37 @@ def clean_query(query: str) -> str:
 
     Returns: string (query wwithout ponctuation and in singular)
     """
-    inflect_engine = inflect.engine()
+    singularizer = get_singularizer()
     # Remove punctuation
     rm_ponct = ''.join([char for char in query if char not in string.punctuation])
     # Singularize words
-    cleaned_query = [inflect_engine.singular_noun(ingredient) or ingredient for ingredient in rm_ponct.split()]
+    cleaned_query = [singularizer.singular(ingredient) for ingredient in rm_ponct.split()]
     return ' '.join(cleaned_query)
 
 
-def query_error(query: list, ing: set, rec: list):
+def query_error(query: list, index: 'RecipeIndex'):
     """Handle query error by returning an error message when no recipe or ingredient are found,
     either the word might be missplelled and, when corrected, recognized or the word is unknown.
     If the query is correct, returns a message to inform that recipes were found.
 
     Args:
        query (list): The search query of the user transformed into a list of words.
-       ing (list) : The list of unique ingredients.
-       rec (list) : The list of recipes.
+       index (RecipeIndex) : The index of the recipes, whose ingredients, titles and spelling
+            vocabulary are indexed.
     """
     response: list = []
-    spell = SpellChecker()
+    words = [word.lower() for word in query]
 
     # Check if all words in the query already match valid ingredients or recipes
-    if all(word in ing or any(word in r for r in rec) for word in query):
+    if all(index.is_known(word) for word in words):
         return st.markdown("Matching recipes or ingredients found! Fill out desired filters and \
                            press *find a recipe*")
 
     # else attempt a correction
-    for word in query:
-        if word not in ing and not any(word in r for r in rec):
-            corrected_word = spell.correction(word)
-            if corrected_word in ing or any(corrected_word in r for r in rec):
+    for word in words:
+        if not index.is_known(word):
+            corrected_word = index.spelling.correction(word)
+            if corrected_word is not None and index.is_known(corrected_word):
                 response.append(corrected_word)
 
     # Respond to the user
@@ -0,0 +1,70 @@
+"""
+Module that ranks the recipes by how well they match the ingredients of the user's fridge
+includes :
+    - top_k
+    - fridge_scores
+"""
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+# weights of the score of a recipe, whose parts are all between 0 and 1
+MATCH_WEIGHT = 0.7
+RATING_WEIGHT = 0.2
+REVIEWS_WEIGHT = 0.1
+MAX_RATING = 5
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Select the k best scores with a partial selection in linear time, then sort only them. The
+    order is the one of a full stable sort: by decreasing score, then by position, so the first
+    k positions never change when k grows, e.g. from one page of results to the next.
+
+    Args:
+        scores (np.ndarray): the scores
+        k (int): the number of positions to return
+
+    Returns:
+        np.ndarray: the positions of the k best scores, best first
+    """
+    k = max(0, min(k, len(scores)))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]  # the k-th largest score
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(len(scores))
+    return selected[np.lexsort((selected, -scores[selected]))]
+
+
+def fridge_scores(
+        matches: np.ndarray, lengths: np.ndarray, ratings: pd.Series, reviews: pd.Series
+        ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score recipes by the share of their ingredients that are in the fridge, their rating and
+    their number of reviews (on a log scale, relative to the most reviewed of the scored recipes).
+    A missing rating or number of reviews counts as 0.
+
+    Args:
+        matches (np.ndarray): the number of ingredients of each recipe that are in the fridge
+        lengths (np.ndarray): the number of ingredients of each recipe
+        ratings (pd.Series): the rating of each recipe, out of `MAX_RATING`
+        reviews (pd.Series): the number of reviews of each recipe
+
+    Returns:
+        np.ndarray: the share of the ingredients of each recipe in the fridge
+        np.ndarray: the score of each recipe, between 0 and 1
+    """
+    match = matches / np.maximum(lengths, 1)
+    rating = ratings.to_numpy(dtype=np.float64, na_value=0) / MAX_RATING
+    counts = np.log1p(reviews.to_numpy(dtype=np.float64, na_value=0))
+    if len(counts) and counts.max() > 0:
+        counts = counts / counts.max()
+    score = MATCH_WEIGHT * match + RATING_WEIGHT * rating + REVIEWS_WEIGHT * counts
+    return match, score
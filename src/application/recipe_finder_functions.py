@@ -1,38 +1,108 @@
 """
 Module that holds streamlit helper functions for the recipe finder page of the final app
 includes :
-    - dataframe splitting for multiple pages
+    - loading of the dataset and of its search index, once per dataset version
     - searching the dataframe according to recipe criterions
+    - searching the results by title or ingredients
+    - ranking the recipes by fridge match
+    - pagination of the results, kept as row positions
     - display of the page with html code
 """
 
-from typing import Any, Tuple
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import re
 import base64
 import streamlit as st
 from jinja2 import Template
 
+from src.application.pagination import Paginator
+from src.application.ranking import fridge_scores
+from src.application.search_cache import (dataset_version, get_result_cache,
+                                          normalize_filters)
+from src.application.search_index import RecipeIndex
+from src.preprocessing.schema import read_output
 
-def split_frame(input_df: pd.DataFrame, rows: int) -> list[pd.DataFrame]:
+# column of the dataset searched by each filter of the recipe finder
+FILTER_COLUMNS: dict[str, str] = {
+    'ingredients': 'NER',
+    'recipe_durations_cat': 'TotalTime_cat',
+    'recipe_durations_min': 'TotalTime_minutes',
+    'recipe_types': 'RecipeType',
+    'vegetarian': 'Vegetarian_Friendly',
+    'beginner': 'Beginner_Friendly',
+    'provenance': 'World_Cuisine'
+}
+
+
+# indexes of the DataFrames searched without an index, by id, dropped with their DataFrame
+_frame_indexes: Dict[int, Tuple[tuple, RecipeIndex]] = {}
+
+
+def search_rows(
+    original_df: pd.DataFrame, filters: dict[str, Any], dict_columns: dict[str, str],
+    index: Optional[RecipeIndex] = None
+        ) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: the positions of the recipes passing the filters (see `search_recipes`), from
+            the result cache
+    """
+    if index is None:
+        index = _frame_index(original_df, dict_columns)
+    cache = get_result_cache()
+    key = (index.version, normalize_filters(filters))
+    rows = cache.get(key)
+    if rows is None:
+        rows = cache.put(key, index.rows(filters))
+    return rows
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_recipes(path: Path, version: str) -> Tuple[pd.DataFrame, RecipeIndex]:
+    df = read_output(path)
+    return df, RecipeIndex(df, FILTER_COLUMNS, version, title_column='title')
+
+
+def load_recipes(path: Path) -> Tuple[pd.DataFrame, RecipeIndex]:
     """
-    Split the input DataFrame into chunks of a specified number of rows.
+    Read the final dataset and build its search index, once for all the sessions of the app. They
+    are read again when the files of the dataset change, e.g. after an ingestion. The returned
+    DataFrame is shared by the sessions and must not be modified in place.
 
     Args:
-        input_df (DataFrame): the dataset that will be split
-        rows (int): the number of rows per split
+        path (Path): the parquet file, or the folder of the partitioned dataset
+
+    Returns:
+        pd.DataFrame: the recipes
+        RecipeIndex: the index of their `FILTER_COLUMNS` and titles, whose version is the
+            dataset version
+    """
+    return _load_recipes(path, dataset_version(path))
 
+
+def _frame_index(df: pd.DataFrame, dict_columns: dict[str, str]) -> RecipeIndex:
+    """
     Returns:
-        list[DataFrame]: A list of DataFrame chunks
+        RecipeIndex: the index of a DataFrame not loaded with `load_recipes`, built the first time
+            it is searched. The DataFrame must not be modified in place afterwards.
     """
-    df = [input_df.iloc[i:i+rows, :] for i in range(0, len(input_df), rows)]
-    return df
+    columns = tuple(sorted(dict_columns.items()))
+    entry = _frame_indexes.get(id(df))
+    if entry is None:
+        weakref.finalize(df, _frame_indexes.pop, id(df), None)
+    if entry is None or entry[0] != columns:
+        entry = _frame_indexes[id(df)] = (columns, RecipeIndex(df, dict_columns))
+    return entry[1]
 
 
-@st.cache_data(show_spinner=True)
 def search_recipes(
-    original_df: pd.DataFrame, filters: dict[str, Any], dict_columns: dict[str, str]
+    original_df: pd.DataFrame, filters: dict[str, Any], dict_columns: dict[str, str],
+    index: Optional[RecipeIndex] = None
         ) -> Tuple[pd.DataFrame, int]:
     """
     Filter a DataFrame of recipes based on specific criterias and returns the filtered results.
@@ -46,6 +116,9 @@ def search_recipes(
         'recipe_durations_cat', ...) and values are the corresponding filter values
     dict_columns : dict
         Mapping of filter keys to the corresponding columns in the original df
+    index : RecipeIndex, optional
+        The index of the original df for `dict_columns`, built on the first search of the df if
+        not given
 
     Returns:
     --------
@@ -54,44 +127,124 @@ def search_recipes(
 
     Filtering Logic:
     ----------------
-    The function applies filters in sequence based on the `filters` dictionary. Supported filters:
+    The rows that pass every filter of the `filters` dictionary are found by ANDing the bitsets of
+    the filters in the index (see `RecipeIndex`). Supported filters:
     - `ingredients`: Filters recipes containing all selected ingredients
     - `recipe_durations_cat`: Filters recipes with the specified duration category
-    - `recipe_durations_min`: Filters recipes with durations less than or equal to the specified value
+    - `recipe_durations_min`: Filters recipes with durations less than or equal to the specified
+      value
     - `recipe_type`: Filters recipes of a specified type (breakfast, dinner, ...)
     - `vegetarian`: Filters recipes flashed as vegetarian
     - `beginner`: Filters recipes flashed as beginner friendly
     - `provenance`: Filters recipes according to specified world region
 
+    Caching:
+    --------
+    The row positions of the results are kept in a cache shared by all the sessions (see
+    `get_result_cache`), keyed on the normalized filters and the version of the index.
+
     """
-    filtered_df = original_df.copy()
-
-    if 'ingredients' in filters.keys():
-        col, value = dict_columns['ingredients'], filters['ingredients']
-        filtered_df = filtered_df[filtered_df[col].apply(lambda x: all(element in x for element in value))]
-    if 'recipe_durations_cat' in filters.keys():
-        col, value = dict_columns['recipe_durations_cat'], filters['recipe_durations_cat']
-        filtered_df = filtered_df[filtered_df[col] == (value)]
-    if 'recipe_durations_min' in filters.keys():
-        col, value = dict_columns['recipe_durations_min'], filters['recipe_durations_min']
-        filtered_df = filtered_df[filtered_df[col] <= (value)]
-    if 'recipe_type' in filters.keys():
-        col, value = dict_columns['recipe_types'], filters['recipe_type']
-        filtered_df = filtered_df[filtered_df[col] == (value)]
-    if 'vegetarian' in filters.keys():
-        col, value = dict_columns['vegetarian'], filters['vegetarian']
-        filtered_df = filtered_df[filtered_df[col] == (value)]
-    if 'beginner' in filters.keys():
-        col, value = dict_columns['beginner'], filters['beginner']
-        filtered_df = filtered_df[filtered_df[col] == (value)]
-    if 'provenance' in filters.keys():
-        col, value = dict_columns['provenance'], filters['provenance']
-        filtered_df = filtered_df[filtered_df[col].apply(lambda x: all(element in x for element in value))]
+    rows = search_rows(original_df, filters, dict_columns, index)
+    # only the selected rows are copied
+    filtered_df = original_df.iloc[rows]
 
     total_nr_recipes: int = len(filtered_df)
 
     return filtered_df, total_nr_recipes
 
+def title_rows(query: str, index: RecipeIndex) -> np.ndarray:
+    """
+    Args:
+        query (str): the cleaned title search query
+        index (RecipeIndex): the index of the recipes, with their titles and ingredients indexed
+
+    Returns:
+        np.ndarray: the sorted positions of the recipes whose title contains the query
+            (case-insensitive), or whose ingredients include every word of the query
+    """
+    rows = index.titles.rows(query)
+    words = query.lower().split()
+    if words:
+        rows = np.union1d(rows, index.ingredients.rows(words))
+    return rows
+
+
+def fridge_match(
+    original_df: pd.DataFrame, fridge: List[str], filters: dict[str, Any],
+    dict_columns: dict[str, str], index: Optional[RecipeIndex] = None
+        ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the recipes passing the filters that contain at least one ingredient of the fridge, and
+    score them by fridge match (see `ranking.fridge_scores`).
+
+    Parameters:
+    ----------
+    original_df : pd.DataFrame
+        The original df containing all the recipes + their info
+    fridge : list
+        The ingredients of the user's fridge
+    filters : dict
+        Dictionary of filter criterias, as in `search_recipes`
+    dict_columns : dict
+        Mapping of filter keys to the corresponding columns in the original df
+    index : RecipeIndex, optional
+        The index of the original df for `dict_columns`, built on the first search of the df if
+        not given
+
+    Returns:
+    --------
+    np.ndarray, np.ndarray, np.ndarray
+        The positions of the matching recipes in the original df, in order, the share of the
+        ingredients of each recipe in the fridge, and the score of each recipe
+    """
+    if index is None:
+        index = _frame_index(original_df, dict_columns)
+    rows = search_rows(original_df, filters, dict_columns, index)
+    ingredients = index.ingredients
+    matches = ingredients.matches(fridge)
+    rows = rows[matches[rows] > 0]
+    match, score = fridge_scores(
+        matches[rows], ingredients.lengths[rows],
+        original_df['AggregatedRating'].take(rows), original_df['ReviewCount'].take(rows)
+        )
+    return rows, match, score
+
+
+def result_pages(
+    original_df: pd.DataFrame, filters: dict[str, Any], fridge: List[str],
+    dict_columns: dict[str, str], index: RecipeIndex
+        ) -> Paginator:
+    """
+    Search the recipes without copying them: only the positions of the results are kept, and
+    their rows are read one page at a time (the page size is set on the returned paginator).
+
+    Parameters:
+    ----------
+    original_df : pd.DataFrame
+        The original df containing all the recipes + their info
+    filters : dict
+        Dictionary of filter criterias, as in `search_recipes`
+    fridge : list
+        The ingredients of the user's fridge, the results are ranked by fridge match if any (see
+        `fridge_match`) and have a match percentage ('%') column
+    dict_columns : dict
+        Mapping of filter keys to the corresponding columns in the original df
+    index : RecipeIndex
+        The index of the original df for `dict_columns`
+
+    Returns:
+    --------
+    Paginator
+        The pages of the results, best ranked first, else higher rated first
+    """
+    if fridge:
+        rows, match, score = fridge_match(original_df, fridge, filters, dict_columns, index)
+        return Paginator(original_df, rows, score, {'%': np.round(match * 100).astype(int)})
+    rows = search_rows(original_df, filters, dict_columns, index)
+    ratings = original_df['AggregatedRating'].take(rows)
+    return Paginator(original_df, rows, ratings.to_numpy(dtype=np.float64, na_value=np.nan))
+
+
 def img_to_base64(path):
     with open(path, "rb") as f:
         return base64.b64encode(f.read()).decode()
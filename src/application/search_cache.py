@@ -0,0 +1,134 @@
+"""
+Module that holds the cache of the search results of the recipe finder, shared by all the sessions
+of the app
+includes :
+    - dataset_version
+    - normalize_filters
+    - ResultCache
+    - get_result_cache
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+# bounds of the result cache, the least recently used results are evicted first
+MAX_ENTRIES = 1024
+MAX_BYTES = 64 * 2**20
+
+
+def dataset_version(path: Path) -> str:
+    """
+    Identify the version of the final dataset from the metadata of its files, without reading it.
+
+    Args:
+        path (Path): the parquet file, or the folder of the partitioned dataset
+
+    Returns:
+        str: a short hash of the name, size and modification time of the files of the dataset
+    """
+    path = Path(path)
+    files = sorted(path.rglob('*.parquet')) if path.is_dir() else [path]
+    digest = hashlib.sha256()
+    for file in files:
+        stat = os.stat(file)
+        name = file.relative_to(path.parent)
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def normalize_filters(filters: Dict[str, Any]) -> tuple:
+    """
+    Args:
+        filters (Dict[str, Any]): the filters of a search, as in `search_recipes`
+
+    Returns:
+        tuple: the sorted (key, value) pairs of the filters, with the lists of values (ingredients,
+            cuisines) as sorted tuples, since their order does not change the result
+    """
+    return tuple(sorted(
+        (key, tuple(sorted(set(value))) if isinstance(value, (list, tuple, set)) else value)
+        for key, value in filters.items()
+    ))
+
+
+class ResultCache:
+    """
+    Least recently used cache of the row positions of search results, bounded by its number of
+    entries and by the size of the stored arrays. It is safe to use from the threads of the
+    streamlit sessions.
+
+    Args:
+        max_entries (int): the number of results kept
+        max_bytes (int): the total size of the results kept
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """
+        Returns:
+            Optional[np.ndarray]: the read-only row positions stored for `key`, None if they are not
+                in the cache
+        """
+        with self._lock:
+            rows = self._entries.get(key)
+            if rows is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return rows
+
+    def put(self, key: Hashable, rows: np.ndarray) -> np.ndarray:
+        """
+        Store the row positions of a result, unless they are larger than the whole cache.
+
+        Returns:
+            np.ndarray: the stored positions, made read-only since they are shared
+        """
+        rows = np.array(rows, copy=True)
+        rows.setflags(write=False)
+        if rows.nbytes > self.max_bytes:
+            return rows
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = rows
+            self.nbytes += rows.nbytes
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        return rows
+
+    def clear(self) -> None:
+        """Drop every result, e.g. when the dataset changed"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+@lru_cache(maxsize=None)
+def get_result_cache() -> ResultCache:
+    """
+    Returns:
+        ResultCache: The cache of the search results, shared by the sessions of the process.
+    """
+    return ResultCache()
@@ -0,0 +1,440 @@
+"""
+Module that holds the indexes built once per dataset to answer the searches of the recipe finder
+without scanning every recipe
+includes :
+    - bitset helpers
+    - IngredientIndex
+    - BitmapIndex
+    - SortedIndex
+    - TitleIndex
+    - RecipeIndex
+"""
+
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from src.application.spelling import WORD, SpellingIndex
+
+# separator of the titles when they are scanned as one text
+SEPARATOR = '\x00'
+
+# filter key of the recipe finder -> (key of its column in the filter columns, how it is searched)
+FILTERS = {
+    'ingredients': ('ingredients', 'contains_all'),
+    'recipe_durations_cat': ('recipe_durations_cat', 'equal'),
+    'recipe_durations_min': ('recipe_durations_min', 'at_most'),
+    'recipe_type': ('recipe_types', 'equal'),
+    'vegetarian': ('vegetarian', 'equal'),
+    'beginner': ('beginner', 'equal'),
+    'provenance': ('provenance', 'substrings'),
+}
+
+
+def to_bitset(positions: np.ndarray, n_rows: int) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: the bitset of `n_rows` rows, packed 8 rows per byte, whose bits at `positions`
+            are set
+    """
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[positions] = True
+    return np.packbits(mask)
+
+
+def to_positions(bitset: np.ndarray, n_rows: int) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: the sorted positions of the rows whose bit is set
+    """
+    return np.flatnonzero(np.unpackbits(bitset, count=n_rows)).astype(np.int32)
+
+
+class IngredientIndex:
+    """
+    Inverted index from each ingredient to the sorted positions of the recipes that contain it.
+
+    A recipe contains an ingredient if the ingredient is an element of its list, as in
+    `ingredient in recipe['NER']`: 'green onion' does not contain 'onion'. The recipes containing
+    several ingredients are the intersection of their postings, starting from the rarest one.
+
+    Args:
+        lists (pd.Series): the ingredient list of each recipe, e.g. the `NER` column
+    """
+
+    def __init__(self, lists: pd.Series):
+        self.n_rows = len(lists)
+        array = pa.array(lists, from_pandas=True)
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+        if pa.types.is_null(array.type):  # no recipe, or only missing lists
+            array = array.cast(pa.list_(pa.string()))
+        flat = pc.list_flatten(array).to_numpy(zero_copy_only=False)
+        parents = pc.list_parent_indices(array).to_numpy().astype(np.int64)
+        codes, vocabulary = pd.factorize(flat)  # missing ingredients get the code -1
+        valid = codes >= 0
+        # one (ingredient, recipe) pair per occurrence, sorted by ingredient then by recipe
+        pairs = np.unique(codes[valid].astype(np.int64) * max(self.n_rows, 1) + parents[valid])
+        codes, rows = np.divmod(pairs, max(self.n_rows, 1))
+        bounds = np.searchsorted(codes, np.arange(len(vocabulary) + 1))
+        self.postings: Dict[str, np.ndarray] = {
+            ingredient: rows[start:end].astype(np.int32)
+            for ingredient, start, end in zip(vocabulary, bounds[:-1], bounds[1:])
+        }
+        # number of distinct ingredients of each recipe
+        self.lengths = np.bincount(rows, minlength=self.n_rows).astype(np.int32)
+        self._most_common = [vocabulary[i] for i in np.argsort(-np.diff(bounds), kind='stable')]
+
+    def __contains__(self, ingredient: str) -> bool:
+        return ingredient in self.postings
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    def most_common(self) -> List[str]:
+        """
+        Returns:
+            List[str]: the ingredients, from the one in the most recipes to the one in the fewest
+        """
+        return self._most_common
+
+    def matches(self, ingredients: Iterable[str]) -> np.ndarray:
+        """
+        Args:
+            ingredients (Iterable[str]): the ingredients to count
+
+        Returns:
+            np.ndarray: the number of the ingredients contained by each recipe
+        """
+        counts = np.zeros(self.n_rows, dtype=np.int32)
+        for ingredient in set(ingredients):
+            posting = self.postings.get(ingredient)
+            if posting is not None:
+                counts[posting] += 1  # a recipe appears once in a posting
+        return counts
+
+    def rows(self, ingredients: Iterable[str]) -> np.ndarray:
+        """
+        Args:
+            ingredients (Iterable[str]): the ingredients the recipes must all contain
+
+        Returns:
+            np.ndarray: the sorted positions of the recipes containing every ingredient, all the
+                recipes if no ingredient is given
+        """
+        postings = []
+        for ingredient in set(ingredients):
+            posting = self.postings.get(ingredient)
+            if posting is None:
+                return np.empty(0, dtype=np.int32)
+            postings.append(posting)
+        if not postings:
+            return np.arange(self.n_rows, dtype=np.int32)
+        postings.sort(key=len)
+        result = postings[0]
+        for posting in postings[1:]:
+            result = np.intersect1d(result, posting, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+
+class BitmapIndex:
+    """
+    Bitset of the rows of each value of a column with few distinct values, e.g. `RecipeType`.
+    The missing values are not indexed, as they are equal to no value.
+
+    Args:
+        column (pd.Series): the indexed column
+    """
+
+    def __init__(self, column: pd.Series):
+        self.n_rows = len(column)
+        codes, values = pd.factorize(column)
+        self.bitsets: Dict[Any, np.ndarray] = {
+            value: np.packbits(codes == code) for code, value in enumerate(values)
+        }
+
+    def values(self) -> List[Any]:
+        """
+        Returns:
+            List[Any]: the values of the column, sorted
+        """
+        return sorted(self.bitsets)
+
+    def equal(self, value: Any) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the bitset of the rows equal to `value`
+        """
+        bitset = self.bitsets.get(value)
+        return bitset if bitset is not None else np.packbits(np.zeros(self.n_rows, dtype=bool))
+
+    def where(self, predicate: Callable[[Any], bool]) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the bitset of the rows whose value satisfies `predicate`
+        """
+        bitset = np.packbits(np.zeros(self.n_rows, dtype=bool))
+        for value, rows in self.bitsets.items():
+            if predicate(value):
+                bitset = bitset | rows
+        return bitset
+
+
+class SortedIndex:
+    """
+    Positions of the rows of a numerical column sorted by value, to select a range of values
+    with a binary search. The missing values are sorted last and selected by no range.
+
+    Args:
+        column (pd.Series): the indexed column, e.g. `TotalTime_minutes`
+    """
+
+    def __init__(self, column: pd.Series):
+        self.n_rows = len(column)
+        values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+        self.order = np.argsort(values, kind='stable').astype(np.int32)
+        self.values = values[self.order]
+
+    def at_most(self, value: float) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the bitset of the rows whose value is lower than or equal to `value`
+        """
+        end = np.searchsorted(self.values, value, side='right')
+        return to_bitset(self.order[:end], self.n_rows)
+
+
+class TitleIndex:
+    """
+    Trigram index of the lowercase titles, for case-insensitive substring searches. The candidate
+    titles of a query are the intersection of the postings of its trigrams (the 3 consecutive
+    characters of the query, spaces included), and each candidate is then checked to contain the
+    whole query.
+
+    The postings of all the trigrams are stored in 3 arrays: the sorted trigram codes, the offset of
+    their postings, and the postings one after the other.
+
+    Args:
+        titles (pd.Series): the titles of the recipes
+    """
+
+    def __init__(self, titles: pd.Series):
+        self.n_rows = len(titles)
+        self.missing = titles.isna().to_numpy()
+        lowercase = titles.fillna('').astype(str).str.lower()
+        lowercase = lowercase.str.replace(SEPARATOR, ' ', regex=False)
+        self.titles: List[str] = lowercase.tolist()
+        chars = self._chars(SEPARATOR.join(self.titles))
+        codes, starts = self._trigrams(chars)
+        # the title of a trigram is the number of separators before it
+        rows = np.searchsorted(np.flatnonzero(chars == 0), starts).astype(np.int32)
+        order = np.lexsort((rows, codes))
+        codes, rows = codes[order], rows[order]
+        # one posting per title, even when a trigram appears several times in the title
+        first = np.ones(len(codes), dtype=bool)
+        first[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+        codes, self.postings = codes[first], rows[first]
+        self.codes, offsets = np.unique(codes, return_index=True)
+        self.offsets = np.append(offsets, len(codes))
+
+    @staticmethod
+    def _chars(text: str) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the code point of each character of the text
+        """
+        return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+
+    @staticmethod
+    def _trigrams(chars: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+            chars (np.ndarray): the code points of a text
+
+        Returns:
+            np.ndarray: the code of each trigram of the text that holds no separator, made of the
+                21-bit code points of its 3 characters
+            np.ndarray: the position in the text of the first character of each trigram
+        """
+        if len(chars) < 3:
+            return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+        codes = (chars[:-2] << np.uint64(42)) | (chars[1:-1] << np.uint64(21)) | chars[2:]
+        valid = (chars[:-2] != 0) & (chars[1:-1] != 0) & (chars[2:] != 0)
+        return codes[valid], np.flatnonzero(valid)
+
+    def candidates(self, query: str) -> np.ndarray:
+        """
+        Args:
+            query (str): the lowercase query
+
+        Returns:
+            np.ndarray: the sorted positions of the titles holding every trigram of the query, all
+                the titles if the query is shorter than a trigram
+        """
+        codes = np.unique(self._trigrams(self._chars(query))[0])
+        if not len(codes):
+            return np.arange(self.n_rows, dtype=np.int32)
+        found = np.searchsorted(self.codes, codes)
+        if np.any(found == len(self.codes)) or np.any(self.codes[found % len(self.codes)] != codes):
+            return np.empty(0, dtype=np.int32)  # a trigram of the query is in no title
+        postings = sorted(
+            (self.postings[self.offsets[i]:self.offsets[i + 1]] for i in found), key=len
+            )
+        result = postings[0]
+        for posting in postings[1:]:
+            result = np.intersect1d(result, posting, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def contains(self, query: str) -> bool:
+        """
+        Returns:
+            bool: whether a title contains the query, in any case
+        """
+        query = query.lower()
+        return any(query in self.titles[row] and not self.missing[row]
+                   for row in self.candidates(query))
+
+    def rows(self, query: str) -> np.ndarray:
+        """
+        Args:
+            query (str): the searched text, in any case
+
+        Returns:
+            np.ndarray: the sorted positions of the titles containing the query, the missing titles
+                contain no query
+        """
+        query = query.lower()
+        return np.array(
+            [row for row in self.candidates(query)
+             if query in self.titles[row] and not self.missing[row]],
+            dtype=np.int32
+            )
+
+
+class RecipeIndex:
+    """
+    Indexes of the columns searched by the recipe finder, built once per dataset. A search ANDs
+    the bitsets of its filters, so only the selected rows are read from the dataset.
+
+    Args:
+        df (pd.DataFrame): the recipes
+        dict_columns (Dict[str, str]): the column of each filter, as in `search_recipes`. The
+            columns missing from `df` are not indexed.
+        version (Optional[str]): identifies the indexed recipes and columns, e.g. the version of
+            the dataset file, in the keys of the cached search results. Defaults to None, a new
+            identifier unique to this index.
+        title_column (Optional[str]): the column of the titles, indexed by a `TitleIndex`, whose
+            words and the ingredient words make the vocabulary of a `SpellingIndex`. Defaults to
+            None, the titles are not indexed.
+    """
+
+    def __init__(
+            self,
+            df: pd.DataFrame,
+            dict_columns: Dict[str, str],
+            version: Optional[str] = None,
+            title_column: Optional[str] = None
+            ):
+        self.n_rows = len(df)
+        self.version = version or uuid.uuid4().hex
+        self.titles: Optional[TitleIndex] = None
+        self.spelling: Optional[SpellingIndex] = None
+        self.indexes: Dict[str, Any] = {}
+        kinds = dict(FILTERS.values())
+        for key, col in dict_columns.items():
+            if col not in df.columns or key not in kinds:
+                continue
+            if kinds[key] == 'contains_all':
+                self.indexes[key] = IngredientIndex(df[col])
+            elif kinds[key] == 'at_most':
+                self.indexes[key] = SortedIndex(df[col])
+            else:
+                self.indexes[key] = BitmapIndex(df[col])
+        if title_column is not None:
+            self.titles = TitleIndex(df[title_column])
+            self.spelling = SpellingIndex(self.vocabulary())
+
+    @property
+    def ingredients(self) -> Optional[IngredientIndex]:
+        """The index of the ingredients column, if it is indexed"""
+        return self.indexes.get('ingredients')
+
+    def vocabulary(self) -> Counter:
+        """
+        Returns:
+            Counter: the number of occurrences of each word of the titles and of the ingredients
+        """
+        counts = Counter(word for title in self.titles.titles for word in WORD.findall(title))
+        if self.ingredients is not None:
+            for ingredient, rows in self.ingredients.postings.items():
+                for word in WORD.findall(str(ingredient).lower()):
+                    counts[word] += len(rows)
+        return counts
+
+    def is_known(self, word: str) -> bool:
+        """
+        Returns:
+            bool: whether the word is an ingredient or is part of a title
+        """
+        if self.ingredients is not None and word in self.ingredients:
+            return True
+        return self.titles.contains(word)
+
+    def values(self, key: str) -> List[Any]:
+        """
+        Args:
+            key (str): the key of a column indexed by a `BitmapIndex`, e.g. 'recipe_types'
+
+        Returns:
+            List[Any]: the values of the column, sorted
+        """
+        return self.indexes[key].values()
+
+    def bitset(self, key: str, value: Any) -> np.ndarray:
+        """
+        Args:
+            key (str): a filter key of `FILTERS`
+            value (Any): the value of the filter
+
+        Returns:
+            np.ndarray: the bitset of the rows that pass the filter
+        """
+        column_key, kind = FILTERS[key]
+        index = self.indexes[column_key]
+        if kind == 'contains_all':
+            return to_bitset(index.rows(value), self.n_rows)
+        if kind == 'at_most':
+            return index.at_most(value)
+        if kind == 'substrings':  # every selected value is a substring of the row value
+            bitset = np.packbits(np.ones(self.n_rows, dtype=bool))
+            for element in value:
+                bitset = bitset & index.where(lambda x, element=element: element in x)
+            return bitset
+        return index.equal(value)
+
+    def rows(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Args:
+            filters (Dict[str, Any]): the filters of the search, as in `search_recipes`. The keys
+                missing from `FILTERS` are ignored.
+
+        Returns:
+            np.ndarray: the sorted positions of the rows that pass every filter
+        """
+        keys = [key for key in filters if key in FILTERS]
+        if keys == ['ingredients']:  # no bitset needed
+            return self.indexes['ingredients'].rows(filters['ingredients'])
+        if not keys:
+            return np.arange(self.n_rows, dtype=np.int32)
+        bitset = self.bitset(keys[0], filters[keys[0]])
+        for key in keys[1:]:
+            bitset = bitset & self.bitset(key, filters[key])
+        return to_positions(bitset, self.n_rows)
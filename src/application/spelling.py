@@ -0,0 +1,133 @@
+"""
+Module that holds the spelling correction of the search queries, over the words of the recipes
+instead of a general english dictionary
+includes :
+    - WORD
+    - edit_distance
+    - SpellingIndex
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+# a word of a title or an ingredient: a run of letters, accented ones included
+WORD = re.compile(r"[^\W\d_]+")
+
+
+def edit_distance(source: str, target: str, max_distance: int) -> Optional[int]:
+    """
+    Optimal string alignment distance: the number of insertions, deletions, substitutions and
+    transpositions of two adjacent characters turning `source` into `target`.
+
+    Args:
+        source (str): the first word
+        target (str): the second word
+        max_distance (int): the largest distance of interest
+
+    Returns:
+        Optional[int]: the distance, None if it is larger than `max_distance`
+    """
+    if abs(len(source) - len(target)) > max_distance:
+        return None
+    # only the cells within `max_distance` of the diagonal can hold a distance of interest, the
+    # others are left at `too_far`
+    too_far = max_distance + 1
+    previous_previous: List[int] = []
+    previous = [j if j <= max_distance else too_far for j in range(len(target) + 1)]
+    for i, source_char in enumerate(source, 1):
+        current = [i if i <= max_distance else too_far] + [too_far] * len(target)
+        for j in range(max(1, i - max_distance), min(len(target), i + max_distance) + 1):
+            target_char = target[j - 1]
+            distance = min(previous[j] + 1, current[j - 1] + 1,
+                           previous[j - 1] + (source_char != target_char))
+            if (i > 1 and j > 1 and source_char == target[j - 2]
+                    and source[i - 2] == target_char):
+                distance = min(distance, previous_previous[j - 2] + 1)
+            current[j] = min(distance, too_far)
+        # the next rows extend the current row, or the previous one by a transposition
+        if min(current) > max_distance and min(previous) >= max_distance:
+            return None
+        previous_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+class SpellingIndex:
+    """
+    Spelling corrector by symmetric deletes: two words within `max_distance` edits of each other
+    share a variant obtained by deleting at most `max_distance` characters from each. The
+    variants of every word of the vocabulary are indexed once, so a correction only computes the
+    distance to the few words sharing a variant with the query, instead of generating every
+    possible edit of the query or scanning the vocabulary. The variants of the query are looked up
+    by increasing number of deletions, and the lookup stops once a closer word cannot be found.
+
+    Only the first `prefix_length` characters of the words are used for the variants, which bounds
+    the size of the index while keeping all the words within `max_distance` edits as candidates.
+
+    Args:
+        counts (Dict[str, int]): the number of occurrences of each word of the vocabulary
+        max_distance (int): the largest number of edits of a correction. Defaults to 2.
+        prefix_length (int): the number of characters of the indexed variants. Defaults to 7.
+    """
+
+    def __init__(self, counts: Dict[str, int], max_distance: int = 2, prefix_length: int = 7):
+        self.counts = dict(counts)
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.deletes: Dict[str, List[str]] = defaultdict(list)
+        for word in self.counts:
+            for variant in set().union(*self._variants(word[:prefix_length])):
+                self.deletes[variant].append(word)
+        self.deletes = dict(self.deletes)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.counts
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _variants(self, word: str) -> List[Set[str]]:
+        """
+        Returns:
+            List[Set[str]]: the strings obtained by deleting 0, 1, ... `max_distance` characters of
+                the word
+        """
+        levels = [{word}]
+        for _ in range(self.max_distance):
+            levels.append({
+                edit[:i] + edit[i + 1:] for edit in levels[-1] for i in range(len(edit))
+                })
+        return levels
+
+    def correction(self, word: str) -> Optional[str]:
+        """
+        Args:
+            word (str): the lowercase word to correct
+
+        Returns:
+            Optional[str]: the word itself if it is in the vocabulary, else the closest word of the
+                vocabulary, the most frequent one among the closest, None if there is none within
+                `max_distance` edits
+        """
+        if word in self.counts:
+            return word
+        best, best_key = None, None
+        max_distance = self.max_distance
+        seen: Set[str] = set()
+        for deletions, variants in enumerate(self._variants(word[:self.prefix_length])):
+            # a word within d edits shares a variant with `word` of at most d deletions
+            if best_key is not None and deletions > best_key[0]:
+                break
+            for variant in variants:
+                for candidate in self.deletes.get(variant, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    # the distance of interest shrinks to the distance of the best correction
+                    distance = edit_distance(word, candidate, max_distance)
+                    if distance is None:
+                        continue
+                    key = (distance, -self.counts[candidate], candidate)
+                    if best_key is None or key < best_key:
+                        best, best_key, max_distance = candidate, key, distance
+        return best
@@ -3,11 +3,16 @@ Module that holds all helper functions related to the streamlit session state
 includes :
     - initialization of session state
     - variable storing in session state before switching pages + page switching
+    - page selection of the results, kept on the same recipes from one search to the next
 """
 
+from typing import Hashable
+
 import pandas as pd
 import streamlit as st
 
+from src.application.pagination import Paginator
+
 
 def initialize_session_state() -> None:
     """
@@ -21,9 +26,14 @@ def initialize_session_state() -> None:
         'instructions': '',
         'link': '',
         'total_recipes': None,
-        'search_df': None,
+        'search_result': None,
+        'search_version': 0,
+        'page_view': None,
+        'page_cursor': None,
         'research_summary': None,
         'filters': None,
+        'fridge': None,
+        'correspondance_rate': None,
         'recipe_type': None,
         'rating': None,
         'vote': None,
@@ -52,6 +62,35 @@ def initialize_session_state() -> None:
             st.session_state[key] = value
 
 
+def page_input(paginator: Paginator, view: Hashable) -> int:
+    """
+    Display the page selector of the results. When the results shown change (new search, title
+    query or page size), the selector moves to the page holding the first recipe of the page shown
+    before, if it is still in the results, instead of keeping a page number that now points to
+    other recipes or to no page at all.
+
+    Parameters:
+    ----------
+    paginator : Paginator
+        The pages of the results shown
+    view : Hashable
+        Identifies the results shown and their page size
+
+    Returns:
+    --------
+    int
+        The number of the selected page, from 1
+    """
+    if st.session_state.get('page_view') != view or 'page_input' not in st.session_state:
+        st.session_state.page_input = paginator.page_of(st.session_state.get('page_cursor'))
+        st.session_state.page_view = view
+    current_page = st.number_input(
+        'Page', min_value=1, max_value=paginator.n_pages, step=1, key='page_input'
+        )
+    st.session_state.page_cursor = paginator.cursor(current_page)
+    return current_page
+
+
 def handle_recipe_click(page: pd.DataFrame, index: int) -> None:
     """
     Update Streamlit session state variables with recipe details -for use across pages- from the
@@ -72,6 +111,8 @@ def handle_recipe_click(page: pd.DataFrame, index: int) -> None:
     - `ingredients`: str - Ingredients list
     - `instructions`: str - Preparation instructions
     - `link`: str - Source link for the recipe
+    - `correspondance_rate`: int - Percentage of the recipe's ingredients in the fridge, None if
+      the results are not ranked by fridge match
     - `rating`: float - Aggregated rating of the recipe
     - `vote`: int - Number of reviews/votes
     - `author`: str - Name of the recipe's author
@@ -101,7 +142,7 @@ def handle_recipe_click(page: pd.DataFrame, index: int) -> None:
     st.session_state.ingredients = page.iloc[index]['ingredients']
     st.session_state.instructions = page.iloc[index]['directions']
     st.session_state.link = "https://" + page.iloc[index]['link']
-    # st.session_state.correspondance_rate = page.iloc[index]['%']
+    st.session_state.correspondance_rate = page.iloc[index].get('%')  # only for ranked results
     st.session_state.rating = page.iloc[index]['AggregatedRating']
     st.session_state.vote = page.iloc[index]['ReviewCount']
     st.session_state.author = page.iloc[index]['AuthorName']
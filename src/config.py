@@ -0,0 +1,34 @@
+"""
+Module that reads the configuration of the project (`utils/config.yaml`) when it is first needed
+instead of when a module is imported.
+includes :
+    - get_config
+    - api_uri
+"""
+
+from functools import lru_cache
+from pathlib import Path
+
+# Get the absolute path to the project root
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CONFIG_PATH = PROJECT_ROOT / "utils" / "config.yaml"
+
+
+@lru_cache(maxsize=None)
+def get_config() -> dict:
+    """
+    Returns:
+        dict: The configuration of the project, read once per process.
+    """
+    import yaml  # only imported by the processes that read the configuration
+
+    with open(CONFIG_PATH, "r") as file:
+        return yaml.safe_load(file)
+
+
+def api_uri() -> str:
+    """
+    Returns:
+        str: The URI of the flask backend.
+    """
+    return get_config()['FLASK']['URI']
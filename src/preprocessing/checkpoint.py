@@ -0,0 +1,185 @@
+"""
+Module that saves the output of each stage of the pipeline as a parquet checkpoint, named after a
+hash of everything the stage depends on, so that a stage is only run again when one of them changed.
+includes :
+    - imported_modules
+    - source_version
+    - file_fingerprint
+    - stage_key
+    - write_checkpoint
+    - read_checkpoint
+    - checkpointed
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Dict
+
+import fsspec
+import numpy as np
+import pandas as pd
+from src.preprocessing.profiling import profile
+
+# Set up basic logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Get the absolute path to the project root
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CHECKPOINT_DIR = PROJECT_ROOT / 'data' / 'checkpoints'
+
+
+def imported_modules(*modules: ModuleType) -> Dict[str, ModuleType]:
+    """
+    Args:
+        modules (ModuleType): modules of the project
+
+    Returns:
+        Dict[str, ModuleType]: the modules and, recursively, the modules of the project they import
+            (as a module or through one of its functions or classes), by name
+    """
+    package = __name__.split('.', maxsplit=1)[0]
+    found: Dict[str, ModuleType] = {}
+    pending = list(modules)
+    while pending:
+        module = pending.pop()
+        if module.__name__ in found:
+            continue
+        found[module.__name__] = module
+        for value in vars(module).values():
+            if isinstance(value, ModuleType):
+                name = value.__name__
+            else:
+                name = getattr(value, '__module__', None)
+            if (isinstance(name, str) and name.split('.', maxsplit=1)[0] == package
+                    and getattr(sys.modules.get(name), '__file__', None)):
+                pending.append(sys.modules[name])
+    return found
+
+
+def source_version(*modules: ModuleType) -> str:
+    """
+    Version of the code of a stage: the hash of the source files of the modules it uses, and of
+    the modules of the project they import, so that a change in a helper module is not missed.
+
+    Args:
+        modules (ModuleType): the modules holding the code of the stage
+
+    Returns:
+        str: the hash of the source files
+    """
+    digest = hashlib.sha256()
+    for name, module in sorted(imported_modules(*modules).items()):
+        digest.update(name.encode())
+        with open(module.__file__, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def file_fingerprint(path: str) -> dict:
+    """
+    Identify the version of an input file (local, s3 or https) from its metadata, without
+    reading it.
+
+    Args:
+        path (str): the path or url of the file
+
+    Returns:
+        dict: the path, size and modification time or ETag of the file
+    """
+    filesystem, fs_path = fsspec.core.url_to_fs(path)
+    info = filesystem.info(fs_path)
+    version = {key: info[key] for key in ('ETag', 'LastModified', 'mtime') if key in info}
+    return {'path': path, 'size': info.get('size'), **version}
+
+
+def stage_key(stage: str, *parts: Any) -> str:
+    """
+    Args:
+        stage (str): the name of the stage
+        parts (Any): everything the output of the stage depends on: its inputs (or the key of the
+            previous stage), the config section it reads and its code version
+
+    Returns:
+        str: a short hash identifying the output of the stage
+    """
+    content = json.dumps([stage, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def write_checkpoint(df: pd.DataFrame, path: Path) -> None:
+    """
+    Save a DataFrame and its index as parquet, writing to a temporary file first so that an
+    interrupted run never leaves a partial checkpoint.
+
+    Args:
+        df (pd.DataFrame): the output of a stage
+        path (Path): the checkpoint file
+    """
+    os.makedirs(path.parent, exist_ok=True)
+    temporary_path = path.with_suffix('.tmp')
+    df.to_parquet(temporary_path, index=True)
+    os.replace(temporary_path, path)
+
+
+def read_checkpoint(path: Path) -> pd.DataFrame:
+    """
+    Load a checkpoint as the DataFrame that was saved: parquet lists are read back as numpy arrays
+    with None for missing items, they are converted back to lists with NaN, as `text_formating`
+    builds them.
+
+    Args:
+        path (Path): the checkpoint file
+
+    Returns:
+        pd.DataFrame: the output of the stage
+    """
+    df = pd.read_parquet(path)
+    for col in df.columns[df.dtypes == object]:
+        if len(df) and isinstance(df[col].iloc[0], np.ndarray):
+            df[col] = df[col].map(
+                lambda x: [np.nan if item is None else item for item in x.tolist()]
+                if isinstance(x, np.ndarray)
+                else x
+                )
+    return df
+
+
+def checkpointed(
+        stage: str,
+        key: str,
+        compute: Callable[[], pd.DataFrame],
+        checkpoint_dir: Path = CHECKPOINT_DIR
+        ) -> pd.DataFrame:
+    """
+    Return the checkpoint of a stage if one exists for its key, otherwise run the stage and save
+    its output.
+
+    Args:
+        stage (str): the name of the stage
+        key (str): the key of the stage, see `stage_key`
+        compute (Callable[[], pd.DataFrame]): runs the stage
+        checkpoint_dir (Path): the folder of the checkpoints
+
+    Returns:
+        pd.DataFrame: the output of the stage
+    """
+    path = Path(checkpoint_dir) / f'{stage}-{key}.parquet'
+    if path.is_file():
+        start_time = time.time()
+        with profile(f'{stage} checkpoint') as step:
+            df = read_checkpoint(path)
+            step['rows_out'] = len(df)
+        logging.info(
+            "Stage %s loaded from %s in --- %s seconds ---", stage, path, (time.time() - start_time)
+            )
+        return df
+    df = compute()
+    write_checkpoint(df, path)
+    logging.info("Stage %s saved to %s", stage, path)
+    return df
@@ -1,37 +1,166 @@
+"""
+Module that builds the final dataset from the raw datasets. It is the entry point of the data
+processing pipeline, used by the `build-dataset` command and by the pages of the application when
+the dataset is missing.
+includes :
+    - raw_data_paths
+    - build_dataset
+    - parse_args
+    - main
+"""
+
+import argparse
 import os
 from pathlib import Path
+from typing import List, Optional, Tuple
 
-import yaml
+import pandas as pd
 from loguru import logger
-from filter import data_filter
-from format import data_preprocessing
-from load import merge
-
-logger.add("data_cleaning.log", rotation="10 MB", level="INFO", format="{time} - {level} - {message}")
+from src.config import get_config
+from src.preprocessing.profiling import report_path
+from src.preprocessing.schema import write_output
 
 # Get the absolute path to the project root
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
-config_path = PROJECT_ROOT / "utils" / "config.yaml"
+# Dataset read by the application
+DEFAULT_OUTPUT = PROJECT_ROOT / 'data' / 'recipe' / 'final_df.parquet'
+OUTPUT_FORMATS = ['parquet', 'partitioned']
+
 
-with open(config_path, "r") as file:
-    config = yaml.safe_load(file)
-DATA_DIR = config['DATA_DIR']
+def raw_data_paths() -> Tuple[str, str]:
+    """
+    Returns:
+        str: the path of the raw nutrition dataset, from the config
+        str: the path of the raw measurements dataset, from the config
+    """
+    config = get_config()
+    return tuple(
+        os.path.join(config['DATA_DIR'], config['s3'][name]).replace("\\", "/")
+        for name in ('nutrition_file_name', 'measurements_file_name')
+        )
 
-recipe_nutrition_path = os.path.join(DATA_DIR, 'recipes.parquet').replace("\\", "/")
-recipe_measurements_path = os.path.join(DATA_DIR, 'recipes_data.parquet').replace("\\", "/")
-output_dir = PROJECT_ROOT / 'data'
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
 
-output_path = output_dir / 'final_df_1.parquet'
+def build_dataset(
+        output_path: Path = DEFAULT_OUTPUT,
+        workers: int = 1,
+        sample: Optional[int] = None,
+        seed: int = 0,
+        partitioned: bool = False,
+        profile_path: Optional[Path] = None,
+        checkpoint_dir: Optional[Path] = None,
+        batch_size: Optional[int] = None,
+        nutrition_data_path: Optional[str] = None,
+        measurements_data_path: Optional[str] = None,
+        ingest: bool = False
+        ) -> pd.DataFrame:
+    """
+    Run the data processing pipeline (see `pipeline.run_pipeline`) and write the final dataset.
 
-logger.info("Starting data processing pipeline...")
+    Args:
+        output_path (Path): the parquet file, or the folder of the partitioned dataset. Defaults to
+                the dataset read by the application.
+        workers (int): the number of processes. Defaults to 1.
+        sample (Optional[int]): the number of merged recipes to process, for a quick development
+                build. Defaults to None, all recipes are processed.
+        seed (int): the seed of the sample. Defaults to 0.
+        partitioned (bool): whether to write a dataset partitioned by recipe type. An ingestion
+                keeps the layout of the current dataset. Defaults to False.
+        profile_path (Optional[Path]): where to write the profiling report. Defaults to None.
+        checkpoint_dir (Optional[Path]): the folder of the stage checkpoints. Defaults to None.
+        batch_size (Optional[int]): number of rows per batch when streaming the measurements
+                dataset. Defaults to None.
+        nutrition_data_path (Optional[str]): the raw nutrition dataset. Defaults to the config one.
+        measurements_data_path (Optional[str]): the raw measurements dataset. Defaults to the
+                config one.
+        ingest (bool): whether the raw datasets only hold new or changed recipes, upserted into the
+                dataset at `output_path` (see `pipeline.ingest_delta`). Defaults to False.
 
-merged = merge(recipe_nutrition_path, recipe_measurements_path)
-df_prepro = data_preprocessing(merged)
-df_filtered = data_filter(df_prepro)
-if output_path:
-    df_filtered.to_parquet(output_path, index=False)
+    Returns:
+        pd.DataFrame: the final dataset
+    """
+    # the pipeline modules are only imported when a dataset is built, not by the pages that
+    # import this module and find the dataset already built
+    from src.preprocessing.pipeline import ingest_delta, run_pipeline
+
+    default_paths = raw_data_paths()
+    nutrition_data_path = nutrition_data_path or default_paths[0]
+    measurements_data_path = measurements_data_path or default_paths[1]
+    os.makedirs(Path(output_path).parent, exist_ok=True)
+    if ingest:
+        logger.info(f"Ingesting new recipes into {output_path}...")
+        return ingest_delta(
+            nutrition_data_path,
+            measurements_data_path,
+            output_path,
+            workers=workers,
+            batch_size=batch_size
+            )
+
+    logger.info("Starting data processing pipeline...")
+    df_filtered = run_pipeline(
+        nutrition_data_path,
+        measurements_data_path,
+        workers=workers,
+        batch_size=batch_size,
+        checkpoint_dir=checkpoint_dir,
+        profile_path=profile_path,
+        dataset_path=output_path,
+        sample=sample,
+        seed=seed
+        )
+    write_output(df_filtered, output_path, partitioned=partitioned)
     logger.success(f"Processed dataset saved to {output_path}")
+    return df_filtered
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Args:
+        argv (Optional[List[str]]): the command line arguments. Defaults to None, `sys.argv`.
+
+    Returns:
+        argparse.Namespace: the options of `build_dataset`
+    """
+    parser = argparse.ArgumentParser(description="Build the final recipes dataset.")
+    parser.add_argument('-o', '--output', type=Path, default=DEFAULT_OUTPUT,
+                        help="parquet file, or folder of the partitioned dataset")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='parquet',
+                        help="one parquet file, or a dataset partitioned by recipe type")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help="number of processes (default: number of CPUs)")
+    parser.add_argument('--sample', type=int, help="number of recipes to process, for dev builds")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the sample")
+    parser.add_argument('--profile', nargs='?', type=Path, const=True, default=None,
+                        metavar='PATH', help="write a profiling report (default: data/profiles/)")
+    parser.add_argument('--checkpoint-dir', type=Path, help="folder of the stage checkpoints")
+    parser.add_argument('--batch-size', type=int, help="stream the measurements by batches")
+    parser.add_argument('--nutrition', help="raw nutrition dataset (default: from the config)")
+    parser.add_argument('--measurements', help="raw measurements dataset (default: from the config)")
+    parser.add_argument('--ingest', action='store_true',
+                        help="upsert the recipes of the raw datasets into the existing output")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: `build-dataset --help`"""
+    args = parse_args(argv)
+    logger.add("data_cleaning.log", rotation="10 MB", level="INFO", format="{time} - {level} - {message}")
+    build_dataset(
+        args.output,
+        workers=args.workers,
+        sample=args.sample,
+        seed=args.seed,
+        partitioned=args.format == 'partitioned',
+        profile_path=report_path() if args.profile is True else args.profile,
+        checkpoint_dir=args.checkpoint_dir,
+        batch_size=args.batch_size,
+        nutrition_data_path=args.nutrition,
+        measurements_data_path=args.measurements,
+        ingest=args.ingest
+        )
+    logger.success("Pipeline execution completed successfully.")
+    return 0
+
 
-logger.success("Pipeline execution completed successfully.")
+if __name__ == '__main__':
+    raise SystemExit(main())
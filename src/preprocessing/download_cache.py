@@ -0,0 +1,354 @@
+"""
+Module that caches the raw data sets downloaded over http(s) (e.g. from the MinIO bucket of
+`DATA_DIR`) on the local disk, so that they are not downloaded again by every run of the pipeline.
+includes :
+    - CachedHTTPFile
+    - CachedHTTPFileSystem
+    - get_download_cache
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import requests
+from fsspec.spec import AbstractBufferedFile, AbstractFileSystem
+
+# Set up basic logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Get the absolute path to the project root
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CACHE_DIR = PROJECT_ROOT / 'data' / 'download_cache'
+# Size of the blocks in which the files are fetched and stored
+BLOCK_SIZE = 4 * 2**20
+# Number of seconds during which a cached file is used without asking the server if it changed
+REVALIDATE_AFTER = 60
+# Response headers identifying the version of a file, by their name in the cache metadata
+VALIDATORS = {'etag': 'ETag', 'last_modified': 'Last-Modified'}
+
+
+class CachedHTTPFile(AbstractBufferedFile):
+    """
+    Read-only file over a url whose bytes are read from the local cache, the missing blocks being
+    fetched with http range requests. Only the parts of a parquet file the scanner reads (the
+    footer, then the column chunks of the selected columns and row groups) are downloaded.
+    """
+
+    def _fetch_range(self, start: int, end: int) -> bytes:
+        return self.fs.read_range(self.path, start, end)
+
+
+class CachedHTTPFileSystem(AbstractFileSystem):
+    """
+    Read-only fsspec filesystem of http(s) urls backed by a local cache of their content.
+
+    For each url, the cache holds a sparse copy of the file (`<key>.data`) and its metadata
+    (`<key>.json`): the ETag and Last-Modified headers of the version that is cached and the blocks
+    of this version that were already fetched. The version is revalidated with a conditional
+    request (If-None-Match / If-Modified-Since) at most every `revalidate_after` seconds, and the
+    cached blocks are dropped when the file changed on the server. If the server does not answer
+    range requests, or does not give the size of the file (chunked responses), the whole file is
+    downloaded once and cached.
+
+    Args:
+        cache_dir (Path): the folder of the cache
+        block_size (int): the size of the blocks in which the files are fetched
+        revalidate_after (float): the number of seconds during which a cached version is trusted
+        session (Optional[requests.Session]): the http session. Defaults to a new session.
+    """
+
+    protocol = ('http', 'https')
+    cachable = False
+
+    def __init__(
+            self,
+            cache_dir: Path = CACHE_DIR,
+            block_size: int = BLOCK_SIZE,
+            revalidate_after: float = REVALIDATE_AFTER,
+            session: Optional[requests.Session] = None,
+            **kwargs
+            ):
+        super().__init__(**kwargs)
+        self.cache_dir = Path(cache_dir)
+        self.block_size = block_size
+        self.revalidate_after = revalidate_after
+        self.session = session or requests.Session()
+        self.checked_at: dict = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _strip_protocol(cls, path: str) -> str:
+        return path  # urls are kept whole
+
+    def paths(self, url: str) -> Tuple[Path, Path]:
+        """
+        Returns:
+            Path: the sparse copy of the file
+            Path: its metadata
+        """
+        key = hashlib.sha256(url.encode()).hexdigest()[:16]
+        return self.cache_dir / f'{key}.data', self.cache_dir / f'{key}.json'
+
+    def read_entry(self, url: str) -> Optional[dict]:
+        """
+        Returns:
+            Optional[dict]: the metadata of the cached version of `url`, None if nothing is cached
+        """
+        data_path, meta_path = self.paths(url)
+        if not (data_path.is_file() and meta_path.is_file()):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as file:
+            entry = json.load(file)
+        return entry if entry.get('block_size') == self.block_size else None
+
+    def write_entry(self, url: str, entry: dict) -> None:
+        """Save the metadata of the cached version of `url`, through a temporary file"""
+        _, meta_path = self.paths(url)
+        temporary_path = meta_path.with_suffix('.tmp')
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(entry, file)
+        os.replace(temporary_path, meta_path)
+
+    def new_entry(self, url: str, response: requests.Response) -> dict:
+        """
+        Start caching a new version of `url`: the sparse copy is emptied and resized. Without the
+        size of the file in the response, the whole file is downloaded to know it: the body of a
+        GET response is written, a HEAD response is followed by a GET of the whole file.
+
+        Args:
+            url (str): the url of the file
+            response (requests.Response): a response of the server for this version
+
+        Returns:
+            dict: the metadata of the new version, with no block fetched yet, or every block when
+                the whole file was downloaded
+        """
+        size = response.headers.get('Content-Range', '').rpartition('/')[2]
+        if not size.isdigit():
+            size = response.headers.get('Content-Length', '')
+        entry = {
+            'url': url,
+            'size': int(size) if size.isdigit() else None,
+            **{name: response.headers.get(header) for name, header in VALIDATORS.items()},
+            'block_size': self.block_size,
+            'blocks': [],
+        }
+        data_path, _ = self.paths(url)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if entry['size'] is None:
+            return self.download_whole(url, entry, response)
+        with open(data_path, 'wb') as file:
+            file.truncate(entry['size'])
+        self.write_entry(url, entry)
+        logging.info("New version of %s cached in %s", url, data_path)
+        return entry
+
+    def download_whole(self, url: str, entry: dict, response: requests.Response) -> dict:
+        """
+        Cache the whole file of a new version whose size is unknown, and record the size of what
+        was downloaded.
+
+        Args:
+            url (str): the url of the file
+            entry (dict): the metadata of the new version, without its size
+            response (requests.Response): the response that did not give the size, a GET response
+                holding the file or a HEAD response
+
+        Returns:
+            dict: the metadata of the new version, with every block fetched
+        """
+        data_path, _ = self.paths(url)
+        if response.request is not None and response.request.method == 'GET':
+            chunks: Iterator[bytes] = iter([response.content])
+        else:
+            response = self.session.get(url, headers={'Accept-Encoding': 'identity'}, stream=True)
+            response.raise_for_status()
+            entry.update({
+                name: response.headers.get(header) for name, header in VALIDATORS.items()
+                })
+            chunks = response.iter_content(self.block_size)
+        size = 0
+        with open(data_path, 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                size += len(chunk)
+        entry['size'] = size
+        entry['blocks'] = list(range(-(-size // self.block_size)))
+        self.write_entry(url, entry)
+        logging.info("%s downloaded in full (%d bytes, size not given) to %s", url, size, data_path)
+        return entry
+
+    def entry(self, url: str) -> dict:
+        """
+        Returns:
+            dict: the metadata of the cached version of `url`, revalidated with the server if it
+                was not checked for `revalidate_after` seconds
+        """
+        with self._lock:
+            entry = self.read_entry(url)
+            checked_since = time.time() - self.checked_at.get(url, 0)
+            if entry is not None and checked_since < self.revalidate_after:
+                return entry
+            headers = {'Accept-Encoding': 'identity'}
+            if entry is not None and entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry is not None and entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+            response = self.session.head(url, headers=headers, allow_redirects=True)
+            self.checked_at[url] = time.time()
+            if response.status_code == 304:
+                return entry
+            response.raise_for_status()
+            if entry is not None and all(
+                    entry[name] == response.headers.get(header)
+                    for name, header in VALIDATORS.items()
+                    ):
+                return entry  # server ignoring the conditional headers of HEAD requests
+            return self.new_entry(url, response)
+
+    def missing_ranges(self, entry: dict, start: int, end: int) -> Iterator[Tuple[int, int]]:
+        """
+        Yields:
+            Tuple[int, int]: the first and last+1 missing blocks covering bytes `start` to `end`,
+                merged into consecutive runs so that each run is fetched with one request
+        """
+        fetched = set(entry['blocks'])
+        first = None
+        last_block = (end - 1) // self.block_size + 1
+        for block in range(start // self.block_size, last_block):
+            if block not in fetched and first is None:
+                first = block
+            elif block in fetched and first is not None:
+                yield first, block
+                first = None
+        if first is not None:
+            yield first, last_block
+
+    def fetch_blocks(self, url: str, entry: dict, first: int, last: int) -> dict:
+        """
+        Download blocks `first` to `last` (excluded) of the cached version of `url` with a range
+        request and write them to the sparse copy. If-Range makes the server send the whole new
+        version if the file changed meanwhile, which is then cached instead.
+
+        Returns:
+            dict: the metadata of the cached version, updated
+        """
+        start = first * self.block_size
+        end = min(last * self.block_size, entry['size'])
+        headers = {'Range': f'bytes={start}-{end - 1}', 'Accept-Encoding': 'identity'}
+        if entry['etag'] or entry['last_modified']:
+            headers['If-Range'] = entry['etag'] or entry['last_modified']
+        response = self.session.get(url, headers=headers)
+        response.raise_for_status()
+        data_path, _ = self.paths(url)
+        if response.status_code == 206:
+            with open(data_path, 'r+b') as file:
+                file.seek(start)
+                file.write(response.content)
+            entry['blocks'] = sorted(set(entry['blocks']) | set(range(first, last)))
+            logging.info("%d bytes of %s fetched", end - start, url)
+        else:  # no range support, or a new version: the whole file was sent
+            if any(entry[name] != response.headers.get(header)
+                   for name, header in VALIDATORS.items()):
+                entry = self.new_entry(url, response)
+                if len(entry['blocks']):  # downloaded in full by `new_entry`
+                    return entry
+            with open(data_path, 'r+b') as file:
+                file.write(response.content)
+            entry['blocks'] = list(range(-(-entry['size'] // self.block_size)))
+            logging.info("%s downloaded in full (%d bytes)", url, len(response.content))
+        self.write_entry(url, entry)
+        return entry
+
+    def read_range(self, url: str, start: int, end: int) -> bytes:
+        """
+        Returns:
+            bytes: bytes `start` to `end` (excluded) of the file, from the cache once the missing
+                blocks are fetched
+        """
+        entry = self.entry(url)
+        end = min(end, entry['size'])
+        if start >= end:
+            return b''
+        with self._lock:
+            entry = self.read_entry(url) or entry
+            for first, last in list(self.missing_ranges(entry, start, end)):
+                entry = self.fetch_blocks(url, entry, first, last)
+        data_path, _ = self.paths(url)
+        with open(data_path, 'rb') as file:
+            file.seek(start)
+            return file.read(end - start)
+
+    def info(self, path: str, **kwargs) -> dict:
+        entry = self.entry(path)
+        return {
+            'name': path,
+            'size': entry['size'],
+            'type': 'file',
+            'ETag': entry['etag'],
+            'LastModified': entry['last_modified'],
+        }
+
+    def ls(self, path: str, detail: bool = True, **kwargs):
+        info = self.info(path)
+        return [info] if detail else [path]
+
+    def modified(self, path: str) -> datetime:
+        last_modified = self.entry(path)['last_modified']
+        if last_modified is None:
+            raise NotImplementedError(f"The server gives no modification time for {path}")
+        return parsedate_to_datetime(last_modified)
+
+    @property
+    def fsid(self) -> str:
+        return f'cached-http-{self.cache_dir}'
+
+    # the cache is read-only, and the servers give no creation time nor signed urls
+
+    def created(self, path: str) -> datetime:
+        raise NotImplementedError("The servers give no creation time")
+
+    def sign(self, path: str, expiration: int = 100, **kwargs) -> str:
+        raise NotImplementedError("The download cache does not sign urls")
+
+    def cp_file(self, path1: str, path2: str, **kwargs) -> None:
+        raise NotImplementedError("The download cache is read-only")
+
+    def _rm(self, path: str) -> None:
+        raise NotImplementedError("The download cache is read-only")
+
+    # the signature of `AbstractFileSystem._open`
+    def _open(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+            self,
+            path: str,
+            mode: str = 'rb',
+            block_size: Optional[int] = None,
+            autocommit: bool = True,
+            cache_options: Optional[dict] = None,
+            **kwargs
+            ) -> CachedHTTPFile:
+        if mode != 'rb' or not autocommit:
+            raise NotImplementedError("The download cache is read-only")
+        size = self.info(path)['size']
+        return CachedHTTPFile(
+            self, path, mode, block_size=self.block_size, cache_type='none', size=size
+            )
+
+
+@lru_cache(maxsize=None)
+def get_download_cache() -> CachedHTTPFileSystem:
+    """
+    Returns:
+        CachedHTTPFileSystem: The download cache shared by the whole process, stored in the
+            data folder of the project.
+    """
+    return CachedHTTPFileSystem(CACHE_DIR)
@@ -0,0 +1,72 @@
+"""
+Module that parses ISO 8601 durations of a whole column at once with pyarrow compute functions.
+includes :
+    - extract_number
+    - readable
+    - parse_durations
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Integer type of the durations in minutes
+MINUTES_DTYPE = 'int32'
+
+
+def extract_number(durations: pa.Array, unit: str) -> pa.Array:
+    """
+    Extract the first number followed by `unit`, as `re.search(r'(\\d+)H', duration)` does in
+    `iso_to_minutes` and `format_duration`.
+
+    Args:
+        durations (pa.Array): durations in ISO 8601 format (example: 'PT1H30M')
+        unit (str): 'H' or 'M'
+
+    Returns:
+        pa.Array: the numbers as integers, null when there is none
+    """
+    number = pc.struct_field(pc.extract_regex(durations, rf'^(?:.*?(?P<n>\d+){unit})?'), [0])
+    return pc.cast(pc.if_else(pc.equal(number, ''), None, number), pa.int64())
+
+
+def readable(numbers: pa.Array, unit: str) -> pa.Array:
+    """
+    Args:
+        numbers (pa.Array): numbers of hours or minutes, null when absent
+        unit (str): the unit appended to each number
+
+    Returns:
+        pa.Array: the numbers followed by their unit, empty strings when absent
+    """
+    return pc.fill_null(pc.binary_join_element_wise(pc.cast(numbers, pa.string()), unit, ''), '')
+
+
+def parse_durations(durations: pd.Series) -> pd.DataFrame:
+    """
+    Vectorized version of `iso_to_minutes` and `format_duration`: the column is parsed in a single
+    pass per unit, which gives both the duration in minutes and its readable format. A duration
+    whose minutes do not fit in `MINUTES_DTYPE` raises a `pa.ArrowInvalid` error.
+
+    Args:
+        durations (pd.Series): durations in ISO 8601 format (example: 'PT1H30M')
+
+    Returns:
+        pd.DataFrame: with the same index as `durations` and 2 columns:
+            - minutes: the duration in minutes (example: 90)
+            - text: the readable duration (example: '1 h 30 min')
+    """
+    array = pa.array(durations, type=pa.string())
+    hours, minutes = extract_number(array, 'H'), extract_number(array, 'M')
+    # checked arithmetic and cast: a corrupt duration raises instead of wrapping to negative minutes
+    total = pc.add_checked(
+        pc.multiply_checked(pc.fill_null(hours, 0), 60), pc.fill_null(minutes, 0)
+        )
+    total = pc.cast(total, MINUTES_DTYPE, safe=True)
+    text = pc.utf8_trim(
+        pc.binary_join_element_wise(readable(hours, ' h'), readable(minutes, ' min'), ' '), ' '
+        )
+    return pd.DataFrame({
+        'minutes': total.to_numpy(),
+        'text': text.to_numpy(zero_copy_only=False).astype(object),
+    }, index=durations.index)
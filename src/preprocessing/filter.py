@@ -3,21 +3,49 @@ Module that creates columns used for streamlit filters.
 includes :
     - categorize_duration
     - assign_category
+    - assign_categories
     - is_non_vegetarian
     - find_world_cuisine
+    - add_filter_columns
+    - filter_world_cuisine
     - data_filter
 """
 
 import logging
 import re
 import time
-from typing import List
+from typing import List, Optional
 
 import pandas as pd
+from src.preprocessing.keyword_matcher import KeywordMatcher
+from src.preprocessing.profiling import profile
 
 # Set up basic logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Patterns used to assign a category to a recipe, by order of priority
+CATEGORY_PATTERNS = {
+    'Main Course': r'lunch|meal|meat|chicken|beef|pork|steak|turkey|duck|fish|salmon|lamb|crab|\
+            shrimp|lobster|tuna|vegetable|potato|rice|noodle|pasta|penne|spaghetti|macaroni\
+            |linguine|pizza|quiche|lentil|tofu|onion|soup|stew|dressing',
+    'Breakfast': r'breakfast',
+    'Dessert': r'dessert|cake|cookie|brownie|muffin|biscuit|babka|sweet|candy|sugar|banana',
+    'Beverages': r'beverage|cocktail|smoothie|lemonade|coffee',
+}
+# Columns searched for the patterns, by order of priority
+CATEGORY_SOURCES = ['RecipeCategory', 'Keywords', 'title']
+# Ingredients keywords of non-vegetarian recipes
+NON_VEG_KEYWORDS = {
+    'meat', 'chicken', 'beef', 'pork', 'bacon', 'ham', 'steak', 'scallop', 'tilapia', 'anchovy',
+    'sausage', 'lamb', 'duck', 'goose', 'lobster', 'shrimp', 'prawn', 'crab', 'halibut', 'cod',
+    'squid', 'octopus', 'calamari', 'oyster', 'mussel', 'clam', 'snail', 'seafood', 'anchovies',
+    'prosciutto', 'salami', 'pepperoni', 'pancetta', 'chorizo', 'andouille', 'pate', 'haddock',
+    'veal', 'venison', 'game', 'poultry', 'turkey', 'bison', 'boar', 'fish', 'tuna', 'salmon',
+}
+NON_VEG_MATCHER = KeywordMatcher(NON_VEG_KEYWORDS)
+# A world cuisine is kept if it has more recipes than this in the dataset
+MIN_CUISINE_COUNT = 10
+
 
 def categorize_duration(total_minutes: float) -> str:
     """
@@ -52,16 +80,8 @@ def assign_category(row: pd.Series) -> str:
                         'Main Course', 'Breakfast', 'Dessert', 'Beverages'
              If no match is found, returns 'Other'
     """
-    patterns = {
-        'Main Course': r'lunch|meal|meat|chicken|beef|pork|steak|turkey|duck|fish|salmon|lamb|crab|\
-            shrimp|lobster|tuna|vegetable|potato|rice|noodle|pasta|penne|spaghetti|macaroni\
-            |linguine|pizza|quiche|lentil|tofu|onion|soup|stew|dressing',
-        'Breakfast': r'breakfast',
-        'Dessert': r'dessert|cake|cookie|brownie|muffin|biscuit|babka|sweet|candy|sugar|banana',
-        'Beverages': r'beverage|cocktail|smoothie|lemonade|coffee',
-    }
     # Check the RecipeCategory, Keywords and title for patterns
-    for source in ['RecipeCategory', 'Keywords', 'title']:
+    for source in CATEGORY_SOURCES:
         value = row[source]
         if value is not None and isinstance(value, (str, list)):
             text = (
@@ -69,12 +89,60 @@ def assign_category(row: pd.Series) -> str:
                 if isinstance(value, list)
                 else value
             )
-            for category, pattern in patterns.items():
+            for category, pattern in CATEGORY_PATTERNS.items():
                 if re.search(pattern, text.lower()):
                     return category
     return 'Other'
 
 
+def source_text(values: pd.Series) -> pd.Series:
+    """
+    Build the lowercase text searched by `assign_category` for a whole column: strings are kept,
+    lists are joined with spaces and any other value is set to None.
+
+    Args:
+        values (pd.Series): a RecipeCategory, Keywords or title column
+
+    Returns:
+        pd.Series: the lowercase text of each row, or None
+    """
+    return values.map(
+        lambda value: ' '.join([str(v) for v in value if v is not None]).lower()
+        if isinstance(value, list)
+        else value.lower()
+        if isinstance(value, str)
+        else None
+    )
+
+
+def assign_categories(df: pd.DataFrame) -> pd.Series:
+    """
+    Columnar version of `assign_category`, giving the same labels. Each pattern is compiled once
+    and searched over a whole source column, only for the rows that are not assigned yet, so the
+    priority order is kept: the first source with a match wins, then the first matching category.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the RecipeCategory, Keywords and title columns
+
+    Returns:
+        pd.Series: The assigned category of each recipe, 'Other' if no pattern matched
+    """
+    compiled = {category: re.compile(pattern) for category, pattern in CATEGORY_PATTERNS.items()}
+    labels = pd.Series('Other', index=df.index, dtype=object)
+    unassigned = pd.Series(True, index=df.index)
+    for source in CATEGORY_SOURCES:
+        text = source_text(df[source])
+        for category, regex in compiled.items():
+            todo = unassigned & text.notna()
+            if not todo.any():
+                break
+            match = text[todo].str.contains(regex)
+            hits = match.index[match.to_numpy(dtype=bool)]
+            labels[hits] = category
+            unassigned[hits] = False
+    return labels
+
+
 def is_non_vegetarian(ingredient_list: List[str]) -> bool:
     """
     Checks if any non-vegetarian keyword is present in the list of ingredients
@@ -85,17 +153,7 @@ def is_non_vegetarian(ingredient_list: List[str]) -> bool:
     Returns:
         bool: True if any non-vegetarian keyword is found, False otherwise
     """
-    non_veg_keywords = {
-        'meat', 'chicken', 'beef', 'pork', 'bacon', 'ham', 'steak', 'scallop', 'tilapia', 'anchovy',
-        'sausage', 'lamb', 'duck', 'goose', 'lobster', 'shrimp', 'prawn', 'crab', 'halibut', 'cod',
-        'squid', 'octopus', 'calamari', 'oyster', 'mussel', 'clam', 'snail', 'seafood', 'anchovies',
-        'prosciutto', 'salami', 'pepperoni', 'pancetta', 'chorizo', 'andouille', 'pate', 'haddock',
-        'veal', 'venison', 'game', 'poultry', 'turkey', 'bison', 'boar', 'fish', 'tuna', 'salmon',
-    }
-    for ingredient in ingredient_list:
-        if any(keyword in str(ingredient).lower() for keyword in non_veg_keywords):
-            return True
-    return False
+    return any(NON_VEG_MATCHER.search(str(ingredient).lower()) for ingredient in ingredient_list)
 
 
 def find_world_cuisine(keywords: List[str]) -> str:
@@ -126,6 +184,57 @@ def find_world_cuisine(keywords: List[str]) -> str:
     return 'Unknown'
 
 
+def add_filter_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Create the columns for streamlit filters that only depend on each row, and remove the recipes
+    of type 'Other'. Can be applied to separate shards of the dataset.
+
+    Args:
+        df (pd.DataFrame): the merged and processed Dataframe
+
+    Returns:
+        pd.DataFrame: DataFrame with new columns
+    """
+    with profile('TotalTime_cat', len(df)):
+        df.loc[:, 'TotalTime_cat'] = df['TotalTime_minutes'].apply(categorize_duration)
+    with profile('RecipeType', len(df)) as step:
+        df.loc[:, 'RecipeType'] = assign_categories(df)
+        df = df[df['RecipeType'] != 'Other'].reset_index(drop=True)
+        step['rows_out'] = len(df)
+    with profile('Beginner_Friendly', len(df)):
+        df.loc[:, 'Beginner_Friendly'] = df['Keywords'].apply(lambda x: '#Easy' in x)
+    with profile('Vegetarian_Friendly', len(df)):
+        df.loc[:, 'Vegetarian_Friendly'] = ~NON_VEG_MATCHER.any_in_lists(df['ingredients'])
+    with profile('World_Cuisine', len(df)):
+        df.loc[:, 'World_Cuisine'] = df['Keywords'].apply(find_world_cuisine)
+    return df
+
+
+def filter_world_cuisine(
+        df: pd.DataFrame, min_count: int = MIN_CUISINE_COUNT, counts: Optional[pd.Series] = None
+        ) -> pd.DataFrame:
+    """
+    Keep only the recipes of the world cuisines with more than `min_count` recipes in the whole
+    dataset.
+
+    Args:
+        df (pd.DataFrame): DataFrame with the World_Cuisine column
+        min_count (int): the number of recipes a world cuisine must exceed
+        counts (Optional[pd.Series]): the number of recipes of each world cuisine in the whole
+            dataset, when `df` is only a part of it. Defaults to None, the recipes of `df` are
+            counted.
+
+    Returns:
+        pd.DataFrame: DataFrame without the recipes of rare world cuisines
+    """
+    with profile('filter_world_cuisine', len(df)) as step:
+        if counts is None:
+            counts = df['World_Cuisine'].value_counts()
+        df = df[df['World_Cuisine'].isin(counts[counts > min_count].index)]
+        step['rows_out'] = len(df)
+    return df
+
+
 def data_filter(df: pd.DataFrame) -> pd.DataFrame:
     """
     Create columns for streamlit filters
@@ -137,13 +246,8 @@ def data_filter(df: pd.DataFrame) -> pd.DataFrame:
         pd.DataFrame: DataFrame with new columns
     """
     start_time = time.time()
-    df.loc[:, 'TotalTime_cat'] = df['TotalTime_minutes'].apply(categorize_duration)
-    df.loc[:, 'RecipeType'] = df.apply(assign_category, axis=1)
-    df = df[df['RecipeType'] != 'Other'].reset_index(drop=True)
-    df.loc[:, 'Beginner_Friendly'] = df['Keywords'].apply(lambda x: '#Easy' in x)
-    df.loc[:, 'Vegetarian_Friendly'] = ~df['ingredients'].apply(is_non_vegetarian)
-    df.loc[:, 'World_Cuisine'] = df['Keywords'].apply(find_world_cuisine)
-    df = df[df['World_Cuisine'].isin(df['World_Cuisine'].value_counts()[lambda x: x > 10].index)]
-    logging.info("Nutrition data set loaded in --- %s seconds ---", (time.time() - start_time))
+    df = add_filter_columns(df)
+    df = filter_world_cuisine(df)
+    logging.info("Filter columns created in --- %s seconds ---", (time.time() - start_time))
 
     return df
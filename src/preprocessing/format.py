@@ -3,8 +3,12 @@ Module that processes the data.
 includes :
     - handle_type
     - handle_na
+    - parse_list
+    - format_cell
     - text_formating
+    - log_fallbacks
     - rm_outliers
+    - outliers_expression
     - iso_to_minutes
     - format_duration
     - to_singular
@@ -12,20 +16,31 @@ includes :
 """
 
 import ast
+import json
 import logging
 import re
 import time
-from typing import List
+from collections import Counter
+from typing import Any, List
 
-import inflect
 import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
+from src.preprocessing.durations import parse_durations
+from src.preprocessing.profiling import profile
+from src.preprocessing.singularizer import get_singularizer
 
 # Set up basic logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Global instance of inflect.engine()
-inflect_engine = inflect.engine()
+# Escapes read differently by JSON and Python: '\\/' and surrogate pairs
+JSON_UNSAFE_ESCAPES = re.compile(r'\\(?:/|u[dD][89abAB])')
+# Number of list-like cells per column that had to be parsed with ast.literal_eval
+FALLBACK_CELLS: Counter = Counter()
+
+# Bounds used to remove outliers
+MAX_CALORIES = 1500
+MAX_SERVINGS = 72
 
 
 def handle_type(
@@ -88,11 +103,64 @@ def handle_na(
     return df
 
 
+def parse_list(value: str, col: str) -> list:
+    """
+    Parse a string that looks like a list. Most cells are JSON-compatible (e.g. '["1 cup flour", "2 eggs"]')
+    and are parsed with `json.loads`, which is much faster than `ast.literal_eval`. The other cells,
+    and the ones with escapes that JSON and Python do not read the same way, fall back to
+    `ast.literal_eval` and are counted in `FALLBACK_CELLS`.
+
+    Parameters:
+    value (str): A string starting with '[' and ending with ']'.
+    col (str): The name of the column of the cell, used to count fallbacks.
+
+    Returns:
+    list: The parsed list, as `ast.literal_eval` would return it.
+    """
+    if '\\' not in value or not JSON_UNSAFE_ESCAPES.search(value):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    FALLBACK_CELLS[col] += 1
+    return ast.literal_eval(value)
+
+
+def format_cell(value: Any, col: str, clean: bool) -> Any:
+    """
+    Format one cell of a textual column: strings that look like lists are parsed, other strings
+    are put in a list, None items of lists are replaced by NaN and, if `clean`, the instructions
+    are split into sentences.
+
+    Parameters:
+    value (Any): The cell to format.
+    col (str): The name of the column of the cell.
+    clean (bool): Whether the cell holds instructions to split into sentences.
+
+    Returns:
+    Any: The formatted cell, a list when the value could be formatted.
+    """
+    if isinstance(value, str):
+        value = parse_list(value, col) if value.startswith('[') and value.endswith(']') else [value]
+    if isinstance(value, (list, np.ndarray)):
+        value = [np.nan if item is None else item for item in value]
+    if clean:
+        if not isinstance(value, list):
+            return np.nan
+        return [
+            instr.strip() + '.'
+            for instr in ' '.join([str(item) for item in value]).split('.')
+            if instr.strip()
+        ]
+    return value
+
+
 def text_formating(df: pd.DataFrame, cols: List) -> pd.DataFrame:
     """
     This function ensures that textual variables in the specified columns are properly formatted.
     It handles cases where textual data is improperly represented, such as strings that look like lists of strings
-    or lists of unbroken strings, and formats them consistently.
+    or lists of unbroken strings, and formats them consistently. Each column is formatted in a
+    single pass with `format_cell`.
 
     Parameters:
     df (pd.DataFrame): The input DataFrame containing textual columns to format.
@@ -102,35 +170,23 @@ def text_formating(df: pd.DataFrame, cols: List) -> pd.DataFrame:
     pd.DataFrame: The DataFrame with the specified columns properly formatted.
     """
     for col in cols:
-        # First, ensure that any non-list or non-array type values are converted into a list
-        df[col] = df[col].apply(
-            lambda x: ast.literal_eval(x)
-            if isinstance(x, str) and x.startswith('[') and x.endswith(']')
-            else [x]
-            if isinstance(x, str)
-            else x
-        )
+        clean = col in ('RecipeInstructions', 'directions')
+        with profile(f'format {col}', len(df)):
+            df[col] = df[col].map(lambda value: format_cell(value, col, clean))
 
-        # Then ensure that if it's a list (or ndarray), we check for None values and replace with NaN if necessary
-        df[col] = df[col].apply(
-            lambda x: [np.nan if item is None else item for item in x]
-            if isinstance(x, (list, np.ndarray))
-            else x
-            )
+    return df
 
-        # Then clean
-        if col in ('RecipeInstructions', 'directions'):
-            df[col] = df[col].apply(
-                lambda x: [
-                    instr.strip() + '.'
-                    for instr in ' '.join([str(item) for item in x]).split('.')
-                    if instr.strip()
-                ]
-                if isinstance(x, list)
-                else np.nan
-            )
 
-    return df
+def log_fallbacks(before: Counter) -> None:
+    """
+    Log the number of cells per column parsed with `ast.literal_eval` since `before` was copied
+    from `FALLBACK_CELLS`, to keep an eye on the quality of the raw data.
+
+    Parameters:
+    before (Counter): A copy of `FALLBACK_CELLS`.
+    """
+    for col, count in (FALLBACK_CELLS - before).items():
+        logging.info("%d cells of %s could not be parsed as JSON", count, col)
 
 
 def rm_outliers(df: pd.DataFrame) -> pd.DataFrame:
@@ -143,10 +199,24 @@ def rm_outliers(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
     pd.DataFrame: The DataFrame with rows containing outliers removed based on predefined rules.
     """
-    df = df[(df['Calories'] > 0) & (df['Calories'] <= 1500) & (df['RecipeServings'] <= 72)]
+    df = df[
+        (df['Calories'] > 0) & (df['Calories'] <= MAX_CALORIES) & (df['RecipeServings'] <= MAX_SERVINGS)
+        ]
     return df
 
 
+def outliers_expression() -> ds.Expression:
+    """
+    Build the pyarrow dataset filter keeping the same rows as `rm_outliers`, so that the outliers
+    can be removed by the parquet scanner itself (missing values do not pass the filter, as in pandas).
+
+    Returns:
+    ds.Expression: The filter expression on the 'Calories' and 'RecipeServings' columns.
+    """
+    calories, servings = ds.field('Calories'), ds.field('RecipeServings')
+    return (calories > 0) & (calories <= MAX_CALORIES) & (servings <= MAX_SERVINGS)
+
+
 def iso_to_minutes(iso_duration: str) -> float:
     """
     Convert ISO 8601 durations to total minutes.
@@ -184,7 +254,8 @@ def format_duration(duration: str) -> str:
 
 def to_singular(ingredients_list: List[str]) -> List[str]:
     """
-    Convert a list of ingredient names from plural to singular.
+    Convert a list of ingredient names from plural to singular, with the shared singularizer
+    which caches the ingredient names already seen.
 
     Args:
         ingredient_list (List[str]): A list of ingredient names
@@ -194,10 +265,8 @@ def to_singular(ingredients_list: List[str]) -> List[str]:
         Words that are already singular or unrecognized remain unchanged.
     """
     if isinstance(ingredients_list, list):
-        return [
-            inflect_engine.singular_noun(ingredient) or ingredient
-            for ingredient in ingredients_list
-            ]
+        singularizer = get_singularizer()
+        return [singularizer.singular(ingredient) for ingredient in ingredients_list]
     return ingredients_list
 
 
@@ -212,30 +281,39 @@ def data_preprocessing(df: pd.DataFrame) -> pd.DataFrame:
         pd.DataFrame: The cleaned and processed DataFrame.
     """
     start_time = time.time()
-    df['CookTime'] = df['CookTime'].fillna('PT0M')
-    df = df.dropna()
-
-    # Create new time variables
-    for col in ['CookTime', 'PrepTime', 'TotalTime']:
-        df.loc[:, f'{col}_minutes'] = df[col].apply(iso_to_minutes)
-    df = df[df['TotalTime_minutes'] > 0]
+    with profile('dropna', len(df)) as step:
+        df['CookTime'] = df['CookTime'].fillna('PT0M')
+        df = df.dropna()
+        step['rows_out'] = len(df)
 
-    # Convert durations to a more readable format
+    # Create new time variables and convert durations to a more readable format
     for col in ['CookTime', 'PrepTime', 'TotalTime']:
-        df.loc[:, col] = df[col].apply(format_duration)
+        with profile(col, len(df)):
+            durations = parse_durations(df[col])
+            df.loc[:, f'{col}_minutes'] = durations['minutes']
+            df.loc[:, col] = durations['text']
+    with profile('TotalTime_minutes', len(df)) as step:
+        df = df[df['TotalTime_minutes'] > 0]
+        step['rows_out'] = len(df)
 
     # Convert ingredients to singular form
-    df.loc[:, 'NER'] = df['NER'].apply(to_singular)
+    with profile('NER', len(df)):
+        df.loc[:, 'NER'] = df['NER'].apply(to_singular)
 
     # Add '#' before each keyword not nan
-    df = df[df['Keywords'].apply(lambda x: not any(val == 'nan.' for val in x))]
-    df.loc[:, 'Keywords'] = df['Keywords'].apply(lambda keywords: [f'#{word}' for word in keywords])
+    with profile('Keywords', len(df)) as step:
+        df = df[df['Keywords'].apply(lambda x: not any(val == 'nan.' for val in x))]
+        df.loc[:, 'Keywords'] = df['Keywords'].apply(
+            lambda keywords: [f'#{word}' for word in keywords]
+            )
+        step['rows_out'] = len(df)
 
     # keep only one image link per recipe
-    df.loc[:, 'Images'] = df['Images'].apply(lambda x: x[0])
+    with profile('Images', len(df)):
+        df.loc[:, 'Images'] = df['Images'].apply(lambda x: x[0])
 
     # create recipe_id
     df['recipe_id'] = df.index
 
-    logging.info("Nutrition data set cleaned in --- %s seconds ---", (time.time() - start_time))
+    logging.info("Merged data set preprocessed in --- %s seconds ---", (time.time() - start_time))
     return df
@@ -0,0 +1,197 @@
+"""
+Module that upserts new or changed recipes into the final dataset without processing the whole
+raw datasets again. Next to the dataset, it keeps the number of recipes of each world cuisine and
+the recipes of the cuisines that are still too rare to be kept, so that the world cuisine cut-off
+can be recomputed from the counts when recipes are added.
+includes :
+    - state_paths
+    - split_rare_cuisines
+    - write_state
+    - concat_recipes
+    - read_state
+    - read_current
+    - assign_recipe_ids
+    - upsert
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from src.preprocessing.filter import MIN_CUISINE_COUNT, filter_world_cuisine
+from src.preprocessing.keys import fingerprint, same_keys
+from src.preprocessing.schema import from_output_table, read_output, to_output_table
+
+# Set up basic logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Columns identifying a recipe across runs: its name (merged with `title`) and its author
+KEY_COLUMNS = ['title', 'AuthorName']
+
+
+def state_paths(dataset_path: Path) -> Tuple[Path, Path]:
+    """
+    Args:
+        dataset_path (Path): the parquet file or folder of the final dataset
+
+    Returns:
+        Path: the JSON file of the number of recipes of each world cuisine
+        Path: the parquet file of the recipes of the rare world cuisines
+    """
+    return Path(f'{dataset_path}.cuisines.json'), Path(f'{dataset_path}.rare.parquet')
+
+
+def split_rare_cuisines(
+        df: pd.DataFrame, counts: pd.Series, min_count: int = MIN_CUISINE_COUNT
+        ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Args:
+        df (pd.DataFrame): the recipes with the filter columns, with a unique index
+        counts (pd.Series): the number of recipes of each world cuisine in the whole dataset
+        min_count (int): the number of recipes a world cuisine must exceed to be kept
+
+    Returns:
+        pd.DataFrame: the recipes kept, the output of `filter_world_cuisine`
+        pd.DataFrame: the recipes of the rare world cuisines
+    """
+    kept = filter_world_cuisine(df, min_count, counts)
+    return kept, df[~df.index.isin(kept.index)]
+
+
+def write_state(dataset_path: Path, counts: pd.Series, rare: pd.DataFrame) -> None:
+    """
+    Save the number of recipes of each world cuisine and the recipes of the rare world cuisines
+    next to the final dataset.
+
+    Args:
+        dataset_path (Path): the parquet file or folder of the final dataset
+        counts (pd.Series): the number of recipes of each world cuisine, rare ones included
+        rare (pd.DataFrame): the recipes of the rare world cuisines
+    """
+    counts_path, rare_path = state_paths(dataset_path)
+    os.makedirs(counts_path.parent, exist_ok=True)
+    counts = {str(cuisine): int(count) for cuisine, count in counts.items() if count > 0}
+    with open(counts_path, 'w', encoding='utf-8') as file:
+        json.dump(counts, file, indent=2, sort_keys=True)
+    pq.write_table(to_output_table(rare), rare_path)
+    logging.info("World cuisine counts and %d rare cuisine recipes saved", len(rare))
+
+
+def concat_recipes(*dfs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns:
+        pd.DataFrame: the rows of the DataFrames, with a new index. The empty ones are left out, so
+            that they do not change the types of the columns.
+    """
+    return pd.concat([df for df in dfs if len(df)] or dfs[:1], ignore_index=True)
+
+
+def read_state(dataset_path: Path) -> Optional[Tuple[pd.Series, pd.DataFrame]]:
+    """
+    Args:
+        dataset_path (Path): the parquet file or folder of the final dataset
+
+    Returns:
+        Optional[Tuple[pd.Series, pd.DataFrame]]: the number of recipes of each world cuisine and
+            the recipes of the rare world cuisines, None if they were not saved
+    """
+    counts_path, rare_path = state_paths(dataset_path)
+    if not (counts_path.is_file() and rare_path.is_file()):
+        return None
+    with open(counts_path, 'r', encoding='utf-8') as file:
+        counts = pd.Series(json.load(file), dtype='int64')
+    return counts, read_output(rare_path)
+
+
+def read_current(dataset_path: Path) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Load every recipe of the last version of the dataset: the final dataset and the recipes of the
+    rare world cuisines. Without saved counts (dataset written by an older version of the
+    pipeline), the cuisines are counted on the final dataset and the recipes of the rare ones
+    are missing.
+
+    Args:
+        dataset_path (Path): the parquet file or folder of the final dataset
+
+    Returns:
+        pd.DataFrame: the recipes, with compact types (see `read_output`)
+        pd.Series: the number of recipes of each world cuisine
+    """
+    df = read_output(dataset_path)
+    state = read_state(dataset_path)
+    if state is None:
+        logging.warning("No world cuisine counts next to %s, counted on the dataset", dataset_path)
+        return df, df['World_Cuisine'].value_counts()
+    counts, rare = state
+    return concat_recipes(df, rare), counts
+
+
+def assign_recipe_ids(delta: pd.DataFrame, current: pd.DataFrame) -> pd.Series:
+    """
+    Give the recipes of a delta the id of the current recipe with the same name and author, if
+    any, so that the likes of a changed recipe stay valid, and new ids to the new recipes.
+
+    Args:
+        delta (pd.DataFrame): the new or changed recipes
+        current (pd.DataFrame): the recipes of the last version of the dataset
+
+    Returns:
+        pd.Series: the recipe_id of each recipe of `delta`, with its index
+    """
+    current_keys = current[KEY_COLUMNS].astype(object)
+    delta_keys = delta[KEY_COLUMNS].astype(object)
+    positions = pd.Index(fingerprint(current_keys, KEY_COLUMNS)).get_indexer(
+        fingerprint(delta_keys, KEY_COLUMNS)
+        )
+    found = np.flatnonzero(positions >= 0)
+    # a recipe matched by a fingerprint collision is a new recipe
+    same = same_keys(delta_keys.iloc[found], current_keys.iloc[positions[found]])
+    positions[found[~same]] = -1
+    ids = current['recipe_id'].to_numpy(dtype='int64')[positions]
+    new = positions < 0
+    first_id = int(current['recipe_id'].max()) + 1 if len(current) else 0
+    ids[new] = np.arange(first_id, first_id + new.sum())
+    return pd.Series(ids, index=delta.index, name='recipe_id')
+
+
+def upsert(
+        current: pd.DataFrame,
+        delta: pd.DataFrame,
+        counts: pd.Series,
+        min_count: int = MIN_CUISINE_COUNT
+        ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Series]:
+    """
+    Replace the current recipes that have a new version in the delta, add the new ones and apply
+    the world cuisine cut-off to all of them. The counts of the world cuisines are updated with the
+    recipes replaced and added instead of counting every recipe again.
+
+    Args:
+        current (pd.DataFrame): the recipes of the last version of the dataset (see `read_current`)
+        delta (pd.DataFrame): the new or changed recipes, processed by `data_preprocessing` and
+            `add_filter_columns`
+        counts (pd.Series): the number of recipes of each world cuisine in `current`
+        min_count (int): the number of recipes a world cuisine must exceed to be kept
+
+    Returns:
+        pd.DataFrame: the final dataset, sorted by recipe_id
+        pd.DataFrame: the recipes of the rare world cuisines
+        pd.Series: the number of recipes of each world cuisine
+    """
+    delta = delta.assign(recipe_id=assign_recipe_ids(delta, current))
+    delta = from_output_table(to_output_table(delta))
+    replaced = current['recipe_id'].isin(delta['recipe_id'])
+    counts = (
+        counts.sub(current.loc[replaced, 'World_Cuisine'].value_counts(), fill_value=0)
+        .add(delta['World_Cuisine'].value_counts(), fill_value=0)
+        .astype('int64')
+        )
+    counts = counts[counts > 0]
+    logging.info("%d recipes replaced, %d added", replaced.sum(), len(delta) - replaced.sum())
+    df = concat_recipes(current[~replaced], delta).sort_values('recipe_id', ignore_index=True)
+    kept, rare = split_rare_cuisines(df, counts, min_count)
+    return kept.reset_index(drop=True), rare, counts
@@ -0,0 +1,121 @@
+"""
+Module that joins and deduplicates the data sets on 64 bits fingerprints of their key columns
+instead of the key strings, with a check of the fingerprint collisions.
+includes :
+    - fingerprint
+    - same_keys
+    - duplicated_keys
+    - merge_on_keys
+"""
+
+import logging
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# Set up basic logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def fingerprint(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """
+    Hash the key of each row, made of the values of `columns`, into a 64 bits integer. Equal keys
+    always have the same fingerprint, missing values included, so a fingerprint can be compared
+    instead of the strings of the key. Two different keys may have the same fingerprint, which is
+    checked by `same_keys`.
+
+    Args:
+        df (pd.DataFrame): the data set
+        columns (List[str]): the key columns
+
+    Returns:
+        pd.Series: the fingerprints, as unsigned 64 bits integers with the index of `df`
+    """
+    return pd.util.hash_pandas_object(df[columns], index=False)
+
+
+def same_keys(left: pd.DataFrame, right: pd.DataFrame) -> np.ndarray:
+    """
+    Compare the keys of rows with the same fingerprint, in the same way as pandas does: missing
+    values are equal.
+
+    Args:
+        left (pd.DataFrame): the key columns of some rows
+        right (pd.DataFrame): the key columns of the rows with the same fingerprints, in the same
+            order and with the same number of columns
+
+    Returns:
+        np.ndarray: True for the rows whose keys are equal, False for fingerprint collisions
+    """
+    same = np.ones(len(left), dtype=bool)
+    for left_col, right_col in zip(left.columns, right.columns):
+        left_values, right_values = left[left_col].to_numpy(), right[right_col].to_numpy()
+        same &= (left_values == right_values) | (pd.isna(left_values) & pd.isna(right_values))
+    return same
+
+
+def duplicated_keys(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """
+    Same as `df.duplicated(subset=columns)`, computed on the fingerprints of the keys. Each row
+    flagged as a duplicate is checked against the first row with its fingerprint; if a collision is
+    found, the duplicates are computed again on the key strings.
+
+    Args:
+        df (pd.DataFrame): the data set
+        columns (List[str]): the key columns
+
+    Returns:
+        pd.Series: True for the rows whose key is the key of a previous row
+    """
+    keys = fingerprint(df, columns)
+    duplicated = keys.duplicated()
+    first_rows = pd.Series(
+        np.flatnonzero(~duplicated.to_numpy()), index=keys[~duplicated].to_numpy()
+        )
+    firsts = df[columns].iloc[first_rows[keys[duplicated]].to_numpy()]
+    if not same_keys(df.loc[duplicated, columns], firsts).all():
+        logging.warning("Fingerprint collision on %s, duplicates computed on the keys", columns)
+        return df.duplicated(subset=columns)
+    return duplicated
+
+
+def merge_on_keys(
+        left: pd.DataFrame,
+        right: pd.DataFrame,
+        left_keys: pd.DataFrame,
+        right_keys: pd.DataFrame
+        ) -> pd.DataFrame:
+    """
+    Inner join of `left` and `right` on the fingerprints of their keys, which gives the same rows in
+    the same order as `pd.merge(..., how='inner')` on the keys: the rows joined because of a
+    fingerprint collision are removed.
+
+    Args:
+        left (pd.DataFrame): the left data set
+        right (pd.DataFrame): the right data set
+        left_keys (pd.DataFrame): the key columns of the left data set, with its index
+        right_keys (pd.DataFrame): the key columns of the right data set, with its index
+
+    Returns:
+        pd.DataFrame: the columns of `left` then the columns of `right` of the joined rows
+    """
+    left_fingerprints = fingerprint(left_keys, list(left_keys.columns))
+    right_fingerprints = fingerprint(right_keys, list(right_keys.columns))
+    # the row numbers of both sides are joined, then used to check the keys
+    positions = pd.merge(
+        pd.DataFrame({'key': left_fingerprints.to_numpy(), 'left': np.arange(len(left))}),
+        pd.DataFrame({'key': right_fingerprints.to_numpy(), 'right': np.arange(len(right))}),
+        on='key',
+        how='inner'
+        )
+    same = same_keys(
+        left_keys.iloc[positions['left'].to_numpy()], right_keys.iloc[positions['right'].to_numpy()]
+        )
+    if not same.all():
+        logging.warning("%d rows joined by a fingerprint collision were removed", (~same).sum())
+        positions = positions[same]
+    return pd.concat([
+        left.iloc[positions['left'].to_numpy()].reset_index(drop=True),
+        right.iloc[positions['right'].to_numpy()].reset_index(drop=True),
+        ], axis=1)
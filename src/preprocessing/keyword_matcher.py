@@ -0,0 +1,94 @@
+"""
+Module that holds a multi-keyword matcher used to flag recipes from their text columns.
+includes :
+    - KeywordMatcher
+"""
+
+import re
+from typing import Iterable
+
+import pandas as pd
+
+# Separator of the elements of a list when scanned as one text
+SEPARATOR = '\x00'
+
+
+class KeywordMatcher:
+    """
+    Checks whether a text contains any keyword of a set, as a substring.
+
+    The keywords are stored in a trie which is compiled into a single regular expression, so each
+    text is scanned once for all keywords instead of once per keyword. A keyword that extends
+    another one (e.g. 'hamburger' and 'ham') is pruned from the trie since it cannot change the result.
+
+    Args:
+        keywords (Iterable[str]): the lowercase keywords to look for
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = frozenset(keywords)
+        trie: dict = {}
+        for keyword in sorted(self.keywords, key=len):
+            node = trie
+            for char in keyword:
+                if node.get('') is True:  # a shorter keyword already matches
+                    break
+                node = node.setdefault(char, {})
+            else:
+                node.clear()
+                node[''] = True
+        self.regex = re.compile(self._trie_to_pattern(trie)) if trie else None
+
+    @classmethod
+    def _trie_to_pattern(cls, node: dict) -> str:
+        branches = [
+            re.escape(char) + cls._trie_to_pattern(child)
+            for char, child in sorted(node.items())
+            if char != ''
+        ]
+        if not branches:
+            return ''
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    def search(self, text: str) -> bool:
+        """
+        Args:
+            text (str): the lowercase text to scan
+
+        Returns:
+            bool: True if any keyword is found in the text
+        """
+        return self.regex is not None and self.regex.search(text) is not None
+
+    def contains(self, texts: pd.Series) -> pd.Series:
+        """
+        Scan a column of texts in one pass. Texts are converted to lowercase strings first.
+
+        Args:
+            texts (pd.Series): the texts to scan
+
+        Returns:
+            pd.Series: True for the rows where any keyword is found
+        """
+        if self.regex is None:
+            return pd.Series(False, index=texts.index)
+        return texts.astype(str).str.lower().str.contains(self.regex)
+
+    def any_in_lists(self, lists: pd.Series) -> pd.Series:
+        """
+        Scan a column of lists of texts (e.g. the ingredients of each recipe) in one pass: the
+        elements of each list are joined with a separator that no keyword contains, so a keyword
+        is found in the joined text only if it is found in one of the elements.
+
+        Args:
+            lists (pd.Series): the lists of texts to scan
+
+        Returns:
+            pd.Series: True for the rows where any keyword is found in any element of the list
+        """
+        texts = pd.Series(
+            [SEPARATOR.join(map(str, values)) for values in lists], index=lists.index, dtype=object
+            )
+        return self.contains(texts)
@@ -1,41 +1,80 @@
 """
 Module that loads, partially clean and merges the 2 kaggle data sets used in the most eficient way.
 includes :
+    - open_dataset
     - load_nutrition_data
     - load_measurements_data
+    - stream_measurements_data
+    - first_item
     - merge
 """
 
 import logging
 import time
-from pathlib import Path
-from typing import List
+from typing import Any, List, Optional
 
+import fsspec
+import numpy as np
 import pandas as pd
-import yaml
-from src.preprocessing.format import handle_na, rm_outliers, text_formating
+import pyarrow.dataset as ds
+from src.config import get_config
+from src.preprocessing.download_cache import CachedHTTPFileSystem, get_download_cache
+from src.preprocessing.format import (FALLBACK_CELLS, handle_na, log_fallbacks,
+                                      outliers_expression, rm_outliers, text_formating)
+from src.preprocessing.keys import duplicated_keys, fingerprint, merge_on_keys
+from src.preprocessing.profiling import profile
 
 # Set up basic logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Get the absolute path to the project root
-PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
-config_path = PROJECT_ROOT / "utils" / "config.yaml"
+# Hyper parameters of the config, by module attribute: (section, key). They are read from the
+# config when first used (see `__getattr__`).
+CONFIG_PARAMETERS = {
+    'keep_col_nutrition': ('nutrition_data', 'keep_col'),
+    'to_format_nutrition': ('nutrition_data', 'to_format'),
+    'numeric_float_var_nutrition': ('nutrition_data', 'numeric_float_var'),
+    'numeric_int_var_nutrition': ('nutrition_data', 'numeric_int_var'),
+    'list_var_nutrition': ('nutrition_data', 'list_var'),
+    'keep_col_measurements': ('measurements_data', 'keep_col'),
+    'to_format_measurements': ('measurements_data', 'to_format'),
+    'list_var_measurements': ('measurements_data', 'list_var'),
+}
 
-with open(config_path, "r") as file:
-    config = yaml.safe_load(file)
-DATA_DIR = config['DATA_DIR']
+__all__ = ['open_dataset', 'load_nutrition_data', 'load_measurements_data',
+           'stream_measurements_data', 'first_item', 'merge', 'config', 'DATA_DIR',
+           *CONFIG_PARAMETERS]
 
-# initialize hyper parameters
-keep_col_nutrition = config['nutrition_data']['keep_col']
-to_format_nutrition = config['nutrition_data']['to_format']
-numeric_float_var_nutrition = config['nutrition_data']['numeric_float_var']
-numeric_int_var_nutrition = config['nutrition_data']['numeric_int_var']
-list_var_nutrition = config['nutrition_data']['list_var']
 
-keep_col_measurements = config['measurements_data']['keep_col']
-to_format_measurements = config['measurements_data']['to_format']
-list_var_measurements = config['measurements_data']['list_var']
+def __getattr__(name: str) -> Any:
+    """Read the config and the hyper parameters of the module when they are first used"""
+    if name == 'config':
+        return get_config()
+    if name == 'DATA_DIR':
+        return get_config()['DATA_DIR']
+    if name in CONFIG_PARAMETERS:
+        section, key = CONFIG_PARAMETERS[name]
+        return get_config()[section][key]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def open_dataset(data_path: str) -> ds.Dataset:
+    """
+    Open a parquet file (local, s3 or https) as a pyarrow dataset, so that columns projections and
+    row filters can be pushed down to the parquet scanner. Files served over http(s) are read
+    through the local download cache (see `download_cache`), which only fetches the parts of the
+    file that the scanner reads and that are not cached yet.
+
+    Parameters:
+    data_path (str): The path or url to the parquet file.
+
+    Returns:
+    ds.Dataset: The dataset, nothing is read before it is scanned.
+    """
+    if fsspec.utils.get_protocol(data_path) in CachedHTTPFileSystem.protocol:
+        filesystem, path = get_download_cache(), data_path
+    else:
+        filesystem, path = fsspec.core.url_to_fs(data_path)
+    return ds.dataset(path, filesystem=filesystem, format='parquet')
 
 
 def load_nutrition_data(nutrition_data_path: str) -> tuple[pd.DataFrame, list]:
@@ -44,9 +83,13 @@ def load_nutrition_data(nutrition_data_path: str) -> tuple[pd.DataFrame, list]:
         a list of unique recipe names.
 
     Steps involved:
-    1. Loads the dataset from a specified path (`nutrition_data_path`), keeping only the relevant columns.
-    2. Drops duplicate rows based on 'Name' and 'AuthorName'.
-    3. Removes outliers from the data using the `rm_outliers` function.
+    1. Scans the keys ('Name', 'AuthorName') and the outlier columns of the dataset to find the rows
+                that are the first of their 'Name' and 'AuthorName' duplicates.
+    2. Loads the dataset from a specified path (`nutrition_data_path`), keeping only the relevant
+                columns of the rows that pass the `outliers_expression` filter. The filter is
+                pushed down to the parquet scanner, which skips the row groups that cannot match.
+    3. Keeps only the loaded rows that were not duplicates, which gives the same rows as dropping
+                duplicates based on 'Name' and 'AuthorName' then removing outliers.
     4. Formats textual columns (such as 'RecipeInstructions' and 'Keywords') to ensure proper structure.
     5. Handles missing values and ensures proper type conversion for numeric and string columns.
     6. Returns the cleaned DataFrame and a list of unique recipe names.
@@ -58,17 +101,34 @@ def load_nutrition_data(nutrition_data_path: str) -> tuple[pd.DataFrame, list]:
     pd.DataFrame: The cleaned and processed DataFrame.
     list: A list of unique recipe names.
     """
+    parameters = get_config()['nutrition_data']
     # load first data set
     start_time = time.time()
-    df = pd.read_parquet(nutrition_data_path, columns=keep_col_nutrition)
+    with profile('load nutrition') as step:
+        dataset = open_dataset(nutrition_data_path)
+        keys = dataset.to_table(
+            columns=['Name', 'AuthorName', 'Calories', 'RecipeServings']
+            ).to_pandas()
+        first = ~duplicated_keys(keys, ['Name', 'AuthorName'])
+        kept_index = rm_outliers(keys).index
+        df = dataset.to_table(
+            columns=parameters['keep_col'], filter=outliers_expression()
+            ).to_pandas()
+        df.index = kept_index
+        # drop duplicates, the outliers were removed by the scanner
+        df = df[first[kept_index]]
+        step.update(rows_in=len(keys), rows_out=len(df))
     end_time = time.time()
     logging.info("Nutrition data set loaded in --- %s seconds ---", (end_time - start_time))
-    df = df.drop_duplicates(subset=['Name', 'AuthorName'])
-    # remove outliers
-    df = rm_outliers(df)
     # Process array-like columns
-    text_formating(df, to_format_nutrition)
-    df = handle_na(df, numeric_float_var_nutrition, numeric_int_var_nutrition, list_var_nutrition)
+    with profile('clean nutrition', len(df)) as step:
+        fallbacks = FALLBACK_CELLS.copy()
+        text_formating(df, parameters['to_format'])
+        log_fallbacks(fallbacks)
+        df = handle_na(
+            df, parameters['numeric_float_var'], parameters['numeric_int_var'], parameters['list_var']
+            )
+        step['rows_out'] = len(df)
     logging.info("Nutrition data set cleaned in --- %s seconds ---", (time.time() - end_time))
     recipe_name = df['Name'].drop_duplicates().to_list()
     return df, recipe_name
@@ -81,12 +141,13 @@ def load_measurements_data(measurements_data_path: str, recipe_merge: List) -> p
     and handles missing values.
 
     Steps involved:
-    1. Loads the dataset from the given path (`measurements_data_path`), keeping only the relevant columns.
-    2. Filters the data to include only rows where the `title` is in the provided `recipe_merge` list.
-    3. Removes duplicate rows based on `title` and `directions`.
-    4. Formats array-like columns (such as 'ingredients', 'directions', and 'NER') to ensure proper structure.
-    5. Handles missing values and ensures proper type conversion for string and list columns.
-    6. Returns the cleaned DataFrame.
+    1. Loads the dataset from the given path (`measurements_data_path`), keeping only the relevant
+                columns of the rows where the `title` is in the provided `recipe_merge` list. The
+                filter is pushed down to the parquet scanner.
+    2. Removes duplicate rows based on `title` and `directions`.
+    3. Formats array-like columns (such as 'ingredients', 'directions', and 'NER') to ensure proper structure.
+    4. Handles missing values and ensures proper type conversion for string and list columns.
+    5. Returns the cleaned DataFrame.
 
     Parameters:
     measurements_data_path (str): The path to the measurements dataset (e.g., a `.parquet` file).
@@ -95,58 +156,154 @@ def load_measurements_data(measurements_data_path: str, recipe_merge: List) -> p
     Returns:
     pd.DataFrame: The cleaned and processed DataFrame.
     """
+    parameters = get_config()['measurements_data']
     start_time = time.time()
-    df = pd.read_parquet(measurements_data_path, columns=keep_col_measurements)
+    with profile('load measurements') as step:
+        df = open_dataset(measurements_data_path).to_table(
+            columns=parameters['keep_col'], filter=ds.field('title').isin(recipe_merge)
+            ).to_pandas()
+        step['rows_out'] = len(df)
     end_time = time.time()
     logging.info("Measurements data set loaded in --- %s seconds ---", (end_time - start_time))
-    df = df[df['title'].isin(recipe_merge)]
-    df = df.drop_duplicates(subset=['title', 'directions'])
-    text_formating(df, to_format_measurements)
-    df = handle_na(df, list_var=list_var_measurements)
+    with profile('clean measurements', len(df)) as step:
+        df = df[~duplicated_keys(df, ['title', 'directions'])]
+        fallbacks = FALLBACK_CELLS.copy()
+        text_formating(df, parameters['to_format'])
+        log_fallbacks(fallbacks)
+        df = handle_na(df, list_var=parameters['list_var'])
+        step['rows_out'] = len(df)
     logging.info("Measurements data set cleaned in --- %s seconds ---", (time.time() - end_time))
     return df
 
 
-def merge(nutrition_data_path: str, measurements_data_path: str) -> pd.DataFrame:
+def stream_measurements_data(
+        measurements_data_path: str, recipe_merge: List, batch_size: int
+        ) -> pd.DataFrame:
+    """
+    Streaming version of `load_measurements_data`: the measurements dataset is read in pyarrow
+    record batches of `batch_size` rows so that only the rows matching a nutrition recipe are ever
+    held in memory.
+
+    Steps involved, for each record batch:
+    1. Keeps only the rows where the `title` is in the provided `recipe_merge` list, the filter
+            being pushed down to the parquet scanner.
+    2. Removes duplicate rows based on `title` and `directions`, including the duplicates of rows
+            already kept from a previous batch.
+    3. Formats array-like columns and handles missing values, as `load_measurements_data` does.
+    The cleaned batches are then concatenated in file order, so the output is the same as the one
+    of `load_measurements_data`.
+
+    Parameters:
+    measurements_data_path (str): The path to the measurements dataset (e.g., a `.parquet` file).
+    recipe_merge (list): A list of recipe titles to filter the dataset.
+    batch_size (int): The maximum number of rows read at once.
+
+    Returns:
+    pd.DataFrame: The cleaned and processed DataFrame.
+    """
+    parameters = get_config()['measurements_data']
+    start_time = time.time()
+    with profile('stream measurements', 0) as step:
+        dataset = open_dataset(measurements_data_path)
+        fallbacks = FALLBACK_CELLS.copy()
+        seen: dict = {}  # fingerprint -> keys of the rows already kept, several on a collision
+        chunks = []
+        for batch in dataset.to_batches(
+                columns=parameters['keep_col'],
+                filter=ds.field('title').isin(recipe_merge),
+                batch_size=batch_size
+                ):
+            if batch.num_rows == 0:
+                continue
+            step['rows_in'] += batch.num_rows
+            df = batch.to_pandas()
+            df = df[~duplicated_keys(df, ['title', 'directions'])]
+            # rows of a key kept from a previous batch: same fingerprint and same strings, compared
+            # with every key kept under this fingerprint
+            keys = fingerprint(df, ['title', 'directions']).to_numpy()
+            new = np.array([
+                (title, directions) not in seen.get(key, ())
+                for key, title, directions in zip(keys, df['title'], df['directions'])
+            ], dtype=bool)
+            df = df[new]
+            for key, title, directions in zip(keys[new], df['title'], df['directions']):
+                seen.setdefault(key, set()).add((title, directions))
+            text_formating(df, parameters['to_format'])
+            chunks.append(df)
+        if chunks:
+            df = pd.concat(chunks, ignore_index=True)  # the batches all start their index at 0
+        else:
+            df = dataset.schema.empty_table().select(parameters['keep_col']).to_pandas()
+        log_fallbacks(fallbacks)
+        df = handle_na(df, list_var=parameters['list_var'])
+        step['rows_out'] = len(df)
+    logging.info(
+        "Measurements data set streamed and cleaned in --- %s seconds ---",
+        (time.time() - start_time)
+        )
+    return df
+
+
+def first_item(value: Any) -> Any:
+    """
+    Parameters:
+    value (Any): A cell of a list column.
+
+    Returns:
+    Any: The first element of the list, None if the cell is not a list or is empty.
+    """
+    return value[0] if isinstance(value, list) and len(value) > 0 else None
+
+
+def merge(
+        nutrition_data_path: str, measurements_data_path: str, batch_size: Optional[int] = None
+        ) -> pd.DataFrame:
     """
     This function merges two datasets based on recipe names and the first instruction in each dataset.
 
     Steps involved:
     1. Loads the nutrition data from the given path (`nutrition_data_path`).
-    2. Loads the measurements data from the given path (`measurements_data_path`).
-    3. Creates a new column 'to_merge' in both datasets, which contains the first element from the
-                `RecipeInstructions` and `directions` columns (if available).
-    4. Merges the two datasets using the `Name` and `to_merge` columns in the nutrition data and the
-                `title` and `to_merge` columns in the measurements data.
+    2. Loads the measurements data from the given path (`measurements_data_path`). If a
+                `batch_size` is given, the measurements data is streamed by batches of this size
+                (see `stream_measurements_data`) to bound the memory used.
+    3. Builds the merge keys of both datasets: the recipe name (`Name` or `title`) and the first
+                element of the `RecipeInstructions` or `directions` column (if available).
+    4. Merges the two datasets on 64 bits fingerprints of their keys (see `merge_on_keys`), then
+                removes the duplicates of `Name` and `AuthorName` the same way.
     5. Returns the merged DataFrame containing data from both datasets.
 
     Parameters:
     nutrition_data_path (str): The file path to the nutrition dataset (e.g., a `.parquet` file).
     measurements_data_path (str): The file path to the measurements dataset (e.g., a `.parquet` file).
+    batch_size (Optional[int]): Number of rows per record batch when streaming the measurements
+                dataset. Defaults to None, which loads it at once.
 
     Returns:
     pd.DataFrame: The merged DataFrame.
     """
     df_nutrition, recipe_merge = load_nutrition_data(nutrition_data_path)
-    df_measurements = load_measurements_data(measurements_data_path, recipe_merge)
+    if batch_size:
+        df_measurements = stream_measurements_data(measurements_data_path, recipe_merge, batch_size)
+    else:
+        df_measurements = load_measurements_data(measurements_data_path, recipe_merge)
     start_time = time.time()
-    # create column to merge
-    df_nutrition['to_merge'] = df_nutrition['RecipeInstructions'].apply(
-                            lambda x: x[0] if isinstance(x, list) and len(x) > 0 else None
-                            )
-    df_measurements['to_merge'] = df_measurements['directions'].apply(
-                            lambda x: x[0] if isinstance(x, list) and len(x) > 0 else None
-                            )
-    # merge on recipe name and first instruction
-    df_merged = pd.merge(
-                        df_nutrition,
-                        df_measurements,
-                        left_on=['Name', 'to_merge'],
-                        right_on=['title', 'to_merge'],
-                        how='inner'
-                        )
-    # keep only usefull columns and non duplicate rows
-    df_merged = df_merged.drop_duplicates(subset=['Name', 'AuthorName'])
-    df_merged = df_merged.drop(columns=['to_merge', 'RecipeInstructions', 'Name'])
+    with profile('join', len(df_nutrition)) as step:
+        # merge on recipe name and first instruction
+        df_merged = merge_on_keys(
+            df_nutrition,
+            df_measurements,
+            pd.DataFrame({
+                'Name': df_nutrition['Name'],
+                'to_merge': df_nutrition['RecipeInstructions'].map(first_item),
+            }),
+            pd.DataFrame({
+                'title': df_measurements['title'],
+                'to_merge': df_measurements['directions'].map(first_item),
+            }),
+            )
+        # keep only usefull columns and non duplicate rows
+        df_merged = df_merged[~duplicated_keys(df_merged, ['Name', 'AuthorName'])]
+        df_merged = df_merged.drop(columns=['RecipeInstructions', 'Name'])
+        step['rows_out'] = len(df_merged)
     logging.info("Data merged in --- %s seconds ---", (time.time() - start_time))
     return df_merged
@@ -0,0 +1,401 @@
+"""
+Module that chains the stages of the data processing pipeline (merge -> preprocess -> filter),
+optionally on several processes and with stage checkpoints.
+includes :
+    - split_shards
+    - run_shard
+    - apply_sharded
+    - preprocess_stage
+    - filter_columns_stage
+    - cuisine_stage
+    - filter_stage
+    - process
+    - merge_stage
+    - sample_rows
+    - run_pipeline
+    - ingest_delta
+"""
+
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from src.config import get_config
+from src.preprocessing import durations, keys, keyword_matcher, load, singularizer
+from src.preprocessing import filter as filter_module
+from src.preprocessing import format as format_module
+from src.preprocessing.checkpoint import (checkpointed, file_fingerprint, source_version,
+                                          stage_key)
+from src.preprocessing.filter import add_filter_columns
+from src.preprocessing.format import data_preprocessing
+from src.preprocessing.incremental import read_current, split_rare_cuisines, upsert, write_state
+from src.preprocessing.load import merge
+from src.preprocessing.profiling import Profiler, add_records, profile
+from src.preprocessing.schema import write_output
+from src.preprocessing.singularizer import get_singularizer
+
+# Set up basic logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def split_shards(df: pd.DataFrame, n_shards: int) -> List[pd.DataFrame]:
+    """
+    Split a DataFrame into at most `n_shards` contiguous ranges of rows of similar sizes.
+
+    Args:
+        df (pd.DataFrame): the DataFrame to split
+        n_shards (int): the number of shards
+
+    Returns:
+        List[pd.DataFrame]: the non-empty shards, in order
+    """
+    bounds = np.linspace(0, len(df), min(n_shards, len(df)) + 1, dtype=int)
+    return [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def run_shard(
+        func: Callable[[pd.DataFrame], pd.DataFrame], shard: pd.DataFrame
+        ) -> Tuple[pd.DataFrame, dict, List[dict]]:
+    """
+    Apply a row-wise step of the pipeline to a shard of the dataset, in a worker process.
+
+    Args:
+        func (Callable[[pd.DataFrame], pd.DataFrame]): the step, e.g. `data_preprocessing`
+        shard (pd.DataFrame): a range of rows of the dataset
+
+    Returns:
+        pd.DataFrame: the processed shard
+        dict: the word -> singular map learned by the worker on the shard, to be saved by the main
+            process
+        List[dict]: the profiling records of the steps run on the shard
+    """
+    cache = get_singularizer().cache
+    known = set(cache)
+    with Profiler() as profiler:
+        df = func(shard)
+    # only the new words are sent back, not the whole cache
+    learned = {word: singular for word, singular in cache.items() if word not in known}
+    return df, learned, profiler.records
+
+
+def apply_sharded(
+        func: Callable[[pd.DataFrame], pd.DataFrame],
+        df: pd.DataFrame,
+        pool: Optional[Executor] = None,
+        workers: int = 1
+        ) -> pd.DataFrame:
+    """
+    Apply a row-wise step of the pipeline to a DataFrame. With a pool of workers, the DataFrame is
+    split by ranges of rows processed in parallel and the shards are put back together in order.
+
+    Args:
+        func (Callable[[pd.DataFrame], pd.DataFrame]): the step, e.g. `data_preprocessing`
+        df (pd.DataFrame): the input of the step
+        pool (Optional[Executor]): the pool of processes. Defaults to None, the step is applied
+                in the current process.
+        workers (int): the number of workers of the pool
+
+    Returns:
+        pd.DataFrame: the output of the step, with the index of each shard kept
+    """
+    shards = split_shards(df, workers)
+    if pool is None or len(shards) <= 1:
+        return func(df)
+    results = list(pool.map(run_shard, [func] * len(shards), shards))
+    for _, learned, records in results:
+        get_singularizer().update(learned)
+        add_records(records)
+    return pd.concat([shard for shard, _, _ in results])
+
+
+def preprocess_stage(
+        merged: pd.DataFrame, pool: Optional[Executor] = None, workers: int = 1
+        ) -> pd.DataFrame:
+    """
+    Args:
+        merged (pd.DataFrame): the merged Dataframe
+        pool (Optional[Executor]): the pool of processes, see `apply_sharded`
+        workers (int): the number of workers of the pool
+
+    Returns:
+        pd.DataFrame: the output of `data_preprocessing`
+    """
+    with profile('preprocess', len(merged)) as step:
+        df = apply_sharded(data_preprocessing, merged, pool, workers)
+        step['rows_out'] = len(df)
+    return df
+
+
+def filter_columns_stage(
+        df: pd.DataFrame, pool: Optional[Executor] = None, workers: int = 1
+        ) -> pd.DataFrame:
+    """
+    Create the filter columns by shards. The recipes of every world cuisine are kept, the
+    frequency cut-off is applied by `cuisine_stage`.
+
+    Args:
+        df (pd.DataFrame): the output of `data_preprocessing`
+        pool (Optional[Executor]): the pool of processes, see `apply_sharded`
+        workers (int): the number of workers of the pool
+
+    Returns:
+        pd.DataFrame: the recipes with their filter columns, with a new index
+    """
+    return apply_sharded(add_filter_columns, df, pool, workers).reset_index(drop=True)
+
+
+def cuisine_stage(df: pd.DataFrame, dataset_path: Optional[Path] = None) -> pd.DataFrame:
+    """
+    Apply the world cuisine frequency cut-off to the whole dataset, so that the output is the one
+    of `data_filter`. It is not checkpointed: the counts and the rare recipes saved for
+    `ingest_delta` always match the dataset being built.
+
+    Args:
+        df (pd.DataFrame): the output of `filter_columns_stage`
+        dataset_path (Optional[Path]): where the final dataset will be written. If given, the
+                world cuisine counts and the recipes of the rare cuisines are saved next to it for
+                `ingest_delta` (see `incremental.write_state`). Defaults to None.
+
+    Returns:
+        pd.DataFrame: the final dataset
+    """
+    counts = df['World_Cuisine'].value_counts()
+    df, rare = split_rare_cuisines(df, counts)
+    if dataset_path is not None:
+        write_state(dataset_path, counts, rare)
+    return df
+
+
+def filter_stage(
+        df: pd.DataFrame,
+        pool: Optional[Executor] = None,
+        workers: int = 1,
+        dataset_path: Optional[Path] = None
+        ) -> pd.DataFrame:
+    """
+    Create the filter columns by shards, then apply the world cuisine frequency cut-off to the
+    whole dataset (see `filter_columns_stage` and `cuisine_stage`).
+
+    Args:
+        df (pd.DataFrame): the output of `data_preprocessing`
+        pool (Optional[Executor]): the pool of processes, see `apply_sharded`
+        workers (int): the number of workers of the pool
+        dataset_path (Optional[Path]): where the final dataset will be written, see `cuisine_stage`
+
+    Returns:
+        pd.DataFrame: the final dataset
+    """
+    with profile('filter', len(df)) as step:
+        df = cuisine_stage(filter_columns_stage(df, pool, workers), dataset_path)
+        step['rows_out'] = len(df)
+    return df
+
+
+def process(merged: pd.DataFrame, workers: int = 1) -> pd.DataFrame:
+    """
+    Process the merged dataset with `data_preprocessing` then `data_filter`, on `workers` processes.
+
+    Args:
+        merged (pd.DataFrame): the merged Dataframe
+        workers (int): the number of processes. Defaults to 1, no process is started.
+
+    Returns:
+        pd.DataFrame: the final dataset
+    """
+    start_time = time.time()
+    with ProcessPoolExecutor(workers) if workers > 1 else nullcontext() as pool:
+        df = filter_stage(preprocess_stage(merged, pool, workers), pool, workers)
+    logging.info(
+        "Data set processed by %d worker(s) in --- %s seconds ---",
+        workers,
+        (time.time() - start_time)
+        )
+    return df
+
+
+def merge_stage(
+        nutrition_data_path: str, measurements_data_path: str, batch_size: Optional[int] = None
+        ) -> pd.DataFrame:
+    """
+    Args:
+        nutrition_data_path (str): The file path to the nutrition dataset.
+        measurements_data_path (str): The file path to the measurements dataset.
+        batch_size (Optional[int]): see `merge`
+
+    Returns:
+        pd.DataFrame: the output of `merge`
+    """
+    with profile('merge') as step:
+        df = merge(nutrition_data_path, measurements_data_path, batch_size=batch_size)
+        step['rows_out'] = len(df)
+    return df
+
+
+def sample_rows(df: pd.DataFrame, n_rows: Optional[int], seed: int = 0) -> pd.DataFrame:
+    """
+    Draw a reproducible sample of the merged dataset, to build a small dataset quickly during
+    development. The rows keep their order and index, so a sampled recipe gets the same recipe_id
+    as in the full dataset.
+
+    Args:
+        df (pd.DataFrame): the merged Dataframe
+        n_rows (Optional[int]): the number of rows to keep. None keeps all of them.
+        seed (int): the seed of the sample. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: the sampled rows
+    """
+    if n_rows is None or n_rows >= len(df):
+        return df
+    return df.sample(n=n_rows, random_state=seed).sort_index()
+
+
+def run_pipeline(
+        nutrition_data_path: str,
+        measurements_data_path: str,
+        workers: int = 1,
+        batch_size: Optional[int] = None,
+        checkpoint_dir: Optional[Path] = None,
+        profile_path: Optional[Path] = None,
+        dataset_path: Optional[Path] = None,
+        sample: Optional[int] = None,
+        seed: int = 0
+        ) -> pd.DataFrame:
+    """
+    Run the whole pipeline: merge the raw datasets then process and filter the merged dataset.
+
+    With a `checkpoint_dir`, the output of each stage is saved as parquet under a key hashing the
+    stage inputs (the raw files metadata, or the key of the previous stage), the config section
+    it reads and the source code it runs. A stage whose key did not change is loaded instead of run.
+
+    Args:
+        nutrition_data_path (str): The file path to the nutrition dataset.
+        measurements_data_path (str): The file path to the measurements dataset.
+        workers (int): the number of processes used to process the merged dataset. Defaults to 1.
+        batch_size (Optional[int]): Number of rows per record batch when streaming the measurements
+                dataset. Defaults to None, which loads it at once.
+        checkpoint_dir (Optional[Path]): the folder of the stage checkpoints. Defaults to None,
+                no checkpoint is used.
+        profile_path (Optional[Path]): the JSON file where the profiling report of the run (see
+                `profiling.Profiler`) is written. Defaults to None, no report is written.
+        dataset_path (Optional[Path]): where the final dataset will be written, see
+                `cuisine_stage`. The world cuisine counts are saved even when the filter columns
+                are loaded from their checkpoint. Defaults to None.
+        sample (Optional[int]): the number of merged recipes to process, drawn by `sample_rows`.
+                Defaults to None, all recipes are processed.
+        seed (int): the seed of the sample. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: the final dataset
+    """
+    with (
+            Profiler() as profiler,
+            ProcessPoolExecutor(workers) if workers > 1 else nullcontext() as pool
+            ):
+        if checkpoint_dir is None:
+            merged = sample_rows(
+                merge_stage(nutrition_data_path, measurements_data_path, batch_size), sample, seed
+                )
+            df = filter_stage(
+                preprocess_stage(merged, pool, workers), pool, workers, dataset_path
+                )
+        else:
+            merge_key = stage_key(
+                'merge',
+                file_fingerprint(nutrition_data_path),
+                file_fingerprint(measurements_data_path),
+                get_config()['nutrition_data'],
+                get_config()['measurements_data'],
+                source_version(load, keys, format_module),
+                )
+            preprocess_key = stage_key(
+                'preprocess',
+                merge_key,
+                {'sample': sample, 'seed': seed},
+                source_version(format_module, durations, singularizer)
+                )
+            filter_key = stage_key(
+                'filter_columns', preprocess_key, source_version(filter_module, keyword_matcher)
+                )
+
+            # each stage only loads or runs the previous one if its own checkpoint is missing
+            def merged() -> pd.DataFrame:
+                return checkpointed('merge', merge_key, lambda: merge_stage(
+                    nutrition_data_path, measurements_data_path, batch_size
+                    ), checkpoint_dir)
+
+            def preprocessed() -> pd.DataFrame:
+                return checkpointed(
+                    'preprocess',
+                    preprocess_key,
+                    lambda: preprocess_stage(sample_rows(merged(), sample, seed), pool, workers),
+                    checkpoint_dir
+                    )
+
+            # the cut-off is run even when the filter columns are loaded, to save its state
+            df = cuisine_stage(checkpointed(
+                'filter_columns',
+                filter_key,
+                lambda: filter_columns_stage(preprocessed(), pool, workers),
+                checkpoint_dir
+                ), dataset_path)
+    get_singularizer().save()
+    if profile_path is not None:
+        profiler.metadata = {
+            'workers': workers, 'batch_size': batch_size, 'sample': sample, 'rows': len(df)
+            }
+        profiler.write(profile_path)
+    return df
+
+
+def ingest_delta(
+        nutrition_data_path: str,
+        measurements_data_path: str,
+        dataset_path: Path,
+        workers: int = 1,
+        batch_size: Optional[int] = None
+        ) -> pd.DataFrame:
+    """
+    Add new or changed recipes to the final dataset instead of building it again from the whole
+    raw datasets. The raw files only hold the new or changed recipes, in the format of the raw
+    datasets (both the nutrition and the measurements rows of each recipe). They are merged,
+    preprocessed and given their filter columns, then upserted into the dataset: a recipe with
+    the name and author of a recipe of the dataset replaces it and keeps its recipe_id, so the
+    likes stay valid, and the new recipes get new ids (see `incremental.upsert`). The world cuisine
+    cut-off is applied with the counts saved next to the dataset, updated with the delta. The
+    dataset is written back in its layout: partitioned if it is a folder, else as one file.
+
+    Args:
+        nutrition_data_path (str): The file path to the new nutrition rows.
+        measurements_data_path (str): The file path to the new measurements rows.
+        dataset_path (Path): the parquet file or folder of the final dataset, rewritten with the
+                upserted recipes
+        workers (int): the number of processes used to process the delta. Defaults to 1.
+        batch_size (Optional[int]): see `merge`
+
+    Returns:
+        pd.DataFrame: the final dataset
+    """
+    start_time = time.time()
+    with ProcessPoolExecutor(workers) if workers > 1 else nullcontext() as pool:
+        delta = preprocess_stage(
+            merge_stage(nutrition_data_path, measurements_data_path, batch_size), pool, workers
+            )
+        delta = filter_columns_stage(delta, pool, workers)
+    current, counts = read_current(dataset_path)
+    df, rare, counts = upsert(current, delta, counts)
+    write_output(df, dataset_path, partitioned=Path(dataset_path).is_dir())
+    write_state(dataset_path, counts, rare)
+    get_singularizer().save()
+    logging.info(
+        "%d recipes ingested into %s in --- %s seconds ---",
+        len(delta),
+        dataset_path,
+        (time.time() - start_time)
+        )
+    return df
@@ -0,0 +1,269 @@
+"""
+Module that profiles the steps of the data processing pipeline and writes a JSON report per run.
+includes :
+    - rss_mb
+    - RssSampler
+    - Profiler
+    - profile
+    - add_records
+    - report_path
+"""
+
+import json
+import logging
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import psutil
+except ImportError:  # only needed where /proc is not available
+    psutil = None
+
+# Set up basic logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Get the absolute path to the project root
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+PROFILE_DIR = PROJECT_ROOT / 'data' / 'profiles'
+# Separator of the names of nested steps, e.g. 'preprocess/NER'
+STEP_SEPARATOR = '/'
+
+# Interval between two samples of the resident memory, in seconds
+RSS_INTERVAL = 0.005
+STATM_PATH = '/proc/self/statm'
+
+# Profiler of the current process, set while a `Profiler` is used as a context manager
+_active: Optional['Profiler'] = None
+
+
+def rss_mb() -> Optional[float]:
+    """
+    Returns:
+        Optional[float]: the resident memory of the current process, in MB. None where it is not
+            available (no /proc and no psutil).
+    """
+    if os.path.exists(STATM_PATH):
+        with open(STATM_PATH, encoding='ascii') as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2**20
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    return None
+
+
+class RssSampler:
+    """
+    Samples the resident memory of the current process in a background thread, to get the peak
+    of each step while it runs. The peak of the process since it started (`ru_maxrss`) cannot
+    be used: a step run after a heavier one would report the peak of the heavier one.
+
+    Args:
+        interval (float): the time between two samples, in seconds
+    """
+
+    def __init__(self, interval: float = RSS_INTERVAL):
+        self.interval = interval
+        self.available = rss_mb() is not None
+        self._steps: Dict[int, dict] = {}  # the peaks of the steps being run, by id
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        rss = rss_mb()
+        with self._lock:
+            for step in self._steps.values():
+                step['peak'] = max(step['peak'], rss)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        """Start sampling in the background, where the resident memory can be read"""
+        if self.available and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampling thread"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def begin(self) -> dict:
+        """
+        Returns:
+            dict: the peak of a step starting now, to give to `end` when it ends
+        """
+        step = {'peak': rss_mb() if self.available else None}
+        if self.available:
+            with self._lock:
+                self._steps[id(step)] = step
+        return step
+
+    def end(self, step: dict) -> Optional[float]:
+        """
+        Returns:
+            Optional[float]: the peak resident memory of the process while the step ran, in MB
+        """
+        if not self.available:
+            return None
+        self._sample()
+        with self._lock:
+            del self._steps[id(step)]
+        return round(step['peak'], 1)
+
+
+class Profiler:
+    """
+    Records the wall time, CPU time, peak RSS (sampled while the step runs, see `RssSampler`) and
+    the number of rows in and out of the steps of the pipeline run while it is active
+    (`with Profiler() as profiler:`). Steps are recorded with `profile`, they can be nested and can
+    be run in worker processes, whose records are added to the profiler of the main process with
+    `add`.
+    """
+
+    def __init__(self):
+        self.records: List[dict] = []
+        self.stack: List[str] = []
+        self.metadata: dict = {}
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.sampler = RssSampler()
+        self._previous: Optional[Profiler] = None
+
+    def __enter__(self) -> 'Profiler':
+        global _active
+        self._previous, _active = _active, self
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global _active
+        self.sampler.stop()
+        _active = self._previous
+
+    def add(self, records: List[dict]) -> None:
+        """
+        Add the records of steps run in a worker process, as sub-steps of the current step.
+
+        Args:
+            records (List[dict]): the records of the profiler of the worker
+        """
+        prefix = ''.join(name + STEP_SEPARATOR for name in self.stack)
+        self.records.extend({**record, 'step': prefix + record['step']} for record in records)
+
+    def summary(self) -> List[dict]:
+        """
+        Returns:
+            List[dict]: one entry per step, in the order they were first run. A step run several
+                times (e.g. on each shard of the dataset) is summed, with the maximum peak RSS of
+                the processes that ran it.
+        """
+        steps: dict = {}
+        for record in self.records:
+            step = steps.setdefault(record['step'], {
+                'step': record['step'], 'calls': 0, 'wall_time_s': 0.0, 'cpu_time_s': 0.0,
+                'peak_rss_mb': None, 'rows_in': None, 'rows_out': None,
+            })
+            step['calls'] += 1
+            for key in ('wall_time_s', 'cpu_time_s'):
+                step[key] = round(step[key] + record[key], 4)
+            for key in ('rows_in', 'rows_out'):
+                if record[key] is not None:
+                    step[key] = (step[key] or 0) + record[key]
+            if record['peak_rss_mb'] is not None:
+                step['peak_rss_mb'] = max(step['peak_rss_mb'] or 0, record['peak_rss_mb'])
+        return list(steps.values())
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: the profiling report of the run, with the versions it ran with
+        """
+        return {
+            'started_at': self.started_at,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'pyarrow': pa.__version__,
+            'cpu_count': os.cpu_count(),
+            **self.metadata,
+            'steps': self.summary(),
+        }
+
+    def write(self, path: Path) -> None:
+        """Write the report as JSON to `path`"""
+        os.makedirs(Path(path).parent, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(), file, indent=2)
+        logging.info("Profiling report written to %s", path)
+
+
+@contextmanager
+def profile(name: str, rows_in: Optional[int] = None) -> Iterator[dict]:
+    """
+    Profile a step of the pipeline: the block run in the context is recorded by the active
+    profiler, if any. The number of rows out can be set on the yielded record, it defaults to
+    the number of rows in.
+
+    Example:
+        with profile('CookTime', len(df)) as step:
+            df = ...
+            step['rows_out'] = len(df)
+
+    Args:
+        name (str): the name of the step
+        rows_in (Optional[int]): the number of rows the step starts with
+
+    Yields:
+        dict: the record of the step
+    """
+    profiler = _active
+    record = {'step': name, 'rows_in': rows_in, 'rows_out': rows_in}
+    if profiler is None:
+        yield record
+        return
+    profiler.stack.append(name)
+    rss = profiler.sampler.begin()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        profiler.stack.pop()
+        record.update({
+            'step': STEP_SEPARATOR.join([*profiler.stack, name]),
+            'wall_time_s': time.perf_counter() - wall_start,
+            'cpu_time_s': time.process_time() - cpu_start,
+            'peak_rss_mb': profiler.sampler.end(rss),
+        })
+        profiler.records.append(record)
+
+
+def add_records(records: List[dict]) -> None:
+    """
+    Add the records of steps run in a worker process to the active profiler, if any.
+
+    Args:
+        records (List[dict]): the records of the profiler of the worker
+    """
+    if _active is not None:
+        _active.add(records)
+
+
+def report_path() -> Path:
+    """
+    Returns:
+        Path: a new file of the profiling reports folder, named after the current time
+    """
+    return PROFILE_DIR / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
@@ -0,0 +1,253 @@
+"""
+Module that holds the schema of the final dataset and writes and reads it with compact types:
+dictionary encoded strings, 32 bits floats, small integers and native arrow lists, either as one
+parquet file or partitioned by recipe type.
+includes :
+    - OUTPUT_SCHEMA
+    - to_output_table
+    - column_memory_mb
+    - memory_report
+    - write_partitioned
+    - from_output_table
+    - read_output
+    - output_exists
+    - write_output
+"""
+
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Set up basic logging configuration
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+NUTRITION_COLUMNS = ['Calories', 'FatContent', 'SaturatedFatContent', 'CholesterolContent',
+                     'SodiumContent', 'CarbohydrateContent', 'FiberContent', 'SugarContent',
+                     'ProteinContent']
+LIST_COLUMNS = ['Keywords', 'directions', 'ingredients', 'NER']
+# Layout of the partitioned dataset: one folder per recipe type, recipes sorted by duration
+PARTITION_COLUMN = 'RecipeType'
+SORT_COLUMN = 'TotalTime_minutes'
+# Rows per row group of the partitioned dataset: small enough for the min/max statistics of the
+# sorted duration to skip most row groups of a time filter, large enough to compress well
+ROW_GROUP_SIZE = 16_384
+
+# The width of the dictionary indices bounds the number of distinct values of each column
+OUTPUT_SCHEMA = pa.schema(
+    [
+        ('AuthorName', pa.dictionary(pa.int32(), pa.string())),
+        ('CookTime', pa.dictionary(pa.int16(), pa.string())),
+        ('PrepTime', pa.dictionary(pa.int16(), pa.string())),
+        ('TotalTime', pa.dictionary(pa.int16(), pa.string())),
+        ('Description', pa.string()),
+        ('Images', pa.string()),
+        ('RecipeCategory', pa.dictionary(pa.int16(), pa.string())),
+        ('Keywords', pa.list_(pa.string())),
+        ('AggregatedRating', pa.float32()),
+        ('ReviewCount', pa.int32()),
+    ]
+    + [(col, pa.float32()) for col in NUTRITION_COLUMNS]
+    + [
+        ('RecipeServings', pa.int16()),  # at most MAX_SERVINGS
+        ('title', pa.string()),
+        ('directions', pa.list_(pa.string())),
+        ('ingredients', pa.list_(pa.string())),
+        ('link', pa.string()),
+        ('NER', pa.list_(pa.string())),
+        ('CookTime_minutes', pa.int32()),
+        ('PrepTime_minutes', pa.int32()),
+        ('TotalTime_minutes', pa.int32()),
+        ('recipe_id', pa.int64()),
+        ('TotalTime_cat', pa.dictionary(pa.int8(), pa.string())),
+        ('RecipeType', pa.dictionary(pa.int8(), pa.string())),
+        ('Beginner_Friendly', pa.bool_()),
+        ('Vegetarian_Friendly', pa.bool_()),
+        ('World_Cuisine', pa.dictionary(pa.int8(), pa.string())),
+    ]
+)
+
+
+def to_output_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Convert the final dataset to an arrow table of `OUTPUT_SCHEMA`. The casts are safe: a value
+    that does not fit in its type (e.g. a number of servings above 32767) raises an error instead
+    of being truncated.
+
+    Args:
+        df (pd.DataFrame): the output of the pipeline
+
+    Returns:
+        pa.Table: the dataset with the types of `OUTPUT_SCHEMA`, without pandas metadata
+    """
+    columns = []
+    for field in OUTPUT_SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            array = pa.array(df[field.name], type=field.type.value_type, from_pandas=True)
+            array = pc.dictionary_encode(array).cast(field.type)
+        else:
+            array = pa.array(df[field.name], type=field.type, from_pandas=True)
+        columns.append(array)
+    return pa.Table.from_arrays(columns, schema=OUTPUT_SCHEMA)
+
+
+def column_memory_mb(series: pd.Series) -> float:
+    """
+    Memory used by a column, including the python objects of list cells that
+    `Series.memory_usage(deep=True)` does not count.
+
+    Args:
+        series (pd.Series): a column of the dataset
+
+    Returns:
+        float: the memory used, in MB
+    """
+    size = series.memory_usage(deep=True, index=False)
+    if series.dtype == object:
+        size += sum(
+            sum(sys.getsizeof(item) for item in value)
+            for value in series
+            if isinstance(value, list)
+        )
+    return size / 2**20
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """
+    Args:
+        before (pd.DataFrame): the dataset with the types of the pipeline
+        after (pd.DataFrame): the same dataset with compact types
+
+    Returns:
+        pd.DataFrame: the memory in MB of each column before and after, with a 'total' row
+    """
+    report = pd.DataFrame({
+        'before_mb': [column_memory_mb(before[col]) for col in after.columns],
+        'after_mb': [column_memory_mb(after[col]) for col in after.columns],
+    }, index=after.columns)
+    report.loc['total'] = report.sum()
+    report['ratio'] = report['before_mb'] / report['after_mb']
+    return report.round(2)
+
+
+def write_partitioned(table: pa.Table, path: Path, row_group_size: int = ROW_GROUP_SIZE) -> None:
+    """
+    Write the final dataset as a hive partitioned parquet dataset: one folder per recipe type
+    (e.g. `RecipeType=Dessert/`), with the recipes of each folder sorted by duration, row groups
+    of `row_group_size` rows, column statistics and page indexes. Readers filtering on the recipe
+    type only open its folder, and the statistics of the sorted duration let them skip the row
+    groups outside of a time filter.
+
+    Args:
+        table (pa.Table): the output of `to_output_table`
+        path (Path): the folder of the dataset, its previous content is replaced
+        row_group_size (int): the number of rows per row group
+    """
+    table = table.set_column(
+        table.schema.get_field_index(PARTITION_COLUMN),
+        PARTITION_COLUMN,
+        table[PARTITION_COLUMN].cast(pa.string())
+        ).sort_by([(PARTITION_COLUMN, 'ascending'), (SORT_COLUMN, 'ascending')])
+    file_schema = table.schema.remove(table.schema.get_field_index(PARTITION_COLUMN))
+    parquet_format = ds.ParquetFileFormat()
+    ds.write_dataset(
+        table,
+        path,
+        format=parquet_format,
+        partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor='hive'),
+        file_options=parquet_format.make_write_options(
+            write_statistics=True,
+            write_page_index=True,
+            sorting_columns=[pq.SortingColumn(file_schema.get_field_index(SORT_COLUMN))],
+            ),
+        min_rows_per_group=row_group_size,
+        max_rows_per_group=row_group_size,
+        existing_data_behavior='delete_matching',
+        use_threads=False,  # keeps the rows sorted
+        )
+
+
+def from_output_table(table: pa.Table) -> pd.DataFrame:
+    """
+    Args:
+        table (pa.Table): a table with the columns of `OUTPUT_SCHEMA`, in any order
+
+    Returns:
+        pd.DataFrame: the dataset with compact pandas types: categories for the dictionary encoded
+            columns and arrow backed lists, whose cells are read as python lists
+    """
+    return table.select(OUTPUT_SCHEMA.names).to_pandas(
+        types_mapper=lambda arrow_type: pd.ArrowDtype(arrow_type)
+        if pa.types.is_list(arrow_type)
+        else None
+        )
+
+
+def read_output(path: Path, filter: Optional[ds.Expression] = None) -> pd.DataFrame:
+    """
+    Load the final dataset, written as one file or partitioned, with compact pandas types (see
+    `from_output_table`). A filter is pushed down to the parquet scanner, which skips the partitions and
+    row groups that cannot match it.
+
+    Example:
+        read_output(path, (ds.field('RecipeType') == 'Dessert') & (ds.field(SORT_COLUMN) <= 30))
+
+    Args:
+        path (Path): the parquet file or folder written by `write_output`
+        filter (Optional[ds.Expression]): the rows to read. Defaults to None, all rows are read.
+
+    Returns:
+        pd.DataFrame: the final dataset
+    """
+    partitioning = None
+    if Path(path).is_dir():
+        partitioning = ds.HivePartitioning.discover(infer_dictionary=True)
+    table = ds.dataset(path, format='parquet', partitioning=partitioning).to_table(filter=filter)
+    return from_output_table(table)
+
+
+def output_exists(path: Path) -> bool:
+    """
+    Args:
+        path (Path): the parquet file or folder written by `write_output`
+
+    Returns:
+        bool: whether the final dataset was written at `path`, as one file or partitioned
+    """
+    path = Path(path)
+    if path.is_dir():
+        return any(path.rglob('*.parquet'))
+    return path.is_file()
+
+
+def write_output(df: pd.DataFrame, path: Path, partitioned: bool = False) -> None:
+    """
+    Write the final dataset as parquet with `OUTPUT_SCHEMA` and log the memory used by the dataset
+    in memory before and after the conversion to compact types.
+
+    Args:
+        df (pd.DataFrame): the output of the pipeline
+        path (Path): the parquet file, or the folder of the partitioned dataset
+        partitioned (bool): whether to write a dataset partitioned by recipe type (see
+            `write_partitioned`). Defaults to False, one file is written.
+    """
+    table = to_output_table(df)
+    if partitioned:
+        write_partitioned(table, path)
+    else:
+        pq.write_table(table, path)
+    # the dataset as it is read back, converted from the table written instead of reading it again
+    report = memory_report(df, from_output_table(table))
+    logging.info("Memory of the final dataset by column (MB):\n%s", report.to_string())
+    logging.info(
+        "Final dataset written to %s: %.1f MB in memory instead of %.1f MB",
+        path,
+        report.loc['total', 'after_mb'],
+        report.loc['total', 'before_mb']
+        )
@@ -0,0 +1,130 @@
+"""
+Module that holds the shared singularizer of ingredient names, used both to build the dataset and
+to clean the queries of the users.
+includes :
+    - Singularizer
+    - get_singularizer
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import inflect
+
+# Get the absolute path to the project root
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+# The learned word -> singular map is stored next to the dataset
+CACHE_PATH = PROJECT_ROOT / 'data' / 'recipe' / 'singular_nouns.json'
+# Maximum number of words kept in memory
+CACHE_SIZE = 100_000
+
+
+class Singularizer:
+    """
+    Converts words from plural to singular with `inflect`, memoizing the results in a bounded
+    least recently used cache that can be saved to and reloaded from a json file, since the same
+    few thousand ingredient names are singularized millions of times.
+
+    Args:
+        path (Optional[Path]): json file of the learned word -> singular map. Defaults to None,
+            the map is then only kept in memory.
+        maxsize (int): maximum number of words kept in memory.
+    """
+
+    def __init__(self, path: Optional[Path] = None, maxsize: int = CACHE_SIZE):
+        self.path = Path(path) if path else None
+        self.maxsize = maxsize
+        self.cache: OrderedDict[str, str] = OrderedDict()
+        self.modified = False
+        self._engine: Optional['inflect.engine'] = None
+        self._lock = threading.Lock()
+        if self.path and self.path.is_file():
+            self.load()
+
+    @property
+    def engine(self) -> 'inflect.engine':
+        """
+        The inflect engine, only imported and built when a word is not in the cache: importing
+        inflect takes seconds.
+        """
+        if self._engine is None:
+            import inflect
+
+            self._engine = inflect.engine()
+        return self._engine
+
+    def singular(self, word: str) -> str:
+        """
+        Args:
+            word (str): A word, e.g. an ingredient name
+
+        Returns:
+            str: The singular form of the word, or the word itself if it is already singular or
+                unrecognized.
+        """
+        with self._lock:
+            if word in self.cache:
+                self.cache.move_to_end(word)
+                return self.cache[word]
+        result = self.engine.singular_noun(word) or word
+        with self._lock:
+            self.cache[word] = result
+            self.modified = True
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        return result
+
+    def update(self, learned: dict) -> None:
+        """
+        Add words singularized elsewhere (e.g. in another process) to the cache.
+
+        Args:
+            learned (dict): a word -> singular map
+        """
+        with self._lock:
+            for word, result in learned.items():
+                if word not in self.cache:
+                    self.cache[word] = result
+                    self.modified = True
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+    def load(self) -> None:
+        """Load the learned map from `path`, keeping at most `maxsize` words"""
+        with open(self.path, 'r', encoding='utf-8') as file:
+            learned = json.load(file)
+        with self._lock:
+            for word, result in list(learned.items())[-self.maxsize:]:
+                self.cache[word] = result
+        logging.info("%d singular nouns loaded from %s", len(learned), self.path)
+
+    def save(self) -> None:
+        """Save the learned map to `path` if new words were singularized since the last save"""
+        if self.path is None or not self.modified:
+            return
+        os.makedirs(self.path.parent, exist_ok=True)
+        temporary_path = self.path.with_suffix('.tmp')
+        with self._lock:
+            learned = dict(self.cache)
+            self.modified = False
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(learned, file)
+        os.replace(temporary_path, self.path)
+        logging.info("%d singular nouns saved to %s", len(learned), self.path)
+
+
+@lru_cache(maxsize=None)
+def get_singularizer() -> Singularizer:
+    """
+    Returns:
+        Singularizer: The singularizer shared by the whole process, using the map saved next to
+            the dataset.
+    """
+    return Singularizer(CACHE_PATH)
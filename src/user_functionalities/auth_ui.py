@@ -4,19 +4,10 @@ interacting with a backend API.
 Includes login, registration, and a user panel with options like viewing liked recipes and logging out.
 """
 
-from pathlib import Path
-
 import requests
 import streamlit as st
-import yaml
-
-# Get URI parameter configuration
-PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
-config_path = PROJECT_ROOT / "utils" / "config.yaml"
-with open(config_path, "r") as file:
-    config = yaml.safe_load(file)
 
-URI = config['FLASK']['URI']
+from src.config import api_uri
 
 
 def login_form():
@@ -45,7 +36,7 @@ def login_form():
             st.sidebar.warning("Please enter both username and password.")
         else:
             response = requests.post(
-                f"{URI}/login", data={"username": username, "password": password}
+                f"{api_uri()}/login", data={"username": username, "password": password}
             )
             if "successfully" in response.text:
                 st.session_state.logged_in = True
@@ -60,7 +51,7 @@ def login_form():
             st.sidebar.warning("Please enter both username and password.")
         else:
             response = requests.post(
-                f"{URI}/register", data={"username": username, "password": password}
+                f"{api_uri()}/register", data={"username": username, "password": password}
             )
             if "successfully" in response.text:
                 st.session_state.logged_in = True
@@ -88,7 +79,7 @@ def show_user_panel():
 
         if st.sidebar.button("❤ Liked recipes"):
             response = requests.get(
-                f"{URI}/liked_recipes",
+                f"{api_uri()}/liked_recipes",
                 params={"username": str(st.session_state.username)},
             )
 
@@ -109,7 +100,7 @@ def show_user_panel():
                 )
 
         if st.sidebar.button("Logout", key="logout_btn"):
-            response = requests.post(f"{URI}/logout")
+            response = requests.post(f"{api_uri()}/logout")
             if "successfully" in response.text:
                 st.session_state.logged_in = False
                 st.session_state.username = ""
@@ -2,19 +2,10 @@
 Provides functions to like a recipe, display a like button in the Streamlit UI,
 and retrieve liked recipes for a given user, using both local database access and Flask API requests.
 """
-from pathlib import Path
-
 import requests
 import streamlit as st
-import yaml
-
-# Get URI parameter configuration
-PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
-config_path = PROJECT_ROOT / "utils" / "config.yaml"
-with open(config_path, "r") as file:
-    config = yaml.safe_load(file)
 
-URI = config['FLASK']['URI'] 
+from src.config import api_uri
 
 
 def like_recipe(conn, user_id, recipe_id):
@@ -64,7 +55,7 @@ def like_recipe_button(recipe_id, col3):
         else:
             try:
                 response = requests.post(
-                    f"{URI}/like_recipe",
+                    f"{api_uri()}/like_recipe",
                     json={"recipe_id": int(recipe_id), "user_id": str(user_id)},
                 )
 
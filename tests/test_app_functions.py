@@ -3,18 +3,17 @@
 # sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "utils")))
 import time
 
+import numpy as np
 import pandas as pd
-from src.application.recipe_finder_functions import split_frame, search_recipes
+import pyarrow as pa
+from src.application.pagination import Paginator
+from src.application.ranking import top_k
+from src.application.recipe_finder_functions import fridge_match, result_pages, search_recipes, title_rows
+from src.application.search_cache import ResultCache, dataset_version, get_result_cache, normalize_filters
+from src.application.spelling import SpellingIndex, edit_distance
+from src.application.search_index import IngredientIndex, RecipeIndex, TitleIndex, to_bitset, to_positions
 
 
-def test_split_frame():
-    df = pd.DataFrame({'A': range(10)})
-    result = split_frame(df, 3)
-    assert len(result) == 4 # there should be 4 chunks
-    assert all(isinstance(chunk, pd.DataFrame) for chunk in result)  # all chunks should be DataFrames
-    assert len(result[0]) == 3 # the first chunk should be of length 3
-    assert len(result[-1]) == 1 # the last chunk should be of length 1
-
 def test_search_recipes():
     # no need to test for case sensitivity as the filters are already standardized in format
     df = pd.DataFrame({
@@ -87,6 +86,7 @@ def test_search_recipes():
     assert total8 == 2000  # ensure results are consistent on larger df
 
     # checks caching
+    get_result_cache().clear()  # the results of `filters` were cached by the first search
     start_time = time.time()
     search_recipes(df, filters, dict_columns)
     first_run_time = time.time() - start_time
@@ -95,3 +95,236 @@ def test_search_recipes():
     search_recipes(df, filters, dict_columns)
     second_run_time = time.time() - start_time
     assert second_run_time < first_run_time, "Caching did not improve performance" # second run should be quicker than the first
+
+
+def test_ingredient_index():
+    ner = pd.Series([
+        ['onion', 'tomato', 'salt'],
+        ['green onion', 'salt', 'salt'],
+        [],
+        ['tomato', None, 'onion'],
+        ['salt'],
+    ])
+    queries = [['onion'], ['onion', 'tomato'], ['salt'], ['onion', 'salt'], ['garlic'], []]
+    for lists in [ner, ner.astype(pd.ArrowDtype(pa.list_(pa.string())))]:
+        index = IngredientIndex(lists)
+        assert 'green onion' in index and 'garlic' not in index
+        assert len(index) == 4  # the missing ingredient is not indexed
+        for query in queries:
+            expected = np.flatnonzero(lists.apply(lambda x: all(element in x for element in query)))
+            assert list(index.rows(query)) == list(expected)  # same recipes as the linear filter
+        assert list(index.postings['salt']) == [0, 1, 4]  # a repeated ingredient is indexed once
+    assert len(IngredientIndex(pd.Series([], dtype=object)).rows(['onion'])) == 0
+
+
+def test_recipe_index():
+    df = pd.DataFrame({
+        'NER': [['onion', 'salt'], ['salt'], ['onion'], [], ['onion', 'salt'], ['egg']],
+        'TotalTime_minutes': pd.array([10, 90, None, 30, 120, 60], dtype='Int32'),
+        'TotalTime_cat': pd.Categorical(['< 30min', '> 1h', None, '< 1h', '> 1h', '< 1h']),
+        'RecipeType': pd.Categorical(['Dessert', 'Main Course', 'Dessert', None, 'Dessert', 'Dessert']),
+        'Vegetarian_Friendly': [True, False, True, True, False, True],
+        'Beginner_Friendly': [True, True, False, True, True, False],
+        'World_Cuisine': pd.Categorical(['Asian', 'Southeast Asian', 'European', 'Mexican', None, 'Asian']),
+    }, index=[10, 11, 12, 13, 14, 15])
+    dict_columns = {
+        'ingredients': 'NER',
+        'recipe_durations_cat': 'TotalTime_cat',
+        'recipe_durations_min': 'TotalTime_minutes',
+        'recipe_types': 'RecipeType',
+        'vegetarian': 'Vegetarian_Friendly',
+        'beginner': 'Beginner_Friendly',
+        'provenance': 'World_Cuisine',
+    }
+    index = RecipeIndex(df, dict_columns)
+    assert index.values('recipe_types') == ['Dessert', 'Main Course']
+
+    def expected(filters):  # the filters applied one after the other with boolean masks
+        mask = pd.Series(True, index=df.index)
+        if 'ingredients' in filters:
+            mask &= df['NER'].apply(lambda x: all(element in x for element in filters['ingredients']))
+        if 'recipe_durations_cat' in filters:
+            mask &= df['TotalTime_cat'] == filters['recipe_durations_cat']
+        if 'recipe_durations_min' in filters:
+            mask &= (df['TotalTime_minutes'] <= filters['recipe_durations_min']).fillna(False)
+        if 'recipe_type' in filters:
+            mask &= df['RecipeType'] == filters['recipe_type']
+        if 'vegetarian' in filters:
+            mask &= df['Vegetarian_Friendly'] == filters['vegetarian']
+        if 'beginner' in filters:
+            mask &= df['Beginner_Friendly'] == filters['beginner']
+        if 'provenance' in filters:
+            mask &= df['World_Cuisine'].astype(object).apply(
+                lambda x: isinstance(x, str) and all(element in x for element in filters['provenance']))
+        return list(np.flatnonzero(mask))
+
+    all_filters = [
+        {},
+        {'ingredients': ['onion'], 'recipe_type': 'Dessert'},
+        {'recipe_durations_min': 60},
+        {'recipe_durations_min': 60, 'vegetarian': True, 'beginner': True},
+        {'recipe_durations_cat': '> 1h'},
+        {'provenance': ['Asian']},  # substring of the cuisine, as 'Southeast Asian'
+        {'provenance': ['Asian', 'Mexican']},
+        {'recipe_type': 'lunch'},
+        {'ingredients': ['salt'], 'recipe_durations_min': 200, 'provenance': ['Asian']},
+    ]
+    for filters in all_filters:
+        assert list(index.rows(filters)) == expected(filters), filters
+        result, total = search_recipes(df, filters, dict_columns, index)
+        assert list(result.index) == list(df.index[expected(filters)]) and total == len(result)
+
+    positions = np.array([0, 3, 8])
+    assert list(to_positions(to_bitset(positions, 9), 9)) == [0, 3, 8]  # bits beyond one byte
+
+
+def test_result_cache(tmp_path):
+    assert normalize_filters({'provenance': ['Mexican', 'Asian'], 'beginner': True}) == \
+        normalize_filters({'beginner': True, 'provenance': ['Asian', 'Mexican', 'Asian']})
+
+    cache = ResultCache(max_entries=2, max_bytes=100)
+    cache.put('a', np.arange(10, dtype=np.int32))
+    cache.put('b', np.arange(5, dtype=np.int32))
+    assert cache.get('a') is not None  # 'a' is now the most recently used
+    cache.put('c', np.arange(3, dtype=np.int32))
+    assert cache.get('b') is None and len(cache) == 2  # the least recently used is evicted
+    cache.put('d', np.arange(24, dtype=np.int32))  # 96 bytes, only 'd' fits
+    assert cache.get('a') is None and cache.get('c') is None and cache.nbytes == 96
+    assert cache.put('e', np.arange(30, dtype=np.int32)) is not None and cache.get('e') is None  # too large
+    assert not cache.get('d').flags.writeable  # the shared results cannot be modified
+
+    path = tmp_path / 'recipes.parquet'
+    pd.DataFrame({'A': [1]}).to_parquet(path)
+    version = dataset_version(path)
+    assert dataset_version(path) == version
+    pd.DataFrame({'A': [1, 2]}).to_parquet(path)
+    assert dataset_version(path) != version  # a new dataset has a new version
+
+
+def test_title_index():
+    titles = pd.Series([
+        'Chicken Noodle Soup', 'Soupe à l\'Oignon', None, 'Easy Chicken Curry', 'Ob', 'Chocolate Chip Cookies',
+        'Chicken Chicken Chicken', 'Crème Brûlée',
+    ])
+    index = TitleIndex(titles)
+    queries = ['chicken', 'CHICKEN soup', 'soup', 'oup', 'ob', 'b', '', 'brûlée', 'en ch', 'chicken curry', 'pizza',
+               'up c', 'cookies!']
+    for query in queries:
+        expected = np.flatnonzero(titles.str.contains(query, case=False, na=False, regex=False))
+        assert list(index.rows(query)) == list(expected), query
+    assert list(index.candidates('ken ch')) == [3, 6] and list(index.rows('ken ch')) == [6]  # candidates are verified
+    assert len(TitleIndex(pd.Series([], dtype=object)).rows('soup')) == 0
+
+    df = pd.DataFrame({
+        'title': ['Onion Soup', 'Tomato Salad', 'Green Salad', 'Onion Tart'],
+        'NER': [['onion', 'butter'], ['tomato', 'onion'], ['lettuce'], ['onion', 'flour']],
+    }, index=[5, 6, 7, 8])
+    index = RecipeIndex(df, {'ingredients': 'NER'}, title_column='title')
+    assert list(title_rows('onion', index)) == [0, 1, 3]  # by title or ingredients
+    assert list(title_rows('Salad', index)) == [1, 2]
+    assert list(title_rows('green lettuce', index)) == []
+    paginator = Paginator(df, np.array([3, 1, 0, 2]))  # sorted by rating
+    assert list(paginator.restrict(title_rows('onion', index)).page(1)['title']) == [
+        'Onion Tart', 'Tomato Salad', 'Onion Soup']
+
+
+def test_spelling_index():
+    assert edit_distance('letuce', 'lettuce', 2) == 1
+    assert edit_distance('tomatoe', 'tomato', 2) == 1
+    assert edit_distance('ocnut', 'coconut', 2) == 2
+    assert edit_distance('ehcese', 'cheese', 2) == 2  # transpositions count as one edit
+    assert edit_distance('brocoli', 'cheese', 2) is None
+
+    spelling = SpellingIndex({'lettuce': 3, 'onion': 10, 'union': 1, 'tomato': 5, 'chocolate': 4})
+    assert spelling.correction('letuce') == 'lettuce'
+    assert spelling.correction('onion') == 'onion'  # a known word is kept
+    assert spelling.correction('inion') == 'onion'  # the most frequent of the closest words
+    assert spelling.correction('chocolatte') == 'chocolate'  # the edit is beyond the indexed prefix
+    assert spelling.correction('ocolate') == 'chocolate'  # the edits are in the indexed prefix
+    assert spelling.correction('banana') is None
+
+    df = pd.DataFrame({
+        'title': ['Lettuce Wraps', 'Chocolate Cake', 'Onion Soup'],
+        'NER': [['lettuce', 'soy sauce'], ['chocolate', 'flour'], ['onion', 'butter']],
+    })
+    index = RecipeIndex(df, {'ingredients': 'NER'}, title_column='title')
+    assert index.vocabulary()['lettuce'] == 2 and index.vocabulary()['soy'] == 1
+    assert index.is_known('soup') and index.is_known('choc') and index.is_known('soy sauce')
+    assert not index.is_known('soy flour')
+    assert index.spelling.correction('chocolat') == 'chocolate'
+
+
+def test_top_k():
+    scores = np.random.default_rng(0).integers(0, 5, 200).astype(float)  # many ties
+    expected = np.argsort(-scores, kind='stable')  # full sort
+    for k in [0, 1, 7, 50, 200, 300]:
+        assert list(top_k(scores, k)) == list(expected[:k])
+
+
+def test_fridge_match():
+    df = pd.DataFrame({
+        'title': ['Onion Soup', 'Tomato Salad', 'Cake', 'Onion Tart', 'Tomato Soup'],
+        'NER': [['onion', 'butter'], ['tomato', 'onion', 'salt'], ['flour', 'egg'], ['onion', 'flour', 'egg'],
+                ['tomato', 'onion']],
+        'RecipeType': ['Main Course', 'Main Course', 'Dessert', 'Main Course', 'Main Course'],
+        'AggregatedRating': [4.0, 5.0, 5.0, None, 3.0],
+        'ReviewCount': [10, 100, 50, 0, 1],
+    })
+    dict_columns = {'ingredients': 'NER', 'recipe_types': 'RecipeType'}
+    rows, match, score = fridge_match(df, ['onion', 'tomato'], {'recipe_type': 'Main Course'}, dict_columns)
+    assert list(rows) == [0, 1, 3, 4]  # recipes without a fridge ingredient are left out
+    assert list(np.round(match * 100)) == [50, 67, 33, 100]  # share of the ingredients of the recipe in the fridge
+    assert ((score >= 0) & (score <= 1)).all()
+
+
+def test_paginator():
+    df = pd.DataFrame({'A': range(20), 'B': np.arange(20) % 4})
+    rows = np.arange(0, 20, 2)  # 10 rows of the result
+    paginator = Paginator(df, rows)
+    paginator.page_size = 3
+    assert len(paginator) == 10 and paginator.n_pages == 4  # the last page is partial
+    assert [list(paginator.page(page)['A']) for page in (1, 4)] == [[0, 2, 4], [18]]
+    assert paginator.page(5).empty
+    assert list(paginator.page(2, columns=['B']).columns) == ['B']  # only the requested columns are read
+    assert Paginator(df, np.array([], dtype=int)).n_pages == 1
+
+    scores = np.array([1, 3, np.nan, 3, 2, 0, 3, 1, 2, 0], dtype=float)
+    ranked = Paginator(df, rows, scores, {'%': np.arange(10) * 10})
+    ranked.page_size = 3
+    expected = rows[np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind='stable')]  # full sort
+    pages = [list(ranked.page(page)['A']) for page in range(1, ranked.n_pages + 1)]
+    assert sum(pages, []) == list(expected)
+    assert list(ranked.page(1)['%']) == [10, 30, 60]  # the extra columns follow the rows
+
+    # a cursor stays on the same row when the page size or the result change
+    cursor = ranked.cursor(3)
+    assert cursor == 14 and ranked.page_of(cursor) == 3
+    ranked.page_size = 2
+    assert ranked.page_of(cursor) == 4 and ranked.page(4)['A'].iloc[0] == 14
+    restricted = ranked.restrict([2, 14, 18])
+    assert list(restricted.page(1)['A']) == [2, 14] and restricted.page_of(cursor) == 1
+    assert len(ranked) == 10 and restricted.page_of(4) == 1  # not in the result
+
+
+def test_result_pages():
+    df = pd.DataFrame({
+        'title': ['Onion Soup', 'Tomato Salad', 'Cake', 'Onion Tart', 'Tomato Soup'],
+        'NER': [['onion', 'butter'], ['tomato', 'onion', 'salt'], ['flour', 'egg'], ['onion', 'flour', 'egg'],
+                ['tomato', 'onion']],
+        'RecipeType': ['Main Course', 'Main Course', 'Dessert', 'Main Course', 'Main Course'],
+        'AggregatedRating': [4.0, 5.0, 5.0, None, 3.0],
+        'ReviewCount': [10, 100, 50, 0, 1],
+    })
+    dict_columns = {'ingredients': 'NER', 'recipe_types': 'RecipeType'}
+    index = RecipeIndex(df, dict_columns)
+    filters = {'recipe_type': 'Main Course'}
+    ranked = result_pages(df, filters, ['onion', 'tomato'], dict_columns, index)
+    ranked.page_size = 3
+    assert len(ranked) == 4 and ranked.n_pages == 2
+    pages = [list(ranked.page(page)['title']) for page in (1, 2)]
+    assert pages == [['Tomato Soup', 'Tomato Salad', 'Onion Soup'], ['Onion Tart']]  # by match, then rating and reviews
+    assert list(ranked.page(1)['%']) == [100, 67, 50]
+    assert ranked.page(3).empty
+
+    rated = result_pages(df, filters, [], dict_columns, index)
+    assert list(rated.page(1)['title']) == ['Tomato Salad', 'Onion Soup', 'Tomato Soup', 'Onion Tart']
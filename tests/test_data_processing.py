@@ -1,10 +1,36 @@
+import hashlib
+import json
 import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
 from pathlib import Path
 import yaml
+from src.application.recipe_finder_functions import load_recipes
 from src.preprocessing.load import *
 from src.preprocessing.format import *
 from src.preprocessing.filter import *
+from src.preprocessing import keys, load
+from src.preprocessing.checkpoint import imported_modules, source_version
+from src.preprocessing.dataset_creation import build_dataset, parse_args
+from src.preprocessing.download_cache import CachedHTTPFileSystem
+from src.preprocessing.durations import parse_durations
+from src.preprocessing.keyword_matcher import KeywordMatcher
+from src.preprocessing import pipeline
+from src.preprocessing.incremental import read_state, write_state
+from src.preprocessing.profiling import Profiler, profile
+from src.preprocessing.pipeline import ingest_delta, process, run_pipeline, sample_rows
+from src.preprocessing.schema import (NUTRITION_COLUMNS, OUTPUT_SCHEMA, memory_report, output_exists, read_output,
+                                      write_output)
+from src.preprocessing.singularizer import Singularizer
 
 
 # Get the absolute path to the project root
@@ -35,6 +61,32 @@ def test_format_duration():
     assert format_duration('PT45M') == '45 min'
     assert format_duration('PT2H') == '2 h'
 
+def test_text_formating():
+    df = pd.DataFrame({
+        'ingredients': ['["1 cup flour", "2 eggs"]', "['salt', None]", 'sugar', '["1\\/2 cup milk"]'],
+        'directions': ['["Mix. Bake", "Serve."]', '["Boil."]', None, "['Stir']"],
+    })
+    before = FALLBACK_CELLS.copy()
+    text_formating(df, ['ingredients', 'directions'])
+    assert df['ingredients'].tolist()[:3] == [['1 cup flour', '2 eggs'], ['salt', np.nan], ['sugar']]
+    assert df['ingredients'].iloc[3] == ['1\\/2 cup milk']  # read as ast.literal_eval does
+    assert df['directions'].iloc[0] == ['Mix.', 'Bake Serve.']
+    assert df['directions'].iloc[3] == ['Stir.'] and pd.isna(df['directions'].iloc[2])
+    fallbacks = FALLBACK_CELLS - before
+    assert fallbacks == {'ingredients': 2, 'directions': 1}  # cells that are not valid JSON are counted
+
+
+def test_parse_durations():
+    durations = pd.Series(['PT1H30M', 'PT45M', 'PT2H', 'PT0M', 'PT0S', 'P1DT05H'], index=[4, 2, 0, 1, 3, 5])
+    result = parse_durations(durations)
+    assert result['minutes'].tolist() == [iso_to_minutes(x) for x in durations]
+    assert result['text'].tolist() == [format_duration(x) for x in durations]
+    assert result['minutes'].dtype == 'int32'
+    assert list(result.index) == [4, 2, 0, 1, 3, 5]
+    with pytest.raises(pa.ArrowInvalid):  # corrupt durations are not wrapped to negative minutes
+        parse_durations(pd.Series(['PT99999999H']))
+
+
 def test_assign_category():
     row = pd.Series({
         'RecipeCategory': 'Tarts',
@@ -50,19 +102,472 @@ def test_assign_category():
     })
     assert assign_category(row) == 'Main Course'
 
+def test_assign_categories():
+    df = pd.DataFrame({
+        'RecipeCategory': ['Tarts', 'Chicken', None, 'Drinks', 'Pie'],
+        'Keywords': [['#Dessert', '#Lemon'], ['#Meat'], ['#Breakfast', None], ['#Easy'], []],
+        'title': ['Lemon Tart', 'Biryani', 'Pancakes', 'Iced Coffee', 'Apple Pie']
+    })
+    result = assign_categories(df)
+    assert result.tolist() == ['Dessert', 'Main Course', 'Breakfast', 'Beverages', 'Other']
+    assert result.equals(df.apply(assign_category, axis=1))  # same labels as the row-wise function
+
+
 def test_to_singular():
     assert to_singular(['apples', 'bananas', 'berries']) == ['apple', 'banana', 'berry']
 
+def test_singularizer(tmp_path):
+    path = tmp_path / 'singular_nouns.json'
+    singularizer = Singularizer(path, maxsize=2)
+    assert [singularizer.singular(x) for x in ['apples', 'bananas', 'berries']] == ['apple', 'banana', 'berry']
+    assert list(singularizer.cache) == ['bananas', 'berries']  # least recently used word evicted
+    singularizer.save()
+    reloaded = Singularizer(path)
+    assert reloaded.cache == {'bananas': 'banana', 'berries': 'berry'}  # learned map persisted
+    assert reloaded.singular('berries') == 'berry' and reloaded._engine is None  # no inflect call
+
+
 def test_is_non_vegetarian():
     assert is_non_vegetarian(['chicken', 'broccoli', 'potato']) == True
     assert is_non_vegetarian(['carrot', 'onion', 'tomato', 'egg']) == False
 
+def test_keyword_matcher():
+    matcher = KeywordMatcher(['ham', 'hamburger', 'cod', 'game'])
+    assert matcher.search('smoked ham hock')
+    assert matcher.search('gamey meat')  # keywords are matched as substrings
+    assert not matcher.search('carrot')
+    ingredients = pd.Series([['Cod fillets', 'salt'], ['carrot', 'onion'], [], ['egg', 'Hamburger bun']])
+    assert matcher.any_in_lists(ingredients).tolist() == [True, False, False, True]
+    assert (~NON_VEG_MATCHER.any_in_lists(ingredients)).tolist() == [
+        not is_non_vegetarian(x) for x in ingredients
+        ]
+
+
 def test_find_world_cuisine():
     assert find_world_cuisine(['Vegetable', 'Mexican', '< 30 Mins']) == 'Mexican'
     assert find_world_cuisine(['Asian', 'Spicy', 'Indian']) == 'Asian'
     assert find_world_cuisine(['Bevrages', 'Fruit', 'Healthy']) == 'Unknown'
 
 
+def test_lazy_imports():
+    code = ("import sys, src.preprocessing.load, src.application.query_helpers\n"
+            "print(sorted({'inflect', 'spellchecker', 'yaml'} & set(sys.modules)))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    assert result.stdout.strip() == '[]'  # nothing heavy is imported or read before it is used
+    assert load.keep_col_nutrition == config['nutrition_data']['keep_col']  # config read on access
+
+
+### Tests for loading functions ###
+def write_raw_data(folder):
+    """Write small raw nutrition and measurements data sets in folder and return their paths"""
+    names = ['Lemon Tart', 'Chicken Soup', 'Banana Bread', 'Iced Coffee', 'Beef Stew']
+    nutrition = pd.DataFrame({
+        'Name': names + ['Lemon Tart', 'Banana Bread'],
+        'AuthorName': ['Ann', 'Bob', 'Cid', 'Dan', 'Eve', 'Ann', 'Cid'],
+        'CookTime': ['PT30M', None, 'PT1H', 'PT0M', 'PT2H', 'PT30M', 'PT1H'],
+        'PrepTime': ['PT15M', 'PT10M', 'PT20M', 'PT5M', 'PT30M', 'PT15M', 'PT20M'],
+        'TotalTime': ['PT45M', 'PT10M', 'PT1H20M', 'PT5M', 'PT2H30M', 'PT45M', 'PT1H20M'],
+        'Description': ['desc'] * 7,
+        'Images': [['https://img/1.jpg']] * 7,
+        'RecipeCategory': ['Tarts', 'Chicken', 'Breads', 'Beverages', 'Stew', 'Tarts', 'Breads'],
+        'Keywords': [['Dessert', 'Easy'], ['Meat', 'Asian'], ['Breakfast'], ['Easy'], ['Meat'], ['Dessert'],
+                     ['Breakfast']],
+        'AggregatedRating': [4.5, 4.0, 5.0, 3.5, 4.0, 4.5, 5.0],
+        'ReviewCount': [10.0, 3.0, 7.0, 1.0, 2.0, 10.0, 7.0],
+        'Calories': [300.0, 200.0, 2000.0, 50.0, 600.0, 300.0, 250.0],
+        'FatContent': [10.0] * 7, 'SaturatedFatContent': [5.0] * 7, 'CholesterolContent': [1.0] * 7,
+        'SodiumContent': [2.0] * 7, 'CarbohydrateContent': [30.0] * 7, 'FiberContent': [1.0] * 7,
+        'SugarContent': [12.0] * 7, 'ProteinContent': [8.0] * 7,
+        'RecipeServings': [8.0, 4.0, 10.0, 1.0, 6.0, 8.0, 10.0],
+        'RecipeInstructions': [[f'Mix {name.lower()}. Bake it.'] for name in names]
+                              + [['Mix it.'], ['Mix banana bread. Bake it.']],
+    })
+    measurements = pd.DataFrame({
+        'title': names + ['Lemon Tart', 'Apple Pie', 'Chicken Soup'],
+        'ingredients': ['["lemons", "eggs"]', '["chicken", "onions"]', '["bananas", "flour"]',
+                        '["coffee", "ice"]', "['beef', 'carrots']", '["lemons", "eggs"]',
+                        '["apples"]', '["chicken", "leeks"]'],
+        'directions': [f'["Mix {name.lower()}.", "Bake it."]' for name in names]
+                      + ['["Mix lemon tart.", "Bake it."]', '["Peel."]', '["Boil the chicken."]'],
+        'link': [f'www.recipes.com/{i}' for i in range(8)],
+        'NER': ['["lemons", "eggs"]', '["chicken", "onions"]', '["bananas", "flour"]',
+                '["coffee", "ice"]', '["beef", "carrots"]', '["lemons", "eggs"]',
+                '["apples"]', '["chicken", "leeks"]'],
+    })
+    nutrition_path = os.path.join(folder, 'recipes.parquet')
+    measurements_path = os.path.join(folder, 'recipes_data.parquet')
+    nutrition.to_parquet(nutrition_path, row_group_size=2)
+    measurements.to_parquet(measurements_path, row_group_size=3)
+    return nutrition_path, measurements_path
+
+
+def test_load_nutrition_data(tmp_path):
+    nutrition_path, _ = write_raw_data(tmp_path)
+    df, recipe_name = load_nutrition_data(nutrition_path)
+    expected = pd.read_parquet(nutrition_path, columns=keep_col_nutrition)
+    expected = rm_outliers(expected.drop_duplicates(subset=['Name', 'AuthorName']))
+    text_formating(expected, to_format_nutrition)
+    expected = handle_na(expected, numeric_float_var_nutrition, numeric_int_var_nutrition, list_var_nutrition)
+    pd.testing.assert_frame_equal(df, expected)  # pushed down filter keeps the same rows
+    assert 'Banana Bread' not in recipe_name  # the first Banana Bread by Cid is an outlier
+
+
+def test_merge_streaming(tmp_path):
+    nutrition_path, measurements_path = write_raw_data(tmp_path)
+    merged = merge(nutrition_path, measurements_path)
+    assert sorted(merged['title']) == ['Beef Stew', 'Iced Coffee', 'Lemon Tart']
+    for batch_size in [1, 2, 100]:
+        streamed = merge(nutrition_path, measurements_path, batch_size=batch_size)
+        pd.testing.assert_frame_equal(streamed, merged)  # streaming gives the same output
+
+
+def test_stream_measurements_collisions(tmp_path, monkeypatch):
+    _, measurements_path = write_raw_data(tmp_path)
+    measurements = pd.read_parquet(measurements_path)
+    pd.concat([measurements, measurements]).to_parquet(measurements_path)  # every row is duplicated
+    titles = measurements['title'].tolist()
+    expected = load_measurements_data(measurements_path, titles)
+    # every key has the same fingerprint
+    monkeypatch.setattr(load, 'fingerprint', lambda df, columns: pd.Series(0, index=df.index, dtype='uint64'))
+    streamed = stream_measurements_data(measurements_path, titles, batch_size=1)
+    assert streamed.index.is_unique
+    pd.testing.assert_frame_equal(streamed, expected.reset_index(drop=True))
+
+
+def test_keys_collisions(monkeypatch):
+    df = pd.DataFrame({'title': ['a', 'b', 'a', None, None, 'b'], 'step': ['x', 'y', 'x', 'z', 'z', 'x']})
+    other = pd.DataFrame({'name': ['b', 'a', 'c'], 'first': ['y', 'x', 'x'], 'link': [1, 2, 3]})
+    expected = pd.merge(df, other, left_on=['title', 'step'], right_on=['name', 'first'], how='inner')
+    for collisions in [False, True]:
+        if collisions:  # every key has the same fingerprint
+            monkeypatch.setattr(keys, 'fingerprint',
+                                lambda df, columns: pd.Series(0, index=df.index, dtype='uint64'))
+        pd.testing.assert_series_equal(keys.duplicated_keys(df, ['title', 'step']),
+                                       df.duplicated(subset=['title', 'step']))
+        merged = keys.merge_on_keys(df, other, df[['title', 'step']], other[['name', 'first']])
+        pd.testing.assert_frame_equal(merged, expected)
+
+
+def test_process_workers(tmp_path):
+    merged = merge(*write_raw_data(tmp_path))
+    merged = pd.concat([merged] * 12, ignore_index=True)  # enough recipes per world cuisine
+    serial = data_filter(data_preprocessing(merged.copy()))
+    assert len(serial) > 0
+    pd.testing.assert_frame_equal(process(merged.copy()), serial)
+    pd.testing.assert_frame_equal(process(merged.copy(), workers=3), serial)  # shards give the same output
+
+
+def singularize_ner(df):
+    """Step of the pipeline singularizing the words of the 'NER' column"""
+    return df.assign(NER=[pipeline.get_singularizer().singular(word) for word in df['NER']])
+
+
+def test_run_shard(tmp_path, monkeypatch):
+    singularizer = Singularizer(tmp_path / 'singular_nouns.json')
+    singularizer.singular('apples')
+    monkeypatch.setattr(pipeline, 'get_singularizer', lambda: singularizer)
+    df, learned, _ = pipeline.run_shard(singularize_ner, pd.DataFrame({'NER': ['apples', 'berries']}))
+    assert df['NER'].tolist() == ['apple', 'berry']
+    assert learned == {'berries': 'berry'}  # only the words learned on the shard
+
+
+def test_run_pipeline_checkpoints(tmp_path, monkeypatch):
+    paths = write_raw_data(tmp_path)
+    first = run_pipeline(*paths, checkpoint_dir=tmp_path / 'checkpoints')
+    assert len(list((tmp_path / 'checkpoints').glob('*.parquet'))) == 3  # one checkpoint per stage
+    monkeypatch.setattr(pipeline, 'merge', lambda *args, **kwargs: pytest.fail('merge should not run'))
+    second = run_pipeline(*paths, checkpoint_dir=tmp_path / 'checkpoints')
+    pd.testing.assert_frame_equal(second, first)  # unchanged keys: every stage is loaded
+
+
+def test_source_version():
+    modules = imported_modules(load)
+    assert {'src.preprocessing.keys', 'src.preprocessing.format', 'src.preprocessing.durations'} <= set(modules)
+    assert source_version(load) == source_version(load, keys)  # the imported helpers are already hashed
+
+
+def test_run_pipeline_checkpoints_state(tmp_path):
+    paths = write_raw_data(tmp_path)
+    for output_path in (tmp_path / 'first.parquet', tmp_path / 'second.parquet'):  # the second one is cached
+        write_output(run_pipeline(*paths, checkpoint_dir=tmp_path / 'checkpoints', dataset_path=output_path),
+                     output_path)
+        counts, rare = read_state(output_path)
+        assert counts.sum() == len(rare) == 3  # rare cuisine
+    nutrition, measurements = (pd.read_parquet(path) for path in paths)
+    pd.concat([nutrition.assign(Name=nutrition['Name'] + f' {i}') for i in range(4)]).to_parquet(
+        tmp_path / 'new_nutrition.parquet')
+    pd.concat([measurements.assign(title=measurements['title'] + f' {i}') for i in range(4)]).to_parquet(
+        tmp_path / 'new_measurements.parquet')
+    df = ingest_delta(tmp_path / 'new_nutrition.parquet', tmp_path / 'new_measurements.parquet',
+                      tmp_path / 'second.parquet')
+    assert len(df) == 15  # with the 3 rare recipes of the cached build
+
+    write_output(df, tmp_path / 'partitioned', partitioned=True)
+    write_state(tmp_path / 'partitioned', *read_state(tmp_path / 'second.parquet'))
+    ingest_delta(*paths, tmp_path / 'partitioned')
+    assert len(read_output(tmp_path / 'partitioned')) == 15 and (tmp_path / 'partitioned').is_dir()  # same layout
+
+
+def test_run_pipeline_profile(tmp_path):
+    paths = write_raw_data(tmp_path)
+    df = run_pipeline(*paths, workers=2, profile_path=tmp_path / 'profile.json')
+    with open(tmp_path / 'profile.json') as file:
+        report = json.load(file)
+    steps = {step['step']: step for step in report['steps']}
+    assert report['workers'] == 2 and report['rows'] == len(df)
+    assert {'merge/load nutrition', 'merge/join', 'preprocess/NER', 'filter/RecipeType'} <= set(steps)
+    assert steps['preprocess/CookTime']['calls'] == 2  # one record per shard
+    assert steps['preprocess']['rows_out'] == steps['filter']['rows_in']
+    assert steps['filter']['rows_out'] == len(df)
+    assert all(step['wall_time_s'] >= 0 and step['cpu_time_s'] >= 0 for step in steps.values())
+
+
+def test_profile_peak_rss():
+    with Profiler() as profiler:
+        with profile('heavy'):
+            data = np.ones(50 * 2**20, dtype=np.uint8)  # 50 MB
+            time.sleep(0.05)  # sampled while the step runs
+            del data
+        with profile('light'):
+            pass
+    steps = {step['step']: step for step in profiler.summary()}
+    # the peak of each step, not of the process so far
+    assert steps['heavy']['peak_rss_mb'] - steps['light']['peak_rss_mb'] > 40
+
+
+def test_build_dataset(tmp_path):
+    nutrition_path, measurements_path = write_raw_data(tmp_path)
+    args = parse_args(['--nutrition', nutrition_path, '--measurements', measurements_path,
+                       '-o', str(tmp_path / 'final'), '--format', 'partitioned', '--sample', '2', '--profile'])
+    assert args.sample == 2 and args.profile is True and args.format == 'partitioned'
+    merged = merge(nutrition_path, measurements_path)
+    sample = sample_rows(merged, 2, seed=1)
+    pd.testing.assert_frame_equal(sample, sample_rows(merged, 2, seed=1))  # reproducible
+    assert len(sample) == 2 and sample.index.is_monotonic_increasing
+    df = build_dataset(tmp_path / 'final.parquet', sample=2, seed=1, profile_path=tmp_path / 'profile.json',
+                       nutrition_data_path=nutrition_path, measurements_data_path=measurements_path)
+    assert set(df['recipe_id']) <= set(sample.index)  # same ids as the full dataset
+    assert json.loads((tmp_path / 'profile.json').read_text())['sample'] == 2
+    assert (tmp_path / 'final.parquet').is_file()
+
+
+def test_ingest_delta(tmp_path):
+    base_paths = write_raw_data(tmp_path)
+    output_path = tmp_path / 'final.parquet'
+    write_output(run_pipeline(*base_paths, dataset_path=output_path), output_path)
+    counts, rare = read_state(output_path)
+    assert len(read_output(output_path)) == 0 and counts.sum() == len(rare) == 3  # rare cuisine
+    base_ids = dict(zip(rare['title'], rare['recipe_id']))
+
+    # new recipes: the same ones under other names, which makes their cuisine frequent enough
+    nutrition, measurements = (pd.read_parquet(path) for path in base_paths)
+    copies = range(4)
+    nutrition = pd.concat([nutrition.assign(Name=nutrition['Name'] + f' {i}') for i in copies])
+    measurements = pd.concat([measurements.assign(title=measurements['title'] + f' {i}') for i in copies])
+    nutrition.to_parquet(tmp_path / 'new_nutrition.parquet')
+    measurements.to_parquet(tmp_path / 'new_measurements.parquet')
+    df = ingest_delta(tmp_path / 'new_nutrition.parquet', tmp_path / 'new_measurements.parquet', output_path)
+    assert len(df) == 15 and df['recipe_id'].is_unique
+    assert dict(zip(df['title'], df['recipe_id'])).items() >= base_ids.items()  # stable ids
+    pd.testing.assert_frame_equal(read_output(output_path), df, check_categorical=False)
+    counts, rare = read_state(output_path)
+    assert counts.to_dict() == {'Unknown': 15} and len(rare) == 0
+
+    # changed recipes replace the current ones and keep their id
+    nutrition = pd.read_parquet(base_paths[0]).assign(Description='new desc')
+    nutrition.to_parquet(tmp_path / 'changed_nutrition.parquet')
+    df = ingest_delta(tmp_path / 'changed_nutrition.parquet', base_paths[1], output_path)
+    assert len(df) == 15 and read_state(output_path)[0].to_dict() == {'Unknown': 15}
+    changed = df[df['recipe_id'].isin(base_ids.values())]
+    assert dict(zip(changed['title'], changed['recipe_id'])) == base_ids
+    assert (changed['Description'] == 'new desc').all()
+
+
+def make_final_df():
+    """Small final dataset, as returned by the pipeline"""
+    return pd.DataFrame({
+        'AuthorName': ['Ann', 'Bob'], 'CookTime': ['30 min', '1 h'], 'PrepTime': ['5 min', '5 min'],
+        'TotalTime': ['35 min', '1 h 5 min'], 'Description': ['desc', 'desc'],
+        'Images': ['https://img/1.jpg', 'https://img/2.jpg'], 'RecipeCategory': ['Tarts', 'Stew'],
+        'Keywords': [['#Easy'], ['#Meat', '#Asian']], 'AggregatedRating': [4.5, np.nan],
+        'ReviewCount': [10, 2], 'RecipeServings': [8, 6], 'title': ['Lemon Tart', 'Beef Stew'],
+        'directions': [['Mix.', 'Bake.'], ['Boil.']], 'ingredients': [['lemons'], ['beef', np.nan]],
+        'link': ['www.a.com', 'www.b.com'], 'NER': [['lemon'], ['beef']], 'CookTime_minutes': [30, 60],
+        'PrepTime_minutes': [5, 5], 'TotalTime_minutes': [35, 65], 'recipe_id': [0, 4],
+        'TotalTime_cat': ['< 1h', '> 1h'], 'RecipeType': ['Dessert', 'Main Course'],
+        'Beginner_Friendly': [True, False], 'Vegetarian_Friendly': [True, False],
+        'World_Cuisine': ['Unknown', 'Asian'],
+        **{col: [10.0, 20.5] for col in NUTRITION_COLUMNS},
+    })[[field.name for field in OUTPUT_SCHEMA]]
+
+
+def test_write_output(tmp_path):
+    df = make_final_df()
+    write_output(df, tmp_path / 'final_df.parquet')
+    output = read_output(tmp_path / 'final_df.parquet')
+    assert list(output.columns) == list(df.columns)
+    assert output['RecipeType'].dtype == 'category' and output['Calories'].dtype == 'float32'
+    assert output['RecipeServings'].dtype == 'int16'
+    assert output['ingredients'].tolist() == [['lemons'], ['beef', None]]  # arrow lists
+    assert output['AggregatedRating'].isna().tolist() == [False, True]
+    assert output['World_Cuisine'].astype(str).tolist() == ['Unknown', 'Asian']
+    report = memory_report(df, output)
+    assert list(report.index) == list(df.columns) + ['total']
+    assert list(report.columns) == ['before_mb', 'after_mb', 'ratio']
+
+
+def test_write_output_partitioned(tmp_path):
+    df = make_final_df()
+    write_output(df, tmp_path / 'final_df', partitioned=True)
+    assert sorted(os.listdir(tmp_path / 'final_df')) == ['RecipeType=Dessert', 'RecipeType=Main%20Course']
+    output = read_output(tmp_path / 'final_df')
+    assert list(output.columns) == list(df.columns)
+    assert sorted(output['recipe_id']) == [0, 4]
+    assert output['RecipeType'].astype(str).tolist() == ['Dessert', 'Main Course']
+    desserts = read_output(tmp_path / 'final_df', ds.field('RecipeType') == 'Dessert')
+    assert desserts['title'].tolist() == ['Lemon Tart']
+    assert read_output(tmp_path / 'final_df', ds.field('TotalTime_minutes') > 60)['title'].tolist() == ['Beef Stew']
+
+
+def test_output_exists(tmp_path):
+    assert not output_exists(tmp_path / 'final_df') and not output_exists(tmp_path)  # missing, or an empty folder
+    write_output(make_final_df(), tmp_path / 'final_df.parquet')
+    write_output(make_final_df(), tmp_path / 'final_df', partitioned=True)
+    assert output_exists(tmp_path / 'final_df.parquet') and output_exists(tmp_path / 'final_df')
+    df, index = load_recipes(tmp_path / 'final_df')  # as the pages open it
+    assert sorted(df['recipe_id']) == [0, 4] and 'beef' in index.ingredients
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Stand-in for the MinIO bucket: serves the files of `server.folder` with ETags and ranges"""
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        path = os.path.join(self.server.folder, self.path.lstrip('/'))
+        with open(path, 'rb') as file:
+            content = file.read()
+        etag = '"%s"' % hashlib.md5(content).hexdigest()
+        self.server.requests.append((self.command, self.headers.get('Range')))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('Range') or '')
+        if match and self.headers.get('If-Range', etag) == etag:
+            start, end = int(match[1]), int(match[2]) + 1
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{len(content)}')
+            content = content[start:end]
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class ChunkedRequestHandler(BaseHTTPRequestHandler):
+    """Server without range requests that sends its files in chunks, without their size"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        with open(os.path.join(self.server.folder, self.path.lstrip('/')), 'rb') as file:
+            content = file.read()
+        self.server.requests.append((self.command, self.headers.get('Range')))
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        if send_body:
+            for start in range(0, len(content), 1000):
+                chunk = content[start:start + 1000]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(tmp_path, handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.folder, server.requests = tmp_path, []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    yield from serve(tmp_path, RangeRequestHandler)
+
+
+@pytest.fixture
+def chunked_server(tmp_path):
+    yield from serve(tmp_path, ChunkedRequestHandler)
+
+
+def test_download_cache(tmp_path, http_server, monkeypatch):
+    nutrition_path, _ = write_raw_data(tmp_path)
+    url = f'http://127.0.0.1:{http_server.server_port}/recipes.parquet'
+    cache = CachedHTTPFileSystem(tmp_path / 'cache', block_size=512, revalidate_after=0)
+    monkeypatch.setattr(load, 'get_download_cache', lambda: cache)
+
+    # a file larger than the footer read by pyarrow, with a column that is not read
+    wide_path = tmp_path / 'wide.parquet'
+    rng = np.random.default_rng(0)
+    pd.DataFrame({
+        'Name': [f'recipe {i}' for i in range(2000)],
+        'Text': [rng.bytes(100).hex() for _ in range(2000)],
+    }).to_parquet(wide_path, row_group_size=500)
+    wide_url = f'http://127.0.0.1:{http_server.server_port}/wide.parquet'
+    names = load.open_dataset(wide_url).to_table(columns=['Name']).to_pandas()
+    pd.testing.assert_frame_equal(names, pd.read_parquet(wide_path, columns=['Name']))
+    ranges = [match for method, match in http_server.requests if method == 'GET']
+    assert ranges and all(ranges)  # only range requests
+    fetched = sum(int(end) - int(start) + 1 for start, end in
+                  (re.findall(r'\d+', match) for match in ranges))
+    assert fetched < os.path.getsize(wide_path) / 2  # the 'Text' column is not downloaded
+
+    expected, _ = load_nutrition_data(nutrition_path)
+    df, _ = load_nutrition_data(url)
+    pd.testing.assert_frame_equal(df, expected)
+    http_server.requests.clear()
+    df, _ = load_nutrition_data(url)  # unchanged file: revalidated, read from the cache
+    pd.testing.assert_frame_equal(df, expected)
+    assert {method for method, _ in http_server.requests} == {'HEAD'}
+
+    pd.read_parquet(nutrition_path).iloc[::-1].to_parquet(nutrition_path)  # new version
+    expected, _ = load_nutrition_data(nutrition_path)
+    df, _ = load_nutrition_data(url)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_download_cache_chunked(tmp_path, chunked_server):
+    nutrition_path, _ = write_raw_data(tmp_path)
+    url = f'http://127.0.0.1:{chunked_server.server_port}/recipes.parquet'
+    cache = CachedHTTPFileSystem(tmp_path / 'cache', block_size=512, revalidate_after=60)
+    assert cache.info(url)['size'] == os.path.getsize(nutrition_path)  # the size of what was downloaded
+    with cache.open(url) as file:
+        assert file.read() == Path(nutrition_path).read_bytes()
+    assert [method for method, _ in chunked_server.requests] == ['HEAD', 'GET']  # downloaded once
+
+
 ### Test main function ###
 def test_main():
     # Setup test file paths